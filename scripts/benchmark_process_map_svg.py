@@ -0,0 +1,305 @@
+"""
+Benchmark for process_map_svg.py on synthetic maps.
+
+Generates an Inkscape-style SVG with the same layer structure as the real map
+(Settlements/<faction>/<province>/..., Points of Interest, Region labels, Water
+Labels, Roads) plus matching gazetteer CSVs, runs every SVGMapProcessor stage
+on them and records the per-stage measurements as JSON. Nothing is downloaded
+and the private map is not needed, so it can run in CI.
+
+Usage:
+    python scripts/benchmark_process_map_svg.py --settlements 10000 100000
+    python scripts/benchmark_process_map_svg.py --settlements 1000000 --depth 12 --road-points 2000
+    python scripts/benchmark_process_map_svg.py --compare logs/benchmarks/old.json
+"""
+
+import argparse
+import csv
+import json
+import logging
+import random
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from instrumentation import Instrumentation
+from process_map_svg import (LOGS_DIR, OUTPUT_STAGES, POI_TYPES, PROVINCE_LABEL_TYPES,
+                             WATERBODY_TYPES, run_pipeline)
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = LOGS_DIR / "benchmarks"
+FACTIONS_TOML = """[[faction]]
+layer = "Empire"
+gazetteer = "empire.csv"
+output = "empire_settlements.geojson"
+provinces_from_layers = true
+province_column = "Province_2515"
+
+[[faction]]
+layer = "Westerland"
+gazetteer = "westerland.csv"
+output = "westerland_settlements.geojson"
+"""
+
+GAZETTEER_COLUMNS = [
+    "Settlement", "Population", "Estate", "Trade", "Tags", "Notes", "Coordinates",
+    "Province_2515", "Province_2512", "Province_2276", "Ruler_2515", "Ruler_2512", "Ruler_2276",
+    "wiki_url", "wiki_title", "wiki_description", "wiki_image",
+]
+
+_SYLLABLES = ["alt", "berg", "dorf", "hof", "wald", "stein", "bad", "heim", "burg", "au",
+              "nuln", "reik", "grau", "hoch", "tal", "brunn", "furt", "kirch", "lin", "mark"]
+_SVG_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<svg xmlns="http://www.w3.org/2000/svg"'
+               ' xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"'
+               ' xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"'
+               ' width="1200" height="1000">\n')
+
+
+def settlement_name(rng: random.Random, index: int) -> str:
+    """A German-sounding, unique settlement name."""
+    word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3)))
+    return f"{word.capitalize()} {index}"
+
+
+def _text(f, name: str, x: float, y: float):
+    """Write an Inkscape text element with one line tspan."""
+    f.write(f'<text x="{x:.3f}" y="{y:.3f}"><tspan sodipodi:role="line" x="{x:.3f}" y="{y:.3f}">'
+            f'{name}</tspan></text>\n')
+
+
+def _nested_texts(f, entries: List[tuple], depth: int, label: str):
+    """Spread text elements over `depth` nested, translated sub-layers."""
+    per_level = max(1, -(-len(entries) // depth))
+    opened = 0
+    for level in range(depth):
+        chunk = entries[level * per_level:(level + 1) * per_level]
+        if not chunk and level:
+            break
+        if level:
+            f.write(f'<g inkscape:label="{label} {level}" transform="translate(0.25,-0.25)">\n')
+            opened += 1
+        for name, x, y in chunk:
+            # Compensate the accumulated group translation so points stay on the map
+            _text(f, name, x - 0.25 * level, y + 0.25 * level)
+    f.write("</g>\n" * opened)
+
+
+def generate_dataset(directory: Path, settlements: int, provinces: int = 16, depth: int = 4,
+                     roads: int = 100, road_points: int = 200, missing_rate: float = 0.05,
+                     seed: int = 0) -> Dict[str, Path]:
+    """
+    Write a synthetic map SVG, gazetteers and faction config.
+
+    Args:
+        directory: Target directory
+        settlements: Number of settlement labels (90% Empire, 10% Westerland)
+        provinces: Number of Empire provinces
+        depth: Nesting depth of the sub-layers inside each province
+        roads: Number of road paths
+        road_points: Segments per road path
+        missing_rate: Share of settlements left out of the gazetteers
+        seed: Random seed; the same arguments always give the same files
+
+    Returns:
+        Paths to pass to SVGMapProcessor
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    input_dir = directory / "input"
+    input_dir.mkdir(exist_ok=True)
+
+    empire_count = settlements - settlements // 10
+    province_names = [f"Province {i}" for i in range(provinces)]
+    empire = {province: [] for province in province_names}
+    westerland = []
+    for index in range(settlements):
+        entry = (settlement_name(rng, index), rng.uniform(50, 1150), rng.uniform(50, 950))
+        if index < empire_count:
+            empire[province_names[index % provinces]].append(entry)
+        else:
+            westerland.append(entry)
+
+    svg_path = directory / "map.svg"
+    with open(svg_path, 'w', encoding='utf-8') as f:
+        f.write(_SVG_HEADER)
+
+        f.write('<g inkscape:label="Settlements">\n<g inkscape:label="Empire">\n')
+        for province in province_names:
+            f.write(f'<g inkscape:label="{province}">\n')
+            _nested_texts(f, empire[province], depth, "Estates")
+            f.write('</g>\n')
+        f.write('</g>\n<g inkscape:label="Westerland">\n')
+        _nested_texts(f, westerland, depth, "Quarter")
+        f.write('</g>\n</g>\n')
+
+        f.write('<g inkscape:label="Points of Interest">\n')
+        for poi_index, poi_type in enumerate(POI_TYPES):
+            f.write(f'<g inkscape:label="{poi_type}">\n')
+            for i in range(max(1, settlements // 20 // len(POI_TYPES))):
+                _text(f, f"{poi_type} {poi_index}-{i}", rng.uniform(50, 1150), rng.uniform(50, 950))
+            f.write('</g>\n')
+        f.write('</g>\n')
+
+        f.write('<g inkscape:label="Region-Labels-post2512">\n')
+        for layer in PROVINCE_LABEL_TYPES:
+            f.write(f'<g inkscape:label="{layer}">\n')
+            for province in province_names:
+                _text(f, province, rng.uniform(50, 1150), rng.uniform(50, 950))
+            f.write('</g>\n')
+        f.write('</g>\n')
+
+        f.write('<g inkscape:label="Water Labels">\n')
+        for layer in WATERBODY_TYPES:
+            f.write(f'<g inkscape:label="{layer}">\n')
+            for i in range(max(1, settlements // 1000)):
+                _text(f, f"{layer} {i}", rng.uniform(50, 1150), rng.uniform(50, 950))
+            f.write('</g>\n')
+        f.write('</g>\n')
+
+        f.write('<g inkscape:label="Roads">\n<g inkscape:label="Roads">\n')
+        for _ in range(roads):
+            x, y = rng.uniform(100, 1100), rng.uniform(100, 900)
+            segments = [f"M {x:.3f},{y:.3f}"]
+            for i in range(road_points):
+                if i % 4 == 3:
+                    segments.append(f"c 1,1 2,-1 {rng.uniform(-3, 3):.3f},{rng.uniform(-3, 3):.3f}")
+                else:
+                    segments.append(f"l {rng.uniform(-3, 3):.3f},{rng.uniform(-3, 3):.3f}")
+            f.write(f'<path d="{" ".join(segments)}"/>\n')
+        f.write('</g>\n</g>\n')
+
+        f.write('</svg>\n')
+
+    def write_gazetteer(path: Path, rows: List[tuple]):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=GAZETTEER_COLUMNS)
+            writer.writeheader()
+            for name, province in rows:
+                if rng.random() < missing_rate:
+                    continue
+                writer.writerow({
+                    "Settlement": name,
+                    "Population": int(rng.lognormvariate(6.0, 1.2)),
+                    "Tags": '"source:TOW;type:village"',
+                    "Trade": "wine;timber" if rng.random() < 0.2 else "",
+                    "Province_2515": province,
+                })
+
+    write_gazetteer(input_dir / "empire.csv",
+                    [(name, province) for province, entries in empire.items() for name, _, _ in entries])
+    write_gazetteer(input_dir / "westerland.csv", [(name, "Westerland") for name, _, _ in westerland])
+
+    factions_config = directory / "factions.toml"
+    factions_config.write_text(FACTIONS_TOML, encoding='utf-8')
+
+    output_dir = directory / "output"
+    logs_dir = directory / "logs"
+    output_dir.mkdir(exist_ok=True)
+    logs_dir.mkdir(exist_ok=True)
+
+    return {
+        "svg_path": svg_path,
+        "input_dir": input_dir,
+        "output_dir": output_dir,
+        "logs_dir": logs_dir,
+        "factions_config": factions_config,
+    }
+
+
+def run_benchmark(settlements: int, directory: Path, trace_memory: bool = False, jobs: int = 1,
+                  **dataset_options) -> Dict:
+    """
+    Generate a dataset and time every processing stage on it.
+
+    Args:
+        settlements: Number of settlements in the synthetic map
+        directory: Working directory for the generated files
+        trace_memory: Record peak Python allocations per stage
+        jobs: Output stages to run concurrently
+        **dataset_options: Passed to generate_dataset()
+
+    Returns:
+        Parameters, SVG size and per-stage measurements of the run
+    """
+    paths = generate_dataset(directory, settlements, **dataset_options)
+    instrumentation = Instrumentation(trace_memory=trace_memory)
+    run_pipeline(instrumentation, processor_kwargs=paths, targets=OUTPUT_STAGES, jobs=jobs)
+
+    result = instrumentation.to_dict()
+    result["parameters"] = {"settlements": settlements, "jobs": jobs, **dataset_options}
+    result["svg_bytes"] = paths["svg_path"].stat().st_size
+    return result
+
+
+def compare(previous: Dict, current: Dict) -> List[str]:
+    """Wall time ratios current/previous per scale and stage."""
+    def index(results):
+        return {(run["parameters"]["settlements"], stage["name"]): stage["wall_seconds"]
+                for run in results["runs"] for stage in run["stages"]}
+
+    old, new = index(previous), index(current)
+    lines = [f"{'Settlements':>11s} {'Stage':26s} {'Before (s)':>10s} {'After (s)':>10s} {'Ratio':>7s}"]
+    for key in sorted(new):
+        if key in old and old[key] > 0:
+            settlements, stage = key
+            lines.append(f"{settlements:11,d} {stage:26s} {old[key]:10.3f} {new[key]:10.3f} {new[key] / old[key]:7.2f}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark process_map_svg.py on synthetic maps.")
+    parser.add_argument("--settlements", type=int, nargs="+", default=[10000],
+                        help="Number of settlements per run (one run per value)")
+    parser.add_argument("--provinces", type=int, default=16, help="Empire provinces")
+    parser.add_argument("--depth", type=int, default=4, help="Sub-layer nesting depth inside each province")
+    parser.add_argument("--roads", type=int, default=100, help="Number of road paths")
+    parser.add_argument("--road-points", type=int, default=200, help="Segments per road path")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--jobs", type=int, default=1, help="Output stages to run concurrently")
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak Python allocations (slower)")
+    parser.add_argument("--output", type=Path, help="Results JSON (default: logs/benchmarks/<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, metavar="JSON", help="Earlier results to compare against")
+    parser.add_argument("--workdir", type=Path, help="Keep the generated files in this directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the processor's own log output")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger("process_map_svg").setLevel(logging.ERROR)
+
+    created = datetime.now(timezone.utc)
+    results = {"benchmark": "process_map_svg", "created": created.isoformat(timespec="seconds"), "runs": []}
+    dataset_options = {"provinces": args.provinces, "depth": args.depth, "roads": args.roads,
+                       "road_points": args.road_points, "seed": args.seed}
+
+    with tempfile.TemporaryDirectory(prefix="owa-benchmark-") as tmp:
+        for settlements in args.settlements:
+            directory = (args.workdir or Path(tmp)) / f"settlements-{settlements}"
+            logger.info(f"Benchmarking {settlements:,d} settlements...")
+            run = run_benchmark(settlements, directory, trace_memory=args.trace_memory, jobs=args.jobs,
+                                **dataset_options)
+            results["runs"].append(run)
+            for stage in run["stages"]:
+                logger.info(f"  {stage['name']:26s} {stage['wall_seconds']:8.3f} s")
+
+    output = args.output or BENCHMARK_DIR / f"process_map_svg_{created.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        for line in compare(previous, results):
+            logger.info(line)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Startup-time benchmark for process_map_svg.py.
+
+Runs short commands in fresh interpreters and records their wall time and
+whether NumPy was imported. Commands that never place coordinates (importing
+the module, --help, --list-stages, reading a gazetteer) should start in
+milliseconds without loading NumPy; a report-only run has to extract the
+settlements and is included for comparison.
+
+Usage:
+    python scripts/benchmark_startup.py
+    python scripts/benchmark_startup.py --repeat 20 --output logs/benchmarks/startup.json
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmark_process_map_svg import BENCHMARK_DIR, generate_dataset
+
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = Path(__file__).parent
+PROCESS_MAP_SVG = SCRIPTS_DIR / "process_map_svg.py"
+
+# Reads one faction's gazetteer through the processor, without extracting any layer
+_GAZETTEER_SNIPPET = """
+import sys
+from process_map_svg import SVGMapProcessor
+paths = dict(zip(("svg_path", "input_dir", "factions_config"), sys.argv[1:]))
+SVGMapProcessor(**paths).load_csv_data("Empire")
+"""
+
+
+def startup_cases(directory: Path) -> Dict[str, List[str]]:
+    """Command-line arguments (after the interpreter) of every case, using a small map in directory."""
+    paths = generate_dataset(directory, 200, provinces=4, roads=2, road_points=8)
+    return {
+        "import": ["-c", "import process_map_svg"],
+        "help": [str(PROCESS_MAP_SVG), "--help"],
+        "list_stages": [str(PROCESS_MAP_SVG), "--list-stages"],
+        "gazetteer": ["-c", _GAZETTEER_SNIPPET, str(paths["svg_path"]), str(paths["input_dir"]),
+                      str(paths["factions_config"])],
+        "report": [str(PROCESS_MAP_SVG), "--svg", str(paths["svg_path"]), "--input", str(paths["input_dir"]),
+                   "--out", str(paths["output_dir"]), "--logs", str(paths["logs_dir"]), "--only", "report"],
+    }
+
+
+def imported_modules(args: List[str]) -> List[str]:
+    """Top-level modules imported by a command, from -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=SCRIPTS_DIR,
+                            capture_output=True, text=True, check=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            modules.add(name.split(".")[0])
+    return sorted(modules)
+
+
+def time_command(args: List[str], repeat: int) -> List[float]:
+    """Wall seconds of `repeat` runs of a command in fresh interpreters."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=SCRIPTS_DIR, capture_output=True, check=True)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_startup_benchmark(directory: Path, repeat: int = 5) -> List[Dict]:
+    """
+    Time every startup case.
+
+    Args:
+        directory: Working directory for the generated map
+        repeat: Runs per case (the median is reported)
+
+    Returns:
+        One result per case: name, median and minimum seconds, NumPy/SciPy loaded
+    """
+    baseline = statistics.median(time_command(["-c", "pass"], repeat))
+    results = []
+    for name, args in startup_cases(directory).items():
+        timings = time_command(args, repeat)
+        modules = imported_modules(args)
+        results.append({
+            "name": name,
+            "median_seconds": statistics.median(timings),
+            "min_seconds": min(timings),
+            "over_bare_interpreter_seconds": statistics.median(timings) - baseline,
+            "numpy": "numpy" in modules,
+            "scipy": "scipy" in modules,
+        })
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of process_map_svg.py.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case")
+    parser.add_argument("--output", type=Path, help="Results JSON (default: logs/benchmarks/startup_<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    created = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory(prefix="owa-startup-") as tmp:
+        cases = run_startup_benchmark(Path(tmp), repeat=args.repeat)
+
+    logger.info(f"{'Case':12s} {'Median (ms)':>12s} {'Over python (ms)':>17s}  NumPy")
+    for case in cases:
+        logger.info(f"{case['name']:12s} {case['median_seconds'] * 1000:12.1f} "
+                    f"{case['over_bare_interpreter_seconds'] * 1000:17.1f}  {'yes' if case['numpy'] else 'no'}")
+
+    output = args.output or BENCHMARK_DIR / f"startup_{created.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({"benchmark": "startup", "created": created.isoformat(timespec="seconds"),
+                   "python": sys.version.split()[0], "cases": cases}, f, indent=2)
+    logger.info(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,66 +6,94 @@ queries the Warhammer Fandom Wiki for each settlement, and extracts metadata
 (URL, title, description, image) using the MediaWiki API.
 
 Usage:
-    python download_wiki_metadata.py [csv_filename]
+    python download_wiki_metadata.py [csv_filename ...] [--all] [--update ask|yes|no]
+                                     [--full] [--max-age-days N] [--workers N]
+                                     [--thumbnail-widths W,W] [--download-thumbnails]
+                                     [--no-title-index]
     
     If no filename is provided, defaults to 'empire.csv'
     
+    Only new, empty or stale rows are queried. Rows that already hold wiki
+    metadata are re-checked with batched revision-ID queries once they are
+    older than DEFAULT_MAX_AGE_DAYS. Pass --full to query every settlement.
+    
+    --all processes every gazetteer in one run, sharing the HTTP session and
+    result cache so settlements listed in several gazetteers are queried once.
+    Without a terminal attached, --update defaults to 'no' instead of prompting.
+    
+    Settlement names are matched locally against the wiki's list of page
+    titles (see wiki_titles.py), so names with no page cost no requests and
+    spelling variants still resolve. --no-title-index probes each name instead.
+    
+    Thumbnail URLs and sizes are requested together with the page metadata.
+    Images of rows skipped as up to date are looked up once in a batched
+    query if the thumbnail manifest has no entry for them yet.
+    --download-thumbnails stores them in output/images/ (see wiki_images.py).
+    
 Examples:
     python download_wiki_metadata.py empire.csv
     python download_wiki_metadata.py westerland.csv
+    python download_wiki_metadata.py --all --update yes --workers 4
 """
 
+import argparse
 import csv
+import json
 import time
-import unicodedata
 import re
 import os
-from typing import Dict, Optional
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
 import requests
 from bs4 import BeautifulSoup
 
+from gazetteer_io import atomic_csv_writer, merge_metadata_csv
+from text_normalize import normalize_name_to_latin
+from wiki_images import THUMBNAIL_WIDTHS, ThumbnailStore, thumbnail_variants
+from wiki_titles import TitleIndex
 
-def normalize_name_to_latin(name: str) -> str:
-    """
-    Convert non-latin characters to their closest latin equivalents.
-    
-    Args:
-        name: Settlement name that may contain non-latin characters
-        
-    Returns:
-        Name with non-latin characters replaced by latin equivalents
-    """
-    # Normalize to NFD (decomposed form) and filter out combining characters
-    normalized = unicodedata.normalize('NFD', name)
-    latin_name = ''.join(
-        char for char in normalized
-        if unicodedata.category(char) != 'Mn'  # Mn = Nonspacing_Mark
-    )
-    return latin_name
+API_URL = "https://warhammerfantasy.fandom.com/api.php"
+
+GAZETTEER_DIR = "input/gazetteers"
+
+# Gazetteer columns populated by this script
+WIKI_COLUMNS = ('wiki_url', 'wiki_title', 'wiki_description', 'wiki_image')
+
+# Rows checked more recently than this are not queried again during a delta refresh
+DEFAULT_MAX_AGE_DAYS = 30
+
+# MediaWiki accepts up to 50 titles per query for anonymous clients
+TITLES_PER_QUERY = 50
 
 
-def get_article_description(page_title: str) -> str:
+def get_article_description(page_title: str, session: Optional[requests.Session] = None) -> str:
     """
     Extract opening sentences from a Fandom wiki article.
     
     Args:
         page_title: Title of the wiki page
+        session: Optional HTTP session to reuse connections
         
     Returns:
         String containing up to 3 opening sentences from the article
     """
-    api_url = "https://warhammerfantasy.fandom.com/api.php"
+    api_url = API_URL
     
     params = {
         'action': 'parse',
         'format': 'json',
         'page': page_title,
         'prop': 'text',
-        'disabletoc': True
+        'disabletoc': True,
+        'redirects': 1
     }
     
     try:
-        response = requests.get(api_url, params=params, timeout=10)
+        response = (session or requests).get(api_url, params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
         
@@ -127,22 +155,35 @@ def get_article_description(page_title: str) -> str:
         
         return description
         
+    except requests.RequestException:
+        # A failed request is not an empty article; let the caller keep its data
+        raise
     except Exception:
         return ""
 
 
-def fetch_wiki_metadata(settlement_name: str) -> Optional[Dict[str, str]]:
+def fetch_wiki_metadata(settlement_name: str,
+                        session: Optional[requests.Session] = None,
+                        thumbnail_widths: Tuple[int, ...] = THUMBNAIL_WIDTHS) -> Optional[Dict[str, str]]:
     """
     Fetch metadata from Warhammer Fandom Wiki using MediaWiki API.
     
     Args:
         settlement_name: Name of the settlement to query
+        session: Optional HTTP session to reuse connections
+        thumbnail_widths: Widths to derive image thumbnails for
         
     Returns:
-        Dictionary with keys: url, title, description, image
+        Dictionary with keys: url, title, description, image, revid,
+        image_width, image_height, thumbnails
         Returns None if the page doesn't exist
+
+    Raises:
+        requests.RequestException: If no page was found and a request failed,
+            so a network error is never mistaken for a missing page
     """
-    api_url = "https://warhammerfantasy.fandom.com/api.php"
+    api_url = API_URL
+    error = None
     
     # Try original name first
     names_to_try = [settlement_name]
@@ -161,11 +202,13 @@ def fetch_wiki_metadata(settlement_name: str) -> Optional[Dict[str, str]]:
                 'titles': name_variant,
                 'prop': 'info|pageimages|pageprops',
                 'inprop': 'url',
-                'piprop': 'original',
-                'ppprop': 'description'
+                'piprop': 'original|thumbnail',
+                'pithumbsize': max(thumbnail_widths),
+                'ppprop': 'description',
+                'redirects': 1
             }
             
-            response = requests.get(api_url, params=params, timeout=10)
+            response = (session or requests).get(api_url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -178,116 +221,567 @@ def fetch_wiki_metadata(settlement_name: str) -> Optional[Dict[str, str]]:
                     url = page_data.get('fullurl', '')
                     
                     # Get description by extracting article text
-                    description = get_article_description(title)
+                    description = get_article_description(title, session)
                     
-                    # Get image
+                    # Get image and its thumbnails
                     image = ''
-                    if 'original' in page_data:
-                        image = page_data['original'].get('source', '')
+                    original = page_data.get('original', {})
+                    if original:
+                        image = original.get('source', '')
                     
                     return {
                         'url': url,
                         'title': title,
                         'description': description,
-                        'image': image
+                        'image': image,
+                        'revid': page_data.get('lastrevid'),
+                        'image_width': original.get('width', 0),
+                        'image_height': original.get('height', 0),
+                        'thumbnails': thumbnail_variants(original, page_data.get('thumbnail'), thumbnail_widths)
                     }
             
-        except requests.RequestException:
+        except requests.RequestException as e:
             # Try next name variant
+            error = e
             continue
     
+    if error is not None:
+        # The page may exist: leave the decision to the next run
+        raise error
+    
     # No page found for any variant
     return None
 
 
-def process_settlements(input_csv: str, output_csv: str, log_file: str):
+class ThrottledSession(requests.Session):
+    """
+    requests.Session that waits for a pacing callback before every request.
+    
+    A single lookup sends up to three requests (page query, description
+    fallback, spelling variants), so pacing whole lookups would still let
+    bursts through. Pacing in the session covers every request, including
+    the batched revision queries and the title list download.
+    """
+    
+    def __init__(self, throttle: Callable[[], None]):
+        """
+        Args:
+            throttle: Called before each request; blocks until it may be sent
+        """
+        super().__init__()
+        self.throttle = throttle
+    
+    def request(self, *args, **kwargs):
+        """Send a request once the throttle allows it."""
+        self.throttle()
+        return super().request(*args, **kwargs)
+
+
+class WikiFetcher:
+    """
+    Shared HTTP session, request pacing and result cache for wiki lookups.
+    
+    One fetcher can serve several gazetteers in a single run: settlements that
+    appear in more than one gazetteer are only queried once, and all lookups
+    share one connection pool. Lookups run on a small thread pool, but every
+    HTTP request made through the session still starts at most once every
+    `delay` seconds to respect the wiki's rate limits.
+    """
+    
+    def __init__(self, workers: int = 1, delay: float = 0.5,
+                 thumbnail_widths: Tuple[int, ...] = THUMBNAIL_WIDTHS):
+        """
+        Args:
+            workers: Number of lookups allowed in flight at the same time
+            delay: Minimum number of seconds between starting two requests
+            thumbnail_widths: Widths to derive image thumbnails for
+        """
+        self.workers = max(1, workers)
+        self.delay = delay
+        self.thumbnail_widths = tuple(thumbnail_widths)
+        self.session = ThrottledSession(self._throttle)
+        self.cache: Dict[str, Optional[Dict[str, str]]] = {}
+        self.revision_cache: Dict[str, Optional[int]] = {}
+        # Original image URL -> {width, height, thumbnails}, collected from every query
+        self.images: Dict[str, Dict] = {}
+        # Image URL -> page title of rows kept from earlier runs, for backfill_thumbnails()
+        self.kept_images: Dict[str, str] = {}
+        # Optional local title index; settlements it cannot match are not queried
+        self.resolver: Optional[TitleIndex] = None
+        self.matches: Dict[str, Tuple[str, float]] = {}
+        # Settlement -> page title already linked in the gazetteer, queried even without a match
+        self.known_titles: Dict[str, str] = {}
+        self.lookups = 0
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+    
+    def _throttle(self):
+        """Block until the next request is allowed to start."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.delay
+            self.request_count += 1
+        if start > now:
+            time.sleep(start - now)
+    
+    def _record_image(self, source: str, width: int, height: int, thumbnails: Dict[str, Dict]):
+        """Remember the thumbnails of an image for the ThumbnailStore."""
+        if source and thumbnails:
+            with self._lock:
+                self.images[source] = {'width': width, 'height': height, 'thumbnails': thumbnails}
+    
+    def _fetch(self, settlement: str) -> Optional[Dict[str, str]]:
+        """Fetch one settlement; the session paces its requests."""
+        query_name = settlement
+        if self.resolver is not None:
+            match = self.resolver.resolve(settlement)
+            if match is not None:
+                query_name = match[0]
+                with self._lock:
+                    self.matches[settlement] = match
+            elif settlement in self.known_titles:
+                # The gazetteer already links a page: query it rather than drop the link
+                query_name = self.known_titles[settlement]
+            else:
+                # Not in the wiki's title list: no request needed
+                return None
+        
+        with self._lock:
+            self.lookups += 1
+        metadata = fetch_wiki_metadata(query_name, self.session, self.thumbnail_widths)
+        if metadata:
+            self._record_image(metadata['image'], metadata.get('image_width', 0),
+                               metadata.get('image_height', 0), metadata.get('thumbnails', {}))
+        return metadata
+    
+    def fetch_many(self, settlements: List[str]) -> Iterator[Tuple[str, Optional[Dict[str, str]], Optional[Exception]]]:
+        """
+        Fetch metadata for many settlements, reusing cached results.
+        
+        Args:
+            settlements: Settlement names to look up
+            
+        Yields:
+            (settlement, metadata or None, exception or None) in completion order
+        """
+        pending = []
+        for settlement in settlements:
+            if settlement in self.cache:
+                yield settlement, self.cache[settlement], None
+            else:
+                pending.append(settlement)
+        
+        if not pending:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(self._fetch, name): name for name in pending}
+            for future in as_completed(futures):
+                settlement = futures[future]
+                try:
+                    metadata = future.result()
+                except Exception as e:
+                    yield settlement, None, e
+                    continue
+                self.cache[settlement] = metadata
+                yield settlement, metadata, None
+        finally:
+            # Drop queued lookups if the caller stops early (e.g. Ctrl+C)
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def fetch_revisions(self, titles: List[str]) -> Dict[str, Optional[int]]:
+        """
+        Look up latest revision IDs, querying only titles not seen before.
+        
+        Args:
+            titles: Wiki page titles to check
+            
+        Returns:
+            Dictionary mapping each title to its revision ID (None if missing)
+        """
+        missing = [title for title in dict.fromkeys(titles) if title not in self.revision_cache]
+        if missing:
+            with self._lock:
+                self.lookups += 1
+            # Image thumbnails come back in the same batched query
+            pages = fetch_page_info(missing, self.session, max(self.thumbnail_widths))
+            for title, page in pages.items():
+                self.revision_cache[title] = page['revid'] if page else None
+                if page and page.get('original'):
+                    original = page['original']
+                    self._record_image(original.get('source', ''), original.get('width', 0),
+                                       original.get('height', 0),
+                                       thumbnail_variants(original, page.get('thumbnail'), self.thumbnail_widths))
+        return {title: self.revision_cache[title] for title in titles if title in self.revision_cache}
+
+
+def load_refresh_state(state_file: Optional[str]) -> Dict[str, Dict]:
+    """
+    Load the per-settlement refresh state written by previous runs.
+    
+    Args:
+        state_file: Path to the JSON state file, or None to start empty
+        
+    Returns:
+        Dictionary mapping settlement name to {checked, revid, found}
+    """
+    if not state_file or not os.path.exists(state_file):
+        return {}
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️  Could not read refresh state {state_file}, starting from scratch")
+        return {}
+
+
+def save_refresh_state(state_file: Optional[str], state: Dict[str, Dict]):
+    """
+    Save the per-settlement refresh state for the next run.
+    
+    Args:
+        state_file: Path to the JSON state file, or None to skip saving
+        state: Dictionary mapping settlement name to {checked, revid, found}
+    """
+    if not state_file:
+        return
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False, sort_keys=True)
+
+
+def has_wiki_metadata(row: Dict[str, str]) -> bool:
+    """
+    Check whether a gazetteer row already holds a usable wiki entry.
+    
+    A row counts as filled when it has a URL, a title and a description.
+    The image is optional because many wiki articles have none.
+    
+    Args:
+        row: Gazetteer CSV row
+        
+    Returns:
+        True if the row's wiki columns are filled in
+    """
+    return all((row.get(column) or '').strip()
+               for column in ('wiki_url', 'wiki_title', 'wiki_description'))
+
+
+def known_page_title(row: Dict[str, str]) -> str:
+    """
+    Title of the wiki page a gazetteer row already links to.
+    
+    Args:
+        row: Gazetteer CSV row
+        
+    Returns:
+        The wiki_title column, else the title taken from wiki_url, else ''
+    """
+    title = (row.get('wiki_title') or '').strip()
+    url = (row.get('wiki_url') or '').strip()
+    if not title and url:
+        title = unquote(urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]).replace('_', ' ')
+    return title
+
+
+def _is_stale(entry: Optional[Dict], now: datetime, max_age: timedelta) -> bool:
+    """Check whether a refresh state entry is missing or older than max_age."""
+    if not entry or not entry.get('checked'):
+        return True
+    try:
+        checked = datetime.fromisoformat(entry['checked'])
+    except ValueError:
+        return True
+    return now - checked > max_age
+
+
+def plan_refresh(rows: List[Dict[str, str]], state: Dict[str, Dict],
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """
+    Decide which gazetteer rows need to be queried during a refresh.
+    
+    Rows fall into three groups:
+      - 'current': checked recently, nothing to do
+      - 'verify':  filled in but not checked recently; a batched revision
+                   query decides whether the article changed
+      - 'fetch':   new, empty or incomplete rows that need a full lookup
+    
+    Args:
+        rows: Gazetteer CSV rows
+        state: Refresh state from load_refresh_state()
+        max_age_days: Age after which a row is checked again
+        now: Current time (defaults to the current UTC time)
+        
+    Returns:
+        Dictionary with 'current', 'verify' and 'fetch' lists of settlement names
+    """
+    now = now or datetime.now(timezone.utc)
+    max_age = timedelta(days=max_age_days)
+    plan = {'current': [], 'verify': [], 'fetch': []}
+    seen = set()
+    
+    for row in rows:
+        settlement = row['Settlement']
+        if settlement in seen:
+            continue
+        seen.add(settlement)
+        
+        entry = state.get(settlement)
+        stale = _is_stale(entry, now, max_age)
+        
+        if has_wiki_metadata(row):
+            plan['verify' if stale else 'current'].append(settlement)
+        elif (row.get('wiki_url') or '').strip():
+            # Page known but description missing
+            plan['fetch'].append(settlement)
+        elif entry and entry.get('found') is False and not stale:
+            # Recently confirmed that the wiki has no page for this settlement
+            plan['current'].append(settlement)
+        else:
+            plan['fetch'].append(settlement)
+    
+    return plan
+
+
+def fetch_page_info(titles: List[str],
+                    session: Optional[requests.Session] = None,
+                    thumbnail_width: Optional[int] = None) -> Dict[str, Optional[Dict]]:
+    """
+    Look up revision IDs (and optionally page images) of many pages with batched queries.
+    
+    Args:
+        titles: Wiki page titles to check
+        session: Optional HTTP session to reuse connections; batches are only
+                 spaced out here if it is not a ThrottledSession
+        thumbnail_width: If set, also request the page image and a thumbnail of this width
+        
+    Returns:
+        Dictionary mapping each requested title to {revid, original, thumbnail},
+        or None if the page no longer exists
+    """
+    info = {}
+    
+    for start in range(0, len(titles), TITLES_PER_QUERY):
+        batch = titles[start:start + TITLES_PER_QUERY]
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'titles': '|'.join(batch),
+            'prop': 'info'
+        }
+        if thumbnail_width:
+            params.update({
+                'prop': 'info|pageimages',
+                'piprop': 'original|thumbnail',
+                'pithumbsize': thumbnail_width,
+                'pilimit': TITLES_PER_QUERY
+            })
+        
+        response = (session or requests).get(API_URL, params=params, timeout=10)
+        response.raise_for_status()
+        query = response.json().get('query', {})
+        
+        # The API may rewrite titles (e.g. underscores to spaces)
+        normalized = {item['to']: item['from'] for item in query.get('normalized', [])}
+        
+        for page_id, page_data in query.get('pages', {}).items():
+            title = page_data.get('title', '')
+            requested = normalized.get(title, title)
+            if 'missing' in page_data or page_id.startswith('-'):
+                info[requested] = None
+            else:
+                info[requested] = {
+                    'revid': page_data.get('lastrevid'),
+                    'original': page_data.get('original'),
+                    'thumbnail': page_data.get('thumbnail')
+                }
+        
+        # Rate limiting between batches; a ThrottledSession already paces each request
+        if start + TITLES_PER_QUERY < len(titles) and not isinstance(session, ThrottledSession):
+            time.sleep(0.5)
+    
+    return info
+
+
+def fetch_page_revisions(titles: List[str],
+                         session: Optional[requests.Session] = None) -> Dict[str, Optional[int]]:
+    """
+    Look up the latest revision ID of many wiki pages with batched queries.
+    
+    Args:
+        titles: Wiki page titles to check
+        session: Optional HTTP session to reuse connections
+        
+    Returns:
+        Dictionary mapping each requested title to its latest revision ID,
+        or None if the page no longer exists
+    """
+    return {title: page['revid'] if page else None
+            for title, page in fetch_page_info(titles, session).items()}
+
+
+def process_settlements(input_csv: str, output_csv: str, log_file: str,
+                        state_file: Optional[str] = None,
+                        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                        full_refresh: bool = False,
+                        fetcher: Optional[WikiFetcher] = None) -> Dict[str, int]:
     """
-    Process all settlements from the input CSV and fetch wiki metadata.
+    Process settlements from the input CSV and fetch wiki metadata.
+    
+    By default only new, empty or stale rows are queried. Rows that already
+    hold wiki metadata are verified with batched revision-ID queries and are
+    only fetched again when their article changed since the last run.
     
     Args:
         input_csv: Path to input CSV file with settlement names
         output_csv: Path to output CSV file for wiki metadata
         log_file: Path to log file for errors
+        state_file: Path to the JSON file storing last-checked times and revision IDs
+        max_age_days: Age in days after which a row is checked again
+        full_refresh: Query every settlement, ignoring existing metadata
+        fetcher: Shared WikiFetcher; a private one is created if omitted
+        
+    Returns:
+        Dictionary with 'fetched', 'found', 'errors' and 'interrupted' counts
     """
+    fetcher = fetcher or WikiFetcher()
+    
     # Read settlements from CSV
-    settlements = []
+    rows = []
     with open(input_csv, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
-            settlements.append(row['Settlement'])
+            rows.append(row)
+    rows_by_name = {row['Settlement']: row for row in rows}
+    
+    state = load_refresh_state(state_file)
+    now = datetime.now(timezone.utc)
+    checked_at = now.isoformat(timespec='seconds')
+    
+    if full_refresh:
+        plan = {'current': [], 'verify': [], 'fetch': list(rows_by_name)}
+    else:
+        plan = plan_refresh(rows, state, max_age_days, now)
     
     csv_name = os.path.basename(input_csv)
-    total_settlements = len(settlements)
     print(f"\n{'='*70}")
-    print(f"Starting wiki metadata download for {total_settlements} settlements")
+    print(f"Refresh plan for {len(rows_by_name)} settlements")
     print(f"Source: {csv_name}")
+    print(f"  Up to date:        {len(plan['current'])}")
+    print(f"  Revision checks:   {len(plan['verify'])}")
+    print(f"  To fetch:          {len(plan['fetch'])}")
     print(f"{'='*70}\n")
     
+    # Output data, keyed by settlement and written in gazetteer order
+    results = {}
+    
+    def existing_result(settlement: str) -> Dict[str, str]:
+        row = rows_by_name[settlement]
+        if row.get('wiki_image') and row.get('wiki_title'):
+            fetcher.kept_images[row['wiki_image']] = row['wiki_title'].strip()
+        return {
+            'settlement': settlement,
+            'url': row.get('wiki_url', ''),
+            'title': row.get('wiki_title', ''),
+            'description': row.get('wiki_description', ''),
+            'image': row.get('wiki_image', '')
+        }
+    
+    for settlement in plan['current']:
+        results[settlement] = existing_result(settlement)
+    
+    # Cheap change detection for rows that already hold metadata
+    to_fetch = list(plan['fetch'])
+    unchanged = 0
+    if plan['verify']:
+        titles = [rows_by_name[name]['wiki_title'].strip() for name in plan['verify']]
+        try:
+            revisions = fetcher.fetch_revisions(titles)
+        except requests.RequestException as e:
+            print(f"⚠️  Revision check failed ({e}), fetching those rows in full")
+            revisions = {}
+        
+        for settlement, title in zip(plan['verify'], titles):
+            if title not in revisions:
+                to_fetch.append(settlement)
+                continue
+            revid = revisions[title]
+            stored_revid = state.get(settlement, {}).get('revid')
+            if revid is None or (stored_revid is not None and revid != stored_revid):
+                # Page was deleted or edited since the last check
+                to_fetch.append(settlement)
+            else:
+                unchanged += 1
+                results[settlement] = existing_result(settlement)
+                state[settlement] = {'checked': checked_at, 'revid': revid, 'found': True}
+    
+    # Rows that already link a page keep it even if the title index has no match
+    for settlement in to_fetch:
+        title = known_page_title(rows_by_name[settlement])
+        if title:
+            fetcher.known_titles[settlement] = title
+    
+    total_settlements = len(to_fetch)
+    
     # Statistics
     processed = 0
     found = 0
     errors = []
     
-    # Output data
-    results = []
-    
     # Open log file
     interrupted = False
     with open(log_file, 'w', encoding='utf-8') as log:
         log.write(f"Wiki Metadata Download Log - {csv_name}\n")
         log.write("=" * 70 + "\n\n")
+        log.write(f"Up to date: {len(plan['current'])}, "
+                  f"unchanged revisions: {unchanged}, fetched: {total_settlements}\n\n")
         
         try:
-            for idx, settlement in enumerate(settlements, 1):
+            for idx, (settlement, metadata, error) in enumerate(fetcher.fetch_many(to_fetch), 1):
                 processed += 1
                 
                 # Progress indicator
                 progress_pct = (idx / total_settlements) * 100
                 print(f"[{idx}/{total_settlements} - {progress_pct:.1f}%] Processing: {settlement}...", end=' ')
                 
-                try:
-                    metadata = fetch_wiki_metadata(settlement)
-                    
-                    if metadata:
-                        found += 1
-                        results.append({
-                            'settlement': settlement,
-                            'url': metadata['url'],
-                            'title': metadata['title'],
-                            'description': metadata['description'],
-                            'image': metadata['image']
-                        })
-                        print(f"✓ Found (Total: {found})")
-                        log.write(f"SUCCESS [{idx}/{total_settlements}]: {settlement}\n")
-                        log.write(f"  URL: {metadata['url']}\n\n")
-                    else:
-                        results.append({
-                            'settlement': settlement,
-                            'url': '',
-                            'title': '',
-                            'description': '',
-                            'image': ''
-                        })
-                        print(f"✗ Not found")
-                        log.write(f"NOT FOUND [{idx}/{total_settlements}]: {settlement}\n\n")
-                        
-                except Exception as e:
-                    error_msg = f"Error processing {settlement}: {str(e)}"
+                if error is not None:
+                    error_msg = f"Error processing {settlement}: {str(error)}"
                     errors.append(error_msg)
-                    results.append({
+                    # Keep whatever the gazetteer already had; retry on the next run
+                    results[settlement] = existing_result(settlement)
+                    print(f"✗ Error")
+                    log.write(f"ERROR [{idx}/{total_settlements}]: {settlement}\n")
+                    log.write(f"  {str(error)}\n\n")
+                elif metadata:
+                    found += 1
+                    results[settlement] = {
+                        'settlement': settlement,
+                        'url': metadata['url'],
+                        'title': metadata['title'],
+                        'description': metadata['description'],
+                        'image': metadata['image']
+                    }
+                    state[settlement] = {'checked': checked_at, 'revid': metadata.get('revid'), 'found': True}
+                    print(f"✓ Found (Total: {found})")
+                    log.write(f"SUCCESS [{idx}/{total_settlements}]: {settlement}\n")
+                    match = fetcher.matches.get(settlement)
+                    if match and match[1] < 1.0:
+                        log.write(f"  Fuzzy match: {match[0]} (similarity {match[1]:.2f})\n")
+                    log.write(f"  URL: {metadata['url']}\n\n")
+                else:
+                    results[settlement] = {
                         'settlement': settlement,
                         'url': '',
                         'title': '',
                         'description': '',
                         'image': ''
-                    })
-                    print(f"✗ Error")
-                    log.write(f"ERROR [{idx}/{total_settlements}]: {settlement}\n")
-                    log.write(f"  {str(e)}\n\n")
-                
-                # Rate limiting: wait 0.5 seconds between requests
-                if idx < total_settlements:
-                    time.sleep(0.5)
+                    }
+                    state[settlement] = {'checked': checked_at, 'revid': None, 'found': False}
+                    print(f"✗ Not found")
+                    log.write(f"NOT FOUND [{idx}/{total_settlements}]: {settlement}\n\n")
                     
         except KeyboardInterrupt:
             interrupted = True
@@ -296,12 +790,15 @@ def process_settlements(input_csv: str, output_csv: str, log_file: str):
             log.write("PROCESS INTERRUPTED BY USER\n")
             log.write("="*70 + "\n")
     
-    # Write results to CSV
-    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['settlement', 'url', 'title', 'description', 'image']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+    # Write results to CSV, one row per gazetteer row so update_original_csv
+    # can join both files in a single streaming pass
+    fieldnames = ['settlement', 'url', 'title', 'description', 'image']
+    with atomic_csv_writer(output_csv, fieldnames) as writer:
+        for row in rows:
+            if row['Settlement'] in results:
+                writer.writerow(results[row['Settlement']])
+    
+    save_refresh_state(state_file, state)
     
     # Print summary report
     print(f"\n{'='*70}")
@@ -309,14 +806,18 @@ def process_settlements(input_csv: str, output_csv: str, log_file: str):
     print(f"{'='*70}")
     if interrupted:
         print("⚠️  PROCESS WAS INTERRUPTED")
-    print(f"Total settlements processed: {processed}")
+    print(f"Settlements already up to date: {len(plan['current'])}")
+    print(f"Unchanged since last check: {unchanged}")
+    print(f"Total settlements fetched: {processed}")
     print(f"Wiki pages found: {found}")
-    print(f"Wiki pages not found: {processed - found}")
+    print(f"Wiki pages not found: {processed - found - len(errors)}")
     print(f"Errors encountered: {len(errors)}")
     if interrupted and processed < total_settlements:
         print(f"Remaining settlements: {total_settlements - processed}")
     print(f"\nOutput saved to: {output_csv}")
     print(f"Log saved to: {log_file}")
+    if state_file:
+        print(f"Refresh state saved to: {state_file}")
     print(f"{'='*70}\n")
     
     if errors:
@@ -325,12 +826,22 @@ def process_settlements(input_csv: str, output_csv: str, log_file: str):
             print(f"  - {error}")
         if len(errors) > 10:
             print(f"  ... and {len(errors) - 10} more (see log file)")
+    
+    return {
+        'fetched': processed,
+        'found': found,
+        'errors': len(errors),
+        'interrupted': interrupted
+    }
 
 
 def update_original_csv(original_csv: str, metadata_csv: str):
     """
     Update the original CSV with wiki metadata from the output CSV.
     
+    The gazetteer is streamed into a temporary file and renamed over the
+    original, so an interrupted update never leaves a half-written CSV.
+    
     Args:
         original_csv: Path to original CSV file to update
         metadata_csv: Path to CSV file with wiki metadata
@@ -339,78 +850,227 @@ def update_original_csv(original_csv: str, metadata_csv: str):
     print("UPDATING ORIGINAL CSV")
     print(f"{'='*70}\n")
     
-    # Read metadata
-    metadata_dict = {}
-    with open(metadata_csv, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            metadata_dict[row['settlement']] = {
-                'wiki_url': row['url'],
-                'wiki_title': row['title'],
-                'wiki_description': row['description'],
-                'wiki_image': row['image']
-            }
+    column_map = {
+        'url': 'wiki_url',
+        'title': 'wiki_title',
+        'description': 'wiki_description',
+        'image': 'wiki_image'
+    }
+    updated = merge_metadata_csv(original_csv, metadata_csv, column_map)
     
-    # Read original CSV
-    rows = []
-    with open(original_csv, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-        for row in reader:
-            settlement = row['Settlement']
-            if settlement in metadata_dict:
-                row.update(metadata_dict[settlement])
-            rows.append(row)
+    print(f"✓ Updated {original_csv} with wiki metadata ({updated} rows)")
+    print(f"{'='*70}\n")
+
+
+def find_gazetteers(gazetteer_dir: str = GAZETTEER_DIR) -> List[str]:
+    """
+    List every gazetteer CSV file in the gazetteers directory.
+    
+    Args:
+        gazetteer_dir: Directory containing gazetteer CSV files
+        
+    Returns:
+        Sorted list of CSV file names
+    """
+    return sorted(name for name in os.listdir(gazetteer_dir) if name.lower().endswith('.csv'))
+
+
+def backfill_thumbnails(fetcher: WikiFetcher, store: ThumbnailStore) -> int:
+    """
+    Record thumbnails for kept rows whose image the store has never seen.
     
-    # Write updated CSV
-    with open(original_csv, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    Rows skipped as up to date are not queried, so their images only reach
+    the thumbnail manifest through this backfill: their pages are looked up
+    with the batched revision query, which also returns the page images.
+    Once registered, an image is not queried again.
     
-    print(f"✓ Updated {original_csv} with wiki metadata")
-    print(f"{'='*70}\n")
+    Args:
+        fetcher: Fetcher that processed the gazetteers
+        store: Thumbnail store to check for missing entries
+        
+    Returns:
+        Number of page titles queried
+    """
+    titles = sorted({title for image, title in fetcher.kept_images.items()
+                     if image not in store.manifest and image not in fetcher.images})
+    if not titles:
+        return 0
+    try:
+        fetcher.fetch_revisions(titles)
+    except requests.RequestException as e:
+        print(f"⚠️  Thumbnail backfill failed ({e}), retrying on the next run")
+    return len(titles)
 
 
-if __name__ == "__main__":
-    import sys
+def process_gazetteers(csv_names: List[str], update: str = 'ask',
+                       full_refresh: bool = False,
+                       max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                       workers: int = 1,
+                       gazetteer_dir: str = GAZETTEER_DIR,
+                       thumbnail_widths: Tuple[int, ...] = THUMBNAIL_WIDTHS,
+                       download_thumbnails: bool = False,
+                       resolve_titles: bool = True) -> bool:
+    """
+    Refresh wiki metadata for several gazetteers in one run.
     
-    # Default to empire.csv, but allow specifying a different CSV file
-    if len(sys.argv) > 1:
-        csv_name = sys.argv[1]
-    else:
-        csv_name = "empire.csv"
+    All gazetteers share one WikiFetcher, so settlements listed in several
+    gazetteers are queried only once.
     
-    input_csv = f"input/gazetteers/{csv_name}"
-    base_name = os.path.splitext(csv_name)[0]
-    output_csv = f"output/{base_name}_wiki_metadata.csv"
-    log_file = f"logs/{base_name}_wiki_download.log"
+    Args:
+        csv_names: Gazetteer file names inside gazetteer_dir
+        update: 'yes' to update the gazetteers, 'no' to only write metadata
+                CSVs, 'ask' to prompt for each file
+        full_refresh: Query every settlement, ignoring existing metadata
+        max_age_days: Age in days after which a row is checked again
+        workers: Number of concurrent wiki lookups
+        gazetteer_dir: Directory containing the gazetteer CSV files
+        thumbnail_widths: Widths to record image thumbnails for
+        download_thumbnails: Download thumbnails into the local image store
+        resolve_titles: Match names against the wiki's cached title list
+                        instead of probing the wiki for every name
+        
+    Returns:
+        True if every gazetteer was processed without errors
+    """
+    fetcher = WikiFetcher(workers=workers, thumbnail_widths=thumbnail_widths)
+    success = True
     
-    print("\n" + "="*70)
-    print("WARHAMMER FANDOM WIKI METADATA DOWNLOADER")
-    print("="*70)
+    if resolve_titles:
+        try:
+            fetcher.resolver = TitleIndex.load_or_download(fetcher.session)
+            print(f"Title index: {len(fetcher.resolver.titles)} wiki pages")
+        except requests.RequestException as e:
+            print(f"⚠️  Could not download the wiki title list ({e}), probing names one by one")
+    
+    for csv_name in csv_names:
+        input_csv = os.path.join(gazetteer_dir, csv_name)
+        base_name = os.path.splitext(csv_name)[0]
+        output_csv = f"output/{base_name}_wiki_metadata.csv"
+        log_file = f"logs/{base_name}_wiki_download.log"
+        state_file = f"output/{base_name}_wiki_state.json"
+        
+        if not os.path.exists(input_csv):
+            print(f"\n❌ Error: Input file not found: {input_csv}")
+            success = False
+            continue
+        
+        # Step 1: Download wiki metadata (only new, empty or stale rows unless full_refresh)
+        stats = process_settlements(input_csv, output_csv, log_file,
+                                    state_file=state_file,
+                                    max_age_days=max_age_days,
+                                    full_refresh=full_refresh,
+                                    fetcher=fetcher)
+        if stats['errors']:
+            success = False
+        if stats['interrupted']:
+            print(f"Skipped updating {input_csv} and any remaining gazetteers.")
+            return False
+        
+        # Step 2: Update the original CSV according to the update mode
+        if update == 'ask':
+            print("\nWould you like to update the original CSV file with the wiki metadata?")
+            print(f"This will update: {input_csv}")
+            response = input("Enter 'yes' to proceed, or press Enter to skip: ").strip().lower()
+            apply_update = response == 'yes'
+        else:
+            apply_update = update == 'yes'
+        
+        if apply_update:
+            update_original_csv(input_csv, output_csv)
+            print("✓ All done! The original CSV has been updated with wiki metadata.")
+        else:
+            print(f"\nSkipped updating original CSV.")
+            print(f"You can manually update it later using the data in: {output_csv}")
     
-    # Check if input file exists
-    if not os.path.exists(input_csv):
-        print(f"\n❌ Error: Input file not found: {input_csv}")
-        print(f"Usage: python download_wiki_metadata.py [csv_filename]")
-        sys.exit(1)
+    print(f"\nWiki lookups made: {fetcher.lookups} in {fetcher.request_count} requests "
+          f"({len(fetcher.cache)} unique settlements fetched across {len(csv_names)} gazetteers)")
     
-    # Step 1: Download wiki metadata
-    process_settlements(input_csv, output_csv, log_file)
+    # Step 3: Record thumbnails (backfilling rows kept as they were) and optionally prefetch them
+    store = ThumbnailStore()
+    backfilled = backfill_thumbnails(fetcher, store)
+    if backfilled:
+        print(f"Thumbnail backfill: looked up {backfilled} pages with images missing from the manifest")
+    if fetcher.images or download_thumbnails:
+        for source, image in fetcher.images.items():
+            store.register(source, image['width'], image['height'], image['thumbnails'])
+        if download_thumbnails:
+            counts = store.download(workers=max(4, workers))
+            print(f"Thumbnails downloaded: {counts['downloaded']}, failed: {counts['failed']}")
+            if counts['failed']:
+                success = False
+        store.save()
+        print(f"Thumbnail manifest saved to: {store.manifest_path}")
+    
+    return success
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command-line entry point.
+    
+    Args:
+        argv: Command-line arguments (defaults to sys.argv[1:])
+        
+    Returns:
+        Process exit code
+    """
+    parser = argparse.ArgumentParser(
+        description="Download Warhammer Fandom Wiki metadata for gazetteer settlements.")
+    parser.add_argument('csv_files', nargs='*',
+                        help="Gazetteer file names in input/gazetteers/ (default: empire.csv)")
+    parser.add_argument('--all', action='store_true',
+                        help="Process every CSV file in input/gazetteers/")
+    parser.add_argument('--update', choices=('ask', 'yes', 'no'), default=None,
+                        help="Update the original CSVs: ask (default when interactive), "
+                             "yes, or no (default when not attached to a terminal)")
+    parser.add_argument('--full', action='store_true',
+                        help="Query every settlement, ignoring existing metadata")
+    parser.add_argument('--max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help=f"Re-check rows older than this (default: {DEFAULT_MAX_AGE_DAYS})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Concurrent wiki lookups (default: 1)")
+    parser.add_argument('--thumbnail-widths', default=','.join(str(w) for w in THUMBNAIL_WIDTHS),
+                        help="Comma-separated image thumbnail widths in pixels "
+                             f"(default: {','.join(str(w) for w in THUMBNAIL_WIDTHS)})")
+    parser.add_argument('--download-thumbnails', action='store_true',
+                        help="Download thumbnails into output/images/ for the settlement GeoJSON")
+    parser.add_argument('--no-title-index', action='store_true',
+                        help="Probe the wiki for every name instead of matching against "
+                             "the cached list of page titles")
+    args = parser.parse_args(argv)
     
-    # Step 2: Ask user if they want to update the original CSV
-    print("\nWould you like to update the original CSV file with the wiki metadata?")
-    print(f"This will update: {input_csv}")
-    response = input("Enter 'yes' to proceed, or press Enter to skip: ").strip().lower()
+    try:
+        thumbnail_widths = tuple(int(w) for w in args.thumbnail_widths.split(',') if w.strip())
+    except ValueError:
+        parser.error("--thumbnail-widths must be a comma-separated list of integers")
+    if not thumbnail_widths:
+        parser.error("--thumbnail-widths needs at least one width")
     
-    if response == 'yes':
-        update_original_csv(input_csv, output_csv)
-        print("✓ All done! The original CSV has been updated with wiki metadata.")
+    if args.all:
+        csv_names = find_gazetteers()
     else:
-        print(f"\nSkipped updating original CSV.")
-        print(f"You can manually update it later using the data in: {output_csv}")
+        csv_names = args.csv_files or ["empire.csv"]
+    
+    # Never block on input() in scheduled jobs
+    update = args.update or ('ask' if sys.stdin.isatty() else 'no')
+    
+    print("\n" + "="*70)
+    print("WARHAMMER FANDOM WIKI METADATA DOWNLOADER")
+    print("="*70)
+    
+    success = process_gazetteers(csv_names, update=update,
+                                 full_refresh=args.full,
+                                 max_age_days=args.max_age_days,
+                                 workers=args.workers,
+                                 thumbnail_widths=thumbnail_widths,
+                                 download_thumbnails=args.download_thumbnails,
+                                 resolve_titles=not args.no_title_index)
     
     print("\n" + "="*70)
     print("Process complete!")
     print("="*70 + "\n")
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
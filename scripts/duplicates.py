@@ -0,0 +1,80 @@
+"""
+Duplicate and near-duplicate settlement detection.
+
+Two checks run over every settlement occurrence of all factions, including
+repeats dropped during extraction:
+
+  - Names are folded with text_normalize.fold_name ("Bögenhafen" and
+    "Bogenhafen" are the same) and grouped in one dictionary pass.
+  - Points closer than NEAR_DUPLICATE_DISTANCE SVG units are found with a
+    spatial hash: a grid of cells as wide as the distance, where each point
+    is only compared with the points in its own and the eight neighbouring
+    cells. Points that close are usually a label pasted twice in Inkscape.
+
+Both stay linear in the number of settlements, unless a large share of them
+pile up in the same few cells.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from text_normalize import fold_name
+
+# Settlements closer than this, in SVG user units, are reported (about 1 km on the map)
+NEAR_DUPLICATE_DISTANCE = 0.5
+
+
+@dataclass
+class Occurrence:
+    """One settlement label on the map."""
+    faction: str
+    province: str
+    name: str
+    svg_x: float
+    svg_y: float
+
+
+def duplicate_name_groups(occurrences: Sequence[Occurrence]) -> List[Dict]:
+    """
+    Group occurrences by folded name.
+
+    Args:
+        occurrences: Every settlement occurrence of all factions
+
+    Returns:
+        {"folded", "occurrences", "settlements": [Occurrence]} per name used more than once,
+        sorted by folded name
+    """
+    groups: Dict[str, List[Occurrence]] = {}
+    for occurrence in occurrences:
+        groups.setdefault(fold_name(occurrence.name), []).append(occurrence)
+    return [{"folded": folded, "occurrences": len(group), "settlements": group}
+            for folded, group in sorted(groups.items()) if len(group) > 1]
+
+
+def near_coincident_pairs(occurrences: Sequence[Occurrence],
+                          distance: float = NEAR_DUPLICATE_DISTANCE) -> List[Tuple[Occurrence, Occurrence, float]]:
+    """
+    Pairs of occurrences closer than a distance, found with a spatial hash.
+
+    Args:
+        occurrences: Every settlement occurrence of all factions
+        distance: Maximum distance in SVG user units
+
+    Returns:
+        (first, second, distance) per pair, first in input order
+    """
+    cells: Dict[Tuple[int, int], List[int]] = {}
+    pairs = []
+    for i, occurrence in enumerate(occurrences):
+        cx, cy = int(math.floor(occurrence.svg_x / distance)), int(math.floor(occurrence.svg_y / distance))
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for j in cells.get((gx, gy), ()):
+                    other = occurrences[j]
+                    gap = math.hypot(occurrence.svg_x - other.svg_x, occurrence.svg_y - other.svg_y)
+                    if gap <= distance:
+                        pairs.append((other, occurrence, gap))
+        cells.setdefault((cx, cy), []).append(i)
+    return pairs
@@ -12,6 +12,8 @@ from typing import Dict, List
 import requests
 from bs4 import BeautifulSoup
 
+from gazetteer_io import rewrite_csv
+
 
 def get_article_description(page_title: str) -> str:
     """
@@ -105,6 +107,10 @@ def update_descriptions_for_csv(csv_file: str):
     """
     Update descriptions for settlements that already have wiki URLs.
     
+    The CSV is read twice as a stream: once to find rows that need a
+    description and once to write the updated rows to a temporary file that
+    atomically replaces the original.
+    
     Args:
         csv_file: Path to the CSV file to update
     """
@@ -112,20 +118,16 @@ def update_descriptions_for_csv(csv_file: str):
     print(f"Processing: {csv_file}")
     print(f"{'='*70}\n")
     
-    # Read the CSV
-    rows = []
+    # Find rows with a wiki_url but no description: (row_index, settlement, wiki_title)
     settlements_to_process = []
     
-    with open(csv_file, 'r', encoding='utf-8') as f:
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
         reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
         
-        for row in reader:
-            rows.append(row)
-            # Check if this settlement has a wiki_url but no description
+        for row_idx, row in enumerate(reader):
             if row.get('wiki_url') and row['wiki_url'].strip():
                 if not row.get('wiki_description') or not row['wiki_description'].strip():
-                    settlements_to_process.append((len(rows) - 1, row))
+                    settlements_to_process.append((row_idx, row['Settlement'], row['wiki_title']))
     
     total = len(settlements_to_process)
     print(f"Found {total} settlements with wiki URLs that need descriptions\n")
@@ -135,17 +137,15 @@ def update_descriptions_for_csv(csv_file: str):
         return
     
     # Process each settlement
-    for idx, (row_idx, row) in enumerate(settlements_to_process, 1):
-        settlement_name = row['Settlement']
-        wiki_title = row['wiki_title']
-        
+    descriptions = {}
+    for idx, (row_idx, settlement_name, wiki_title) in enumerate(settlements_to_process, 1):
         print(f"[{idx}/{total} - {(idx/total)*100:.1f}%] Processing: {settlement_name}...", end=' ')
         
         try:
             description = get_article_description(wiki_title)
             
             if description:
-                rows[row_idx]['wiki_description'] = description
+                descriptions[row_idx] = description
                 print(f"✓ Description extracted ({len(description)} chars)")
             else:
                 print(f"✗ No description found")
@@ -157,14 +157,20 @@ def update_descriptions_for_csv(csv_file: str):
         except Exception as e:
             print(f"✗ Error: {e}")
     
+    if not descriptions:
+        print("\nNo new descriptions, CSV left unchanged")
+        return
+    
     # Write updated CSV
-    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    def apply_description(row_idx: int, row: Dict[str, str]) -> Dict[str, str]:
+        if row_idx in descriptions:
+            row['wiki_description'] = descriptions[row_idx]
+        return row
+    
+    rewrite_csv(csv_file, apply_description)
     
     print(f"\n{'='*70}")
-    print(f"✓ Updated {csv_file}")
+    print(f"✓ Updated {csv_file} ({len(descriptions)} descriptions)")
     print(f"{'='*70}\n")
 
 
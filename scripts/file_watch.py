@@ -0,0 +1,84 @@
+"""
+Polling file watcher used by `process_map_svg.py --watch`.
+
+Polling modification times needs no extra dependency and behaves the same on
+every platform. Inkscape and spreadsheet programs often write a file in several
+steps (temporary file, rename, metadata update), so a change is only reported
+once the watched files have been quiet for a short debounce period.
+"""
+
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# (mtime in ns, size) of an existing file
+Signature = Tuple[int, int]
+
+
+class FileWatcher:
+    """Reports changed, added and removed files among watched paths."""
+
+    def __init__(self, files: Iterable[Path] = (), directories: Iterable[Tuple[Path, str]] = (),
+                 interval: float = 0.1, debounce: float = 0.25):
+        """
+        Args:
+            files: Individual files to watch (they may not exist yet)
+            directories: (directory, glob pattern) pairs, e.g. (input_dir, "*.csv")
+            interval: Seconds between polls
+            debounce: Seconds without further changes before changes are reported
+        """
+        self.files = [Path(path) for path in files]
+        self.directories = [(Path(directory), pattern) for directory, pattern in directories]
+        self.interval = interval
+        self.debounce = debounce
+        self.state = self.snapshot()
+
+    def snapshot(self) -> Dict[Path, Signature]:
+        """Current signature of every watched file that exists."""
+        paths = set(self.files)
+        for directory, pattern in self.directories:
+            if directory.is_dir():
+                paths.update(directory.glob(pattern))
+
+        state = {}
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def poll(self) -> Set[Path]:
+        """Files that changed since the previous poll."""
+        current = self.snapshot()
+        changed = {path for path in current.keys() | self.state.keys()
+                   if current.get(path) != self.state.get(path)}
+        self.state = current
+        return changed
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """
+        Block until files change and then stay unchanged for the debounce period.
+
+        Args:
+            timeout: Give up after this many seconds (None waits forever)
+
+        Returns:
+            Changed files (empty if the timeout expired)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed: Set[Path] = set()
+        quiet_since = None
+
+        while True:
+            new_changes = self.poll()
+            now = time.monotonic()
+            if new_changes:
+                changed |= new_changes
+                quiet_since = now
+            elif changed and now - quiet_since >= self.debounce:
+                return changed
+            if not changed and deadline is not None and now >= deadline:
+                return changed
+            time.sleep(self.interval)
@@ -0,0 +1,142 @@
+"""
+Safe, streaming rewrites of gazetteer CSV files.
+
+The gazetteers in input/gazetteers/ are the source data for the map build, so
+they are never rewritten in place. Rows are streamed into a temporary file in
+the same directory, which replaces the original with an atomic rename once
+every row has been written. A crash or Ctrl+C mid-write leaves the original
+file untouched.
+"""
+
+import csv
+import logging
+import os
+import shutil
+import tempfile
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def atomic_csv_writer(path: str, fieldnames: List[str]) -> Iterator[csv.DictWriter]:
+    """
+    Open a CSV DictWriter whose output replaces `path` only on success.
+
+    Args:
+        path: CSV file to create or replace
+        fieldnames: Column names, written as the header row
+
+    Yields:
+        csv.DictWriter writing to a temporary file next to `path`
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            yield writer
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Keep the original file's permissions
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def rewrite_csv(path: str, transform: Callable[[int, Dict[str, str]], Dict[str, str]]) -> int:
+    """
+    Stream every row of a CSV file through `transform` and replace it atomically.
+
+    Only one row is held in memory at a time.
+
+    Args:
+        path: CSV file to rewrite
+        transform: Called with (row_index, row); returns the row to write
+
+    Returns:
+        Number of rows written
+    """
+    count = 0
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        with atomic_csv_writer(path, reader.fieldnames) as writer:
+            for index, row in enumerate(reader):
+                writer.writerow(transform(index, row))
+                count += 1
+    return count
+
+
+def _copy_columns(row: Dict[str, str], metadata: Dict[str, str], column_map: Dict[str, str]):
+    """Copy the mapped metadata columns into a gazetteer row."""
+    for source, target in column_map.items():
+        row[target] = metadata[source]
+
+
+def merge_metadata_csv(original_csv: str, metadata_csv: str,
+                       column_map: Dict[str, str],
+                       key: str = 'Settlement', metadata_key: str = 'settlement') -> int:
+    """
+    Join a metadata CSV into a gazetteer row by row and replace it atomically.
+
+    Both files are read as streams. The metadata CSV is expected to follow the
+    gazetteer's row order (as written by download_wiki_metadata), possibly with
+    rows missing after an interrupted run. One metadata row is read ahead: a
+    gazetteer row whose key does not match it gets no metadata, so memory use
+    stays constant. If metadata rows are left over at the end, the file was
+    out of order; the gazetteer is then joined a second time through an index
+    of the whole metadata file.
+
+    Args:
+        original_csv: Gazetteer CSV to update
+        metadata_csv: CSV file with the new values
+        column_map: Metadata column -> gazetteer column to copy
+        key: Join column in the gazetteer
+        metadata_key: Join column in the metadata CSV
+
+    Returns:
+        Number of gazetteer rows that received metadata
+    """
+    updated = 0
+    with open(metadata_csv, 'r', encoding='utf-8', newline='') as meta_file:
+        metadata_rows = csv.DictReader(meta_file)
+        upcoming = next(metadata_rows, None)
+
+        def apply_in_order(index: int, row: Dict[str, str]) -> Dict[str, str]:
+            nonlocal updated, upcoming
+            if upcoming is not None and upcoming[metadata_key] == row[key]:
+                _copy_columns(row, upcoming, column_map)
+                updated += 1
+                upcoming = next(metadata_rows, None)
+            return row
+
+        rewrite_csv(original_csv, apply_in_order)
+        if upcoming is None:
+            return updated
+
+    logger.warning(f"{metadata_csv} does not follow the row order of {original_csv}, "
+                   f"joining through an index of all metadata rows")
+    by_key: Dict[str, Deque[Dict[str, str]]] = defaultdict(deque)
+    with open(metadata_csv, 'r', encoding='utf-8', newline='') as meta_file:
+        for metadata in csv.DictReader(meta_file):
+            by_key[metadata[metadata_key]].append(metadata)
+
+    updated = 0
+
+    def apply_indexed(index: int, row: Dict[str, str]) -> Dict[str, str]:
+        nonlocal updated
+        if by_key.get(row[key]):
+            _copy_columns(row, by_key[row[key]].popleft(), column_map)
+            updated += 1
+        return row
+
+    rewrite_csv(original_csv, apply_indexed)
+    return updated
@@ -0,0 +1,90 @@
+"""
+Zoom-level generalization of settlements.
+
+Every settlement gets the minimum web-map zoom level at which it is shown.
+Its size category sets the earliest possible zoom (cities before villages);
+a grid declutter pass then thins each zoom level so that at most one
+settlement label falls into each grid cell of roughly label size, pushing the
+others to the next zoom level. Larger and more populous settlements win.
+
+The cell grids of successive zoom levels nest (the cell size halves with
+every zoom step from a common origin), so a settlement visible at one zoom
+level never collides with another visible one at the next: once shown, a
+settlement stays visible at every higher zoom.
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+MIN_ZOOM = 4
+MAX_ZOOM = 10  # Every settlement is shown from here on
+
+# Earliest zoom level per size category (6: Metropolis ... 1: Village)
+SIZE_CATEGORY_MIN_ZOOM = {6: 4, 5: 5, 4: 6, 3: 7, 2: 8, 1: 9}
+
+# Grid cell edge in screen pixels, about the footprint of a settlement label
+DECLUTTER_CELL_PIXELS = 48
+
+# (lowest, highest) min_zoom of the settlements in each zoom band file
+ZOOM_BANDS = ((4, 5), (6, 7), (8, 9), (10, 10))
+
+_MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def world_xy(lon: float, lat: float) -> Tuple[float, float]:
+    """Web Mercator position in world units (0..1 across the whole map at zoom 0)."""
+    lat = max(min(lat, _MAX_MERCATOR_LATITUDE), -_MAX_MERCATOR_LATITUDE)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def assign_min_zooms(points: Sequence[Tuple[float, float, int, int]], min_zoom: int = MIN_ZOOM,
+                     max_zoom: int = MAX_ZOOM, cell_pixels: int = DECLUTTER_CELL_PIXELS) -> List[int]:
+    """
+    Minimum display zoom of every settlement.
+
+    Args:
+        points: (lon, lat, size_category, population) per settlement
+        min_zoom: Lowest zoom level of the map
+        max_zoom: Zoom level from which every settlement is shown
+        cell_pixels: Grid cell edge in screen pixels (256 px tiles)
+
+    Returns:
+        Minimum zoom per settlement, in input order
+    """
+    xy = [world_xy(lon, lat) for lon, lat, _, _ in points]
+    zooms = [min(max(min_zoom, SIZE_CATEGORY_MIN_ZOOM.get(size, max_zoom)), max_zoom)
+             for _, _, size, _ in points]
+    # Larger settlements first, then by population; input order breaks ties
+    order = sorted(range(len(points)), key=lambda i: (-points[i][2], -points[i][3], i))
+
+    visible: List[int] = []
+    for zoom in range(min_zoom, max_zoom):
+        cell = cell_pixels / (256 * 2 ** zoom)
+        occupied = {(int(xy[i][0] // cell), int(xy[i][1] // cell)) for i in visible}
+        shown = set(visible)
+        for i in order:
+            if zooms[i] > zoom or i in shown:
+                continue
+            key = (int(xy[i][0] // cell), int(xy[i][1] // cell))
+            if key in occupied:
+                zooms[i] = zoom + 1
+            else:
+                occupied.add(key)
+                visible.append(i)
+    return zooms
+
+
+def zoom_band(min_zoom: int) -> Optional[Tuple[int, int]]:
+    """The ZOOM_BANDS entry containing a min zoom, if any."""
+    for low, high in ZOOM_BANDS:
+        if low <= min_zoom <= high:
+            return low, high
+    return None
+
+
+def zoom_band_filename(low: int, high: int) -> str:
+    """GeoJSON file name of a zoom band, e.g. settlements_z4-5.geojson."""
+    return f"settlements_z{low}.geojson" if low == high else f"settlements_z{low}-{high}.geojson"
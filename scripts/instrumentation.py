@@ -0,0 +1,116 @@
+"""
+Per-stage timing and memory instrumentation for the map processing pipeline.
+
+Each stage records wall time, CPU time, the peak RSS of the process after the
+stage, optionally the peak Python allocation (tracemalloc) during the stage,
+and any element counts the stage reports. The results can be written into the
+processing report and as JSON, so runs on different map versions can be
+compared.
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class StageRecord:
+    """Measurements of one pipeline stage."""
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: Optional[int] = None
+    peak_traced_bytes: Optional[int] = None
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+class Instrumentation:
+    """Collects StageRecords for the stages of one run."""
+
+    def __init__(self, trace_memory: bool = False):
+        """
+        Args:
+            trace_memory: Track peak Python allocations per stage with tracemalloc
+                (accurate, but slows allocation-heavy stages down noticeably)
+        """
+        self.trace_memory = trace_memory
+        self.stages: List[StageRecord] = []
+        self.started = datetime.now(timezone.utc)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        """
+        Measure the enclosed block as one stage.
+
+        The yielded record's `counts` can be filled in by the block.
+        """
+        record = StageRecord(name=name)
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_bytes = peak_rss_bytes()
+            if self.trace_memory:
+                record.peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(record)
+
+    def report_lines(self) -> List[str]:
+        """Human-readable table of the recorded stages."""
+        lines = [f"{'Stage':30s} {'Wall (s)':>9s} {'CPU (s)':>9s} {'Peak RSS (MB)':>14s} {'Traced (MB)':>12s}  Counts"]
+        for record in self.stages:
+            rss = f"{record.peak_rss_bytes / 2**20:14.1f}" if record.peak_rss_bytes is not None else f"{'-':>14s}"
+            traced = f"{record.peak_traced_bytes / 2**20:12.1f}" if record.peak_traced_bytes is not None else f"{'-':>12s}"
+            counts = ", ".join(f"{key}={value:,d}" for key, value in record.counts.items())
+            lines.append(f"{record.name:30s} {record.wall_seconds:9.3f} {record.cpu_seconds:9.3f} {rss} {traced}  {counts}")
+        total_wall = sum(record.wall_seconds for record in self.stages)
+        total_cpu = sum(record.cpu_seconds for record in self.stages)
+        lines.append(f"{'Total':30s} {total_wall:9.3f} {total_cpu:9.3f}")
+        return lines
+
+    def to_dict(self) -> Dict:
+        """Machine-readable summary of the run."""
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "trace_memory": self.trace_memory,
+            "stages": [asdict(record) for record in self.stages],
+        }
+
+    def write_json(self, path: Path):
+        """Write the summary as JSON."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,152 @@
+"""
+Label collision detection, precomputed for every zoom level.
+
+Province, water and settlement labels are treated as screen-space boxes
+centred on their anchor point. The box size is estimated from the length of
+the name and the text height of the label's class (nation-state, sea,
+metropolis, ...). For each zoom level the labels are placed in priority order
+and a label is hidden if its box overlaps one already placed; a uniform grid
+over screen space finds the candidate overlaps.
+
+Labels placed at one zoom level are placed first at the next one. Their
+centres move apart when zooming in while the boxes keep their pixel size, so
+they still fit: a label, once shown, stays visible up to the maximum zoom of
+its class. The result per label is its priority rank and its visibility range.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from generalize import MAX_ZOOM, MIN_ZOOM, world_xy
+
+# Average glyph width relative to the text height
+CHAR_WIDTH = 0.6
+# Blank margin around each label box, in pixels
+LABEL_PADDING = 2.0
+# Edge of the collision grid cells, in pixels
+GRID_CELL_PIXELS = 128
+
+# Label classes: (text height in px, first zoom, last zoom, base priority)
+PROVINCE_LABEL_CLASSES = {
+    "Nation-State": (20, 4, 7, 900),
+    "Grand-Province": (16, 5, 8, 800),
+    "Province": (14, 6, 9, 700),
+}
+WATER_LABEL_CLASSES = {
+    "Ocean": (20, 4, 8, 850),
+    "Major Sea": (18, 4, 9, 750),
+    "Large Sea": (16, 5, 10, 650),
+    "Medium Sea": (14, 6, 10, 550),
+    "Small Sea": (12, 7, 10, 450),
+    "Large Marsh": (12, 7, 10, 400),
+    "Small Marsh": (11, 8, 10, 350),
+    "Lake": (11, 8, 10, 350),
+}
+# Settlements: text height by size category; shown from their min_zoom, priority 100 per category
+SETTLEMENT_TEXT_HEIGHT = {6: 16, 5: 15, 4: 13, 3: 12, 2: 11, 1: 10}
+
+Box = Tuple[float, float, float, float]  # (left, top, right, bottom) in pixels
+
+
+@dataclass
+class LabelCandidate:
+    """A label to place."""
+    lon: float
+    lat: float
+    text: str
+    height: float
+    min_zoom: int
+    max_zoom: int
+    priority: float
+
+
+@dataclass
+class LabelPlacement:
+    """Where a label ends up: its rank (1 = placed first) and the zooms it is visible at."""
+    priority: int
+    min_zoom: Optional[int] = None
+    max_zoom: Optional[int] = None
+
+
+def label_size(text: str, height: float) -> Tuple[float, float]:
+    """Estimated (width, height) of a label box in pixels, padding included."""
+    return (len(text) * height * CHAR_WIDTH + 2 * LABEL_PADDING, height * 1.2 + 2 * LABEL_PADDING)
+
+
+class LabelGrid:
+    """Uniform grid of placed label boxes for overlap queries."""
+
+    def __init__(self, cell: float = GRID_CELL_PIXELS):
+        """
+        Args:
+            cell: Edge of a grid cell in pixels
+        """
+        self.cell = cell
+        self.cells: Dict[Tuple[int, int], List[Box]] = {}
+
+    def _keys(self, box: Box):
+        """Grid cells a box overlaps."""
+        cell = self.cell
+        for gx in range(int(box[0] // cell), int(box[2] // cell) + 1):
+            for gy in range(int(box[1] // cell), int(box[3] // cell) + 1):
+                yield gx, gy
+
+    def collides(self, box: Box) -> bool:
+        """Whether a box overlaps any placed box."""
+        left, top, right, bottom = box
+        for key in self._keys(box):
+            for other in self.cells.get(key, ()):
+                if left < other[2] and other[0] < right and top < other[3] and other[1] < bottom:
+                    return True
+        return False
+
+    def insert(self, box: Box):
+        """Add a placed box."""
+        for key in self._keys(box):
+            self.cells.setdefault(key, []).append(box)
+
+
+def place_labels(candidates: Sequence[LabelCandidate], min_zoom: int = MIN_ZOOM,
+                 max_zoom: int = MAX_ZOOM) -> List[LabelPlacement]:
+    """
+    Resolve label collisions at every zoom level.
+
+    Args:
+        candidates: Labels of all classes together
+        min_zoom: Lowest zoom level of the map
+        max_zoom: Highest zoom level of the map
+
+    Returns:
+        Placement per candidate, in input order (min_zoom None: never shown)
+    """
+    order = sorted(range(len(candidates)), key=lambda i: (-candidates[i].priority, i))
+    placements = [LabelPlacement(priority=rank) for rank in range(len(candidates))]
+    for rank, i in enumerate(order, start=1):
+        placements[i].priority = rank
+
+    xy = [world_xy(c.lon, c.lat) for c in candidates]
+    sizes = [label_size(c.text, c.height) for c in candidates]
+
+    visible: List[int] = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        scale = 256 * 2 ** zoom
+        grid = LabelGrid()
+        placed = []
+        # Still in range from the previous zoom first (they cannot collide), then by priority
+        still_visible = [i for i in visible if candidates[i].max_zoom >= zoom]
+        shown = set(still_visible)
+        for i in still_visible + [i for i in order if i not in shown]:
+            candidate = candidates[i]
+            if not candidate.min_zoom <= zoom <= candidate.max_zoom:
+                continue
+            x, y = xy[i][0] * scale, xy[i][1] * scale
+            width, height = sizes[i]
+            box = (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+            if i in shown or not grid.collides(box):
+                grid.insert(box)
+                placed.append(i)
+                if placements[i].min_zoom is None:
+                    placements[i].min_zoom = zoom
+                placements[i].max_zoom = zoom
+        visible = placed
+    return placements
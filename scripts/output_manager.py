@@ -0,0 +1,213 @@
+"""
+Content-addressed writing of generated files.
+
+Every artifact is serialized in memory first and compared by SHA-256 with the
+file already on disk; only files whose bytes differ are (atomically) rewritten,
+so an unchanged map leaves the output directory untouched. A manifest of the
+hashes and sizes of all artifacts lets deploy and sync scripts upload, and
+invalidate, just the files that changed.
+
+Artifacts can also get precompressed .gz and .br siblings for static hosting.
+Both are deterministic (no timestamp in the gzip header), so unchanged input
+gives unchanged siblings. Brotli needs the optional `brotli` package.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+OUTPUT_MANIFEST_NAME = "manifest.json"
+
+# Precompressed sibling formats (file extension appended to the artifact name)
+COMPRESSION_FORMATS = ("gz", "br")
+
+
+def brotli_available() -> bool:
+    """Whether the optional brotli package can be imported."""
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    """
+    Compress data at maximum compression.
+
+    Args:
+        data: Bytes to compress
+        compression: "gz" or "br"
+    """
+    if compression == "gz":
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if compression == "br":
+        import brotli
+        return brotli.compress(data, quality=11)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def file_sha256(path: Path) -> Optional[str]:
+    """SHA-256 of a file's contents, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _replace_if_changed(path: Path, data: bytes, digest: str) -> bool:
+    """Write data to path unless the file already holds exactly these bytes. Returns True if written."""
+    try:
+        same_size = path.stat().st_size == len(data)
+    except OSError:
+        same_size = False
+    if same_size and file_sha256(path) == digest:
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique per process: forked output workers write concurrently
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+    return True
+
+
+class OutputManager:
+    """Writes the artifacts of one directory, skipping files whose content is unchanged."""
+
+    def __init__(self, directory: Path, manifest_name: Optional[str] = OUTPUT_MANIFEST_NAME):
+        """
+        Args:
+            directory: Directory the artifacts are written to
+            manifest_name: File name of the manifest in `directory` (None for no manifest)
+        """
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / manifest_name if manifest_name else None
+        self.manifest = self._load_manifest()
+        self.written: List[str] = []
+        self.unchanged: List[str] = []
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        """Entries of the existing manifest: {name: {"sha256", "bytes"}}."""
+        if self.manifest_path is None or not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def write_bytes(self, name: str, data: bytes) -> Path:
+        """
+        Write an artifact if its content differs from the file on disk.
+
+        Args:
+            name: Path relative to the directory
+            data: Complete file content
+
+        Returns:
+            Path of the artifact
+        """
+        path = self.directory / name
+        digest = hashlib.sha256(data).hexdigest()
+        if _replace_if_changed(path, data, digest):
+            self.written.append(name)
+        else:
+            self.unchanged.append(name)
+        self.manifest[name] = {"sha256": digest, "bytes": len(data)}
+        return path
+
+    def write_text(self, name: str, text: str) -> Path:
+        """Write a UTF-8 text artifact if its content changed."""
+        return self.write_bytes(name, text.encode('utf-8'))
+
+    @contextmanager
+    def open(self, name: str) -> Iterator[io.StringIO]:
+        """Text buffer that is written with write_text() when the block ends without error."""
+        buffer = io.StringIO()
+        yield buffer
+        self.write_text(name, buffer.getvalue())
+
+    def write_compressed(self, names: Iterable[str], formats: Iterable[str], jobs: int = 4) -> List[str]:
+        """
+        Write precompressed siblings (name.gz, name.br) of artifacts, in parallel.
+
+        Siblings of artifacts that were not rewritten in this run are kept as
+        they are, unless they are missing. Siblings of rewritten artifacts in
+        formats that were not requested are deleted, as they would be stale.
+        zlib and brotli release the GIL, so threads compress several files at once.
+
+        Args:
+            names: Artifacts in the directory to compress
+            formats: Formats from COMPRESSION_FORMATS
+            jobs: Number of files compressed concurrently
+
+        Returns:
+            Names of the siblings that were compressed
+        """
+        written = set(self.written)
+        formats = tuple(formats)
+        tasks = []
+        for name in names:
+            for compression in COMPRESSION_FORMATS:
+                sibling = f"{name}.{compression}"
+                if compression not in formats:
+                    if name in written and (self.directory / sibling).exists():
+                        (self.directory / sibling).unlink()
+                        self.manifest.pop(sibling, None)
+                elif name in written or sibling not in self.manifest or not (self.directory / sibling).exists():
+                    tasks.append((name, sibling, compression))
+
+        def run(task):
+            name, sibling, compression = task
+            self.write_bytes(sibling, compress((self.directory / name).read_bytes(), compression))
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            list(executor.map(run, tasks))
+        return [sibling for _, sibling, _ in tasks]
+
+    def clear_results(self):
+        """Forget which files were written or unchanged (the manifest is kept)."""
+        self.written = []
+        self.unchanged = []
+
+    def results(self) -> Dict:
+        """Files handled since the last clear_results(), with their manifest entries."""
+        names = self.written + self.unchanged
+        return {
+            "written": list(self.written),
+            "unchanged": list(self.unchanged),
+            "files": {name: self.manifest[name] for name in names},
+        }
+
+    def merge(self, results: Dict):
+        """Add the results() of a manager that wrote into the same directory (e.g. in a worker process)."""
+        self.written.extend(results["written"])
+        self.unchanged.extend(results["unchanged"])
+        self.manifest.update(results["files"])
+
+    def save_manifest(self) -> Optional[Path]:
+        """
+        Write the manifest, dropping entries whose file no longer exists.
+
+        The manifest goes through the same comparison, so a run that changed
+        nothing does not touch it either.
+        """
+        if self.manifest_path is None:
+            return None
+        self.manifest = {name: entry for name, entry in sorted(self.manifest.items())
+                         if (self.directory / name).exists()}
+        data = (json.dumps({"files": self.manifest}, indent=2) + "\n").encode('utf-8')
+        _replace_if_changed(self.manifest_path, data, hashlib.sha256(data).hexdigest())
+        return self.manifest_path
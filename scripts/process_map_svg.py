@@ -1,20 +1,52 @@
 """
 Comprehensive SVG map processing tool for the Old World Atlas.
 Extracts settlements, points of interest, and labels from the FULL_MAP_CLEANED.svg file.
+
+NumPy (and svg_transform, which is built on it) is imported inside the
+methods that place coordinates, and the profiler and process pool only when
+--profile or --jobs ask for them, so importing this module, --help,
+--list-stages and tools that only need the dataclasses or the gazetteer
+loader start quickly (see benchmark_startup.py).
 """
 
+from __future__ import annotations
+
+import argparse
 import json
 import csv
 import logging
+import math
+import os
+import random
 import re
+import sys
+import time
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from functools import cached_property
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple, Optional
 from xml.etree import ElementTree as ET
 from dataclasses import dataclass, asdict
 from collections import defaultdict
-import numpy as np
-from scipy.interpolate import CubicSpline
-import random
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: fall back to the built-in faction list
+    tomllib = None
+
+from duplicates import Occurrence, duplicate_name_groups, near_coincident_pairs
+from file_watch import FileWatcher
+from generalize import MAX_ZOOM, ZOOM_BANDS, assign_min_zooms, zoom_band, zoom_band_filename
+from instrumentation import Instrumentation
+from label_placement import (PROVINCE_LABEL_CLASSES, SETTLEMENT_TEXT_HEIGHT, WATER_LABEL_CLASSES,
+                             LabelCandidate, place_labels)
+from output_manager import COMPRESSION_FORMATS, OutputManager, brotli_available
+from search_index import SEARCH_INDEX_NAME, build_search_index
+from tag_index import TAG_INDEX_NAME, build_tag_index, export_tag_index, settlement_key
+from svg_walker import TAG_PATH, TAG_TEXT, LayerRoute, LayerWalker, text_label
+from wiki_images import MANIFEST_NAME, load_thumbnail_index
+
+if TYPE_CHECKING:
+    import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -25,6 +57,15 @@ SVG_PATH = Path(__file__).parent.parent.parent / "oldworldatlas-maps" / "FULL_MA
 INPUT_DIR = Path(__file__).parent.parent / "input" / "gazetteers"
 OUTPUT_DIR = Path(__file__).parent.parent / "output"
 LOGS_DIR = Path(__file__).parent.parent / "logs"
+PROFILE_JSON = LOGS_DIR / "processing_profile.json"
+CPROFILE_OUTPUT = LOGS_DIR / "process_map_svg.prof"
+FACTIONS_CONFIG = Path(__file__).parent.parent / "input" / "factions.toml"
+
+# Preferred width of the locally cached wiki thumbnails used for wiki.image
+WIKI_THUMBNAIL_WIDTH = 320
+
+# Populations given to settlements without gazetteer data, kept next to the gazetteers
+POPULATION_STORE_NAME = "assigned_populations.json"
 
 # Calibration points for coordinate conversion
 CALIBRATION_POINTS = [
@@ -35,11 +76,64 @@ CALIBRATION_POINTS = [
     {"svg": (891.383, 479.367), "geo": (8.100, 50.219), "settlement": "Waldenhof (Stirland)", "province": "Stirland"},
 ]
 
-NS = {
-    'svg': 'http://www.w3.org/2000/svg',
-    'inkscape': 'http://www.inkscape.org/namespaces/inkscape'
+# Layers extracted by main(), in one traversal of the SVG
+EXTRACTED_LAYERS = ("settlements", "points_of_interest", "province_labels", "water_labels")
+
+# Epochs of the gazetteers (Province_<epoch>, Ruler_<epoch> columns). The base epoch is the
+# one drawn on the map; the older ones, newest first, are written as differences from it.
+BASE_EPOCH = "2515"
+HISTORICAL_EPOCHS = ("2512", "2276")
+EPOCH_COLUMNS = {"province": "Province", "ruler": "Ruler"}
+
+# Generated files that get precompressed siblings with --compress
+COMPRESSED_SUFFIXES = (".geojson", ".json")
+
+# Accepted values of source:<value> settlement tags
+VALID_SOURCES = frozenset({"AndyLaw", "2eSH", "4eAotE1", "4eEiS", "4ePBtTC", "4eSCoSaS",
+                           "4eCRB", "4eDotRC", "NCC", "WFB8e", "AmbChron", "G&FT", "TOW", "1eMSDtR"})
+
+# Sub-layer label -> feature type
+POI_TYPES = {
+    "Other": "Other",
+    "City Districts": "City Districts",
+    "Forts and Castles": "Forts and Castles",
+    "Monastaries and Temples": "Monasteries and Temples",
+    "Taverns and Inns": "Taverns and Inns"
 }
 
+ROAD_TYPES = {
+    "Imperial Highways": "Imperial Highways",
+    "Roads": "Roads",
+    "Paths": "Paths"
+}
+
+PROVINCE_LABEL_TYPES = {
+    "Nation-States": "Nation-State",
+    "Grand-Provinces": "Grand-Province",
+    "Provinces": "Province"
+}
+
+WATERBODY_TYPES = {
+    "ocean": "Ocean",
+    "major-sea": "Major Sea",
+    "large-sea": "Large Sea",
+    "medium-sea": "Medium Sea",
+    "small-sea": "Small Sea",
+    "small-marsh": "Small Marsh",
+    "large-marsh": "Large Marsh",
+    "lakes": "Lake"
+}
+
+
+def empty_wiki() -> Dict:
+    """Wiki properties of a settlement without wiki data."""
+    return {
+        "title": None,
+        "url": None,
+        "description": None,
+        "image": None
+    }
+
 
 @dataclass
 class Settlement:
@@ -55,19 +149,69 @@ class Settlement:
     tags: List[str] = None
     notes: List[str] = None
     wiki: Dict = None
+    min_zoom: Optional[int] = None  # Set by generalize_settlements()
+    # Set by place_labels(): rank and zoom range at which the name label is shown
+    label_priority: Optional[int] = None
+    label_min_zoom: Optional[int] = None
+    label_max_zoom: Optional[int] = None
+    # Set by populate_settlement_data(): {epoch: {"province": ..., "ruler": ...}}
+    epochs: Dict[str, Dict[str, Optional[str]]] = None
 
     def __post_init__(self):
+        if self.epochs is None:
+            self.epochs = {}
         if self.tags is None:
             self.tags = []
         if self.notes is None:
             self.notes = []
         if self.wiki is None:
-            self.wiki = {
-                "title": None,
-                "url": None,
-                "description": None,
-                "image": None
-            }
+            self.wiki = empty_wiki()
+
+
+@dataclass
+class FactionConfig:
+    """A faction sub-layer of the Settlements layer, its gazetteer and its output file."""
+    layer: str
+    gazetteer: str
+    output: str
+    provinces_from_layers: bool = False
+    province: str = ""
+    province_column: str = ""
+
+    def __post_init__(self):
+        if not self.province:
+            self.province = self.layer
+
+
+# Used when input/factions.toml is missing or cannot be read
+DEFAULT_FACTIONS = [
+    FactionConfig(layer="Empire", gazetteer="empire.csv", output="empire_settlements.geojson",
+                  provinces_from_layers=True, province_column="Province_2515"),
+    FactionConfig(layer="Westerland", gazetteer="westerland.csv", output="westerland_settlements.geojson"),
+]
+
+
+def load_faction_config(config_path: Optional[Path] = None) -> Dict[str, FactionConfig]:
+    """Load the faction layer configuration (default: FACTIONS_CONFIG), keyed by layer label."""
+    config_path = Path(config_path or FACTIONS_CONFIG)
+    if not config_path.exists():
+        logger.warning(f"{config_path} not found, using built-in faction list")
+        return {faction.layer: faction for faction in DEFAULT_FACTIONS}
+    if tomllib is None:
+        logger.warning(f"tomllib not available, ignoring {config_path} and using built-in faction list")
+        return {faction.layer: faction for faction in DEFAULT_FACTIONS}
+
+    with open(config_path, 'rb') as f:
+        data = tomllib.load(f)
+
+    factions = {}
+    for entry in data.get("faction", []):
+        try:
+            faction = FactionConfig(**entry)
+        except TypeError as e:
+            raise ValueError(f"Invalid faction entry in {config_path}: {e}") from e
+        factions[faction.layer] = faction
+    return factions
 
 
 @dataclass
@@ -105,6 +249,9 @@ class ProvinceLabel:
     geo_lat: float = 0.0
     formal_title: str = ""
     part_of: str = ""
+    label_priority: Optional[int] = None
+    label_min_zoom: Optional[int] = None
+    label_max_zoom: Optional[int] = None
 
 
 @dataclass
@@ -116,6 +263,9 @@ class WaterLabel:
     svg_y: float
     geo_lon: float = 0.0
     geo_lat: float = 0.0
+    label_priority: Optional[int] = None
+    label_min_zoom: Optional[int] = None
+    label_max_zoom: Optional[int] = None
 
 
 class CoordinateConverter:
@@ -128,6 +278,8 @@ class CoordinateConverter:
 
     def _calculate_transformation(self):
         """Calculate affine transformation parameters from calibration points."""
+        import numpy as np
+
         svg_coords = np.array([p["svg"] for p in self.calibration_points])
         geo_coords = np.array([p["geo"] for p in self.calibration_points])
 
@@ -146,28 +298,55 @@ class CoordinateConverter:
         lat = self.lat_coeffs[0] * svg_x + self.lat_coeffs[1] * svg_y + self.lat_coeffs[2]
         return (lon, lat)
 
+    def svg_to_geo_array(self, points: np.ndarray) -> np.ndarray:
+        """Convert an (N, 2) array of SVG coordinates to (N, 2) longitude/latitude."""
+        import numpy as np
+
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        coeffs = np.column_stack([self.lon_coeffs, self.lat_coeffs])
+        return points @ coeffs[:2] + coeffs[2]
+
     def validate_calibration(self):
         """Validate the transformation against calibration points."""
         logger.info("Validating coordinate transformation:")
         for point in self.calibration_points:
             calc_geo = self.svg_to_geo(point["svg"][0], point["svg"][1])
             expected_geo = point["geo"]
-            error = np.sqrt((calc_geo[0] - expected_geo[0])**2 + (calc_geo[1] - expected_geo[1])**2)
+            error = math.hypot(calc_geo[0] - expected_geo[0], calc_geo[1] - expected_geo[1])
             logger.info(f"  {point['settlement']}: Calculated {calc_geo}, Expected {expected_geo}, Error: {error:.6f}")
 
 
 class SVGMapProcessor:
     """Processes the SVG map file."""
 
-    def __init__(self):
-        """Initialize processor."""
-        self.tree = ET.parse(str(SVG_PATH))
+    def __init__(self, svg_path: Optional[Path] = None, input_dir: Optional[Path] = None,
+                 output_dir: Optional[Path] = None, logs_dir: Optional[Path] = None,
+                 factions_config: Optional[Path] = None, compress_formats: Iterable[str] = ()):
+        """
+        Initialize processor.
+
+        Paths default to the module constants (SVG_PATH, INPUT_DIR, OUTPUT_DIR,
+        LOGS_DIR, FACTIONS_CONFIG). compress_formats ("gz", "br") selects the
+        precompressed siblings written next to each GeoJSON file.
+        """
+        self.svg_path = Path(svg_path or SVG_PATH)
+        self.input_dir = Path(input_dir or INPUT_DIR)
+        self.population_store = self.input_dir / POPULATION_STORE_NAME
+        self.output_dir = Path(output_dir or OUTPUT_DIR)
+        self.logs_dir = Path(logs_dir or LOGS_DIR)
+        # Files are only rewritten when their content changed; outputs get a manifest
+        self.outputs = OutputManager(self.output_dir)
+        self.log_files = OutputManager(self.logs_dir, manifest_name=None)
+        self.compress_formats = tuple(compress_formats)
+        if "br" in self.compress_formats and not brotli_available():
+            logger.warning("brotli is not installed, skipping .br files (pip install brotli)")
+            self.compress_formats = tuple(f for f in self.compress_formats if f != "br")
+
+        self.tree = ET.parse(str(self.svg_path))
         self.root = self.tree.getroot()
-        self.converter = CoordinateConverter(CALIBRATION_POINTS)
-        self.converter.validate_calibration()
 
-        self.settlements_empire = []
-        self.settlements_westerland = []
+        self.factions = load_faction_config(factions_config)
+        self.settlements_by_faction = {layer: [] for layer in self.factions}
         self.points_of_interest = []
         self.roads = []
         self.province_labels = []
@@ -175,51 +354,80 @@ class SVGMapProcessor:
 
         self.invalid_settlements = []
         self.duplicate_settlements = defaultdict(list)
+
+        # Gazetteer rows, loaded once per faction: {faction: {province or None: {name: row_data}}}
+        self._gazetteers = {}
+        self.reset_gazetteer_join()
+
+        # Layer label -> seconds spent extracting its elements
+        self.layer_timings = {}
+        self.elements_walked = 0
+
+        # Set by main() to include per-stage timings in the report
+        self.instrumentation: Optional[Instrumentation] = None
+
+        # Original wiki image URL -> cached thumbnail path (see wiki_images.py)
+        self.thumbnail_index = {}
+
+    def reset_gazetteer_join(self, factions: Optional[Iterable[str]] = None):
+        """
+        Forget loaded gazetteers and the results of joining them, so
+        populate_settlement_data() can run again after a CSV changed.
+
+        Args:
+            factions: Factions whose gazetteers changed (default: all)
+        """
+        for faction in (list(self._gazetteers) if factions is None else factions):
+            self._gazetteers.pop(faction, None)
+
         self.missing_population_data = defaultdict(list)
-        
-        # Track CSV data
-        self.csv_data_empire = {}  # {province: {name: row_data}}
-        self.csv_data_westerland = {}  # {name: row_data}
-        
+        self.assigned_populations = {}  # {province: {name: population}}, see _assign_random_population
+        self.stored_populations = {}  # The population store as written by the previous run
+
         # Track validation issues
         self.csv_settlements_not_in_svg = defaultdict(list)  # {province: [names]}
         self.province_mismatches = []  # List of {settlement, province_svg, province_csv}
         self.invalid_tags = []  # List of {settlement, tags, issues}
-
-    def _get_text_element_label(self, elem) -> Optional[str]:
-        """Extract text from text/tspan elements."""
-        text_content = []
-        
-        # Check if it's a text element directly
-        if elem.tag == f"{{{NS['svg']}}}text":
-            # Look for tspan children
-            for tspan in elem.findall(f"{{{NS['svg']}}}tspan"):
-                if tspan.text:
-                    text_content.append(tspan.text.strip())
-            # If no tspan, check text directly
-            if not text_content and elem.text:
-                text_content.append(elem.text.strip())
-        
-        return " ".join(text_content) if text_content else None
-
-    def _apply_svg_transform(self, x: float, y: float, transform: str) -> Tuple[float, float]:
-        """Apply SVG transform attribute to coordinates. Currently supports translate only."""
-        if not transform:
-            return (x, y)
-        
-        # Parse translate(x, y) or translate(x y)
-        translate_match = re.search(r'translate\s*\(\s*([-\d.]+)\s*[,\s]\s*([-\d.]+)\s*\)', transform)
-        if translate_match:
-            tx = float(translate_match.group(1))
-            ty = float(translate_match.group(2))
-            return (x + tx, y + ty)
-        
-        return (x, y)
+        self.tag_index = {}  # {tag: [settlement keys]}, see generate_tag_index
+
+    @cached_property
+    def converter(self) -> CoordinateConverter:
+        """SVG -> geographic converter, fitted when the first coordinates are placed."""
+        converter = CoordinateConverter(CALIBRATION_POINTS)
+        converter.validate_calibration()
+        return converter
+
+    @property
+    def settlements_empire(self) -> List[Settlement]:
+        """Settlements of the Empire faction."""
+        return self.settlements_by_faction.setdefault("Empire", [])
+
+    @property
+    def settlements_westerland(self) -> List[Settlement]:
+        """Settlements of the Westerland faction."""
+        return self.settlements_by_faction.setdefault("Westerland", [])
+
+    def _place_points(self, pending: List[Tuple]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Map pending (..., x, y, ctm) entries to document and geographic coordinates.
+
+        Returns:
+            (svg_points, geo_points), both arrays of shape (N, 2)
+        """
+        import numpy as np
+        from svg_transform import apply_transforms
+
+        if not pending:
+            empty = np.empty((0, 2))
+            return empty, empty
+        local = np.array([(entry[-3], entry[-2]) for entry in pending], dtype=float)
+        svg_points = apply_transforms([entry[-1] for entry in pending], local)
+        return svg_points, self.converter.svg_to_geo_array(svg_points)
 
     def _validate_settlement_element(self, elem, province: str) -> Optional[Tuple[str, float, float]]:
         """Validate that element is a textbox with valid coordinates and return (name, x, y)."""
         # Check if it's a text element
-        if elem.tag != f"{{{NS['svg']}}}text":
+        if elem.tag != TAG_TEXT:
             self.invalid_settlements.append({
                 "province": province,
                 "element": elem.tag,
@@ -229,7 +437,7 @@ class SVGMapProcessor:
             return None
 
         # Get text content
-        name = self._get_text_element_label(elem)
+        name = text_label(elem)
         if not name:
             self.invalid_settlements.append({
                 "province": province,
@@ -254,124 +462,156 @@ class SVGMapProcessor:
             })
             return None
 
-    def _process_settlement_elements(self, parent_elem, province_name: str, settlements_dict: dict, settlements_list: list):
-        """Recursively process settlement elements, handling nested layers (like Reikland estates)."""
-        for elem in parent_elem:
-            # Check if this is a layer/group
-            if elem.tag == f"{{{NS['svg']}}}g":
-                # Recursively process children of this layer
-                self._process_settlement_elements(elem, province_name, settlements_dict, settlements_list)
-            else:
-                # Process as settlement element
-                result = self._validate_settlement_element(elem, province_name)
-                if result:
-                    name, svg_x, svg_y = result
-                    
-                    # Check for duplicates
-                    if name in settlements_dict:
-                        self.duplicate_settlements[province_name].append({
-                            "name": name,
-                            "occurrences": 2,
-                            "coordinates": [settlements_dict[name], (svg_x, svg_y)]
-                        })
-                    else:
-                        settlements_dict[name] = (svg_x, svg_y)
-
-                        # Convert coordinates
-                        geo_lon, geo_lat = self.converter.svg_to_geo(svg_x, svg_y)
+    def _walk(self, routes: List[LayerRoute]):
+        """Run one traversal of the SVG for the given layer routes."""
+        walker = LayerWalker(self.root)
+        for route in routes:
+            walker.add(route)
+        for route in walker.walk():
+            logger.error(f"{route.label} layer not found!")
+        for route in routes:
+            if route.matched:
+                self.layer_timings[route.label] = route.seconds
+                logger.info(f"  {route.label}: {route.elements} elements in {route.seconds * 1000:.1f} ms")
+        self.elements_walked += walker.visited
+        logger.info(f"  Walked {walker.visited} SVG elements in {walker.seconds * 1000:.1f} ms")
+
+    def feature_counts(self) -> Dict[str, int]:
+        """Number of extracted features per layer."""
+        return {
+            "settlements": sum(len(settlements) for settlements in self.settlements_by_faction.values()),
+            "points_of_interest": len(self.points_of_interest),
+            "roads": len(self.roads),
+            "province_labels": len(self.province_labels),
+            "water_labels": len(self.water_labels),
+        }
 
-                        settlement = Settlement(
-                            name=name,
-                            province=province_name,
-                            svg_x=svg_x,
-                            svg_y=svg_y,
-                            geo_lon=geo_lon,
-                            geo_lat=geo_lat
-                        )
-                        settlements_list.append(settlement)
+    def extract_layers(self, layers: Iterable[str] = EXTRACTED_LAYERS):
+        """Extract several map layers in a single traversal of the SVG."""
+        builders = {
+            "settlements": self._settlement_route,
+            "points_of_interest": self._poi_route,
+            "roads": self._road_route,
+            "province_labels": self._province_label_route,
+            "water_labels": self._water_label_route,
+        }
+        self._walk([builders[layer]() for layer in layers])
+
+    def _text_label_handler(self, group_for_path: Callable[[Tuple], Optional[str]], pending: Dict[str, list]):
+        """Handler collecting (name, x, y, ctm) of text labels, keyed by group_for_path(label_path)."""
+        from svg_transform import compose
+
+        def handle(elem, path, ctm):
+            group = group_for_path(path)
+            if group is None:
+                return
+            name = text_label(elem)
+            if not name:
+                return
+            try:
+                svg_x = float(elem.get("x", 0))
+                svg_y = float(elem.get("y", 0))
+            except (ValueError, TypeError):
+                return
+            pending.setdefault(group, []).append((name, svg_x, svg_y, compose(ctm, elem.get("transform", ""))))
+        return handle
+
+    def _settlement_route(self, factions: Optional[Iterable[str]] = None) -> LayerRoute:
+        """
+        Route for the Settlements layer, covering every configured faction at once.
+
+        Factions with provinces_from_layers take the province from the label below
+        the faction (Settlements/Empire/<province>/...); every other faction is a
+        single province. Nested sub-layers such as the Reikland estates are flattened.
+        """
+        from svg_transform import compose
+
+        selected = {layer: self.factions[layer] for layer in (self.factions if factions is None else factions)}
+        pending = {}  # (faction, province) -> [(name, x, y, ctm)]
+
+        def handle(elem, path, ctm):
+            faction = selected.get(path[0]) if path else None
+            if faction is None:
+                return
+            if faction.provinces_from_layers:
+                if len(path) < 2 or not path[1]:
+                    return
+                province = path[1]
+            else:
+                province = faction.province
+
+            entries = pending.setdefault((faction.layer, province), [])
+            result = self._validate_settlement_element(elem, province)
+            if result:
+                name, svg_x, svg_y = result
+                entries.append((name, svg_x, svg_y, compose(ctm, elem.get("transform", ""))))
+
+        def finish():
+            for layer, faction in selected.items():
+                settlements_list = self.settlements_by_faction.setdefault(layer, [])
+                provinces = [(province, entries) for (f, province), entries in pending.items() if f == layer]
+                if not provinces:
+                    logger.warning(f"  No {layer} settlements found")
+                    continue
+
+                for province, entries in provinces:
+                    if faction.provinces_from_layers:
+                        logger.info(f"  Processing province: {province}")
+                    self._add_settlements(entries, province, {}, settlements_list)
+
+                if faction.provinces_from_layers:
+                    logger.info(f"  Found {len(settlements_list)} valid {layer} settlements "
+                                f"across {len(provinces)} provinces")
+                else:
+                    logger.info(f"  Found {len(settlements_list)} valid {layer} settlements")
+
+        return LayerRoute("Settlements", default=handle, on_finish=finish)
+
+    def _add_settlements(self, pending: list, province_name: str, settlements_dict: dict, settlements_list: list):
+        """Place collected settlements in one batch and add them, recording duplicates."""
+        svg_points, geo_points = self._place_points(pending)
+        for (name, _, _, _), (svg_x, svg_y), (geo_lon, geo_lat) in zip(pending, svg_points, geo_points):
+            svg_x, svg_y = float(svg_x), float(svg_y)
+
+            # Check for duplicates: the first occurrence is kept, the record counts all of them
+            if name in settlements_dict:
+                duplicate = settlements_dict[name]
+                duplicate["occurrences"] += 1
+                duplicate["coordinates"].append((svg_x, svg_y))
+                if duplicate["occurrences"] == 2:
+                    self.duplicate_settlements[province_name].append(duplicate)
+            else:
+                settlements_dict[name] = {"name": name, "occurrences": 1, "coordinates": [(svg_x, svg_y)]}
+
+                settlement = Settlement(
+                    name=name,
+                    province=province_name,
+                    svg_x=svg_x,
+                    svg_y=svg_y,
+                    geo_lon=float(geo_lon),
+                    geo_lat=float(geo_lat)
+                )
+                settlements_list.append(settlement)
+
+    def process_settlements(self, factions: Optional[Iterable[str]] = None):
+        """Process the settlements of the given factions (default: all configured) in one pass."""
+        logger.info("Processing settlements...")
+        self._walk([self._settlement_route(factions)])
 
     def process_settlements_empire(self):
         """Process all Empire settlements."""
-        logger.info("Processing Empire settlements...")
-
-        # Find Settlements layer
-        settlements_layer = None
-        for g in self.root.findall(f".//{{{NS['svg']}}}g"):
-            if g.get(f"{{{NS['inkscape']}}}label") == "Settlements":
-                settlements_layer = g
-                break
-
-        if settlements_layer is None:
-            logger.error("Settlements layer not found!")
-            return
-
-        # Find Empire faction
-        empire_faction = None
-        for child in settlements_layer:
-            if child.get(f"{{{NS['inkscape']}}}label") == "Empire":
-                empire_faction = child
-                break
-
-        if empire_faction is None:
-            logger.error("Empire faction not found!")
-            return
-
-        # Process each province
-        provinces_seen = set()
-        for province_group in empire_faction:
-            province_name = province_group.get(f"{{{NS['inkscape']}}}label")
-            if not province_name:
-                continue
-
-            provinces_seen.add(province_name)
-            logger.info(f"  Processing province: {province_name}")
-
-            settlements_in_province = {}
-
-            # Extract settlements from this province (may be nested in sub-layers like estates)
-            self._process_settlement_elements(province_group, province_name, settlements_in_province, self.settlements_empire)
-
-        logger.info(f"  Found {len(self.settlements_empire)} valid settlements across {len(provinces_seen)} provinces")
+        self.process_settlements(["Empire"])
 
     def process_settlements_westerland(self):
         """Process all Westerland settlements."""
-        logger.info("Processing Westerland settlements...")
-
-        # Find Settlements layer
-        settlements_layer = None
-        for g in self.root.findall(f".//{{{NS['svg']}}}g"):
-            if g.get(f"{{{NS['inkscape']}}}label") == "Settlements":
-                settlements_layer = g
-                break
-
-        if settlements_layer is None:
-            logger.error("Settlements layer not found!")
-            return
-
-        # Find Westerland faction
-        westerland_faction = None
-        for child in settlements_layer:
-            if child.get(f"{{{NS['inkscape']}}}label") == "Westerland":
-                westerland_faction = child
-                break
-
-        if westerland_faction is None:
-            logger.error("Westerland faction not found!")
-            return
-
-        settlements_in_faction = {}
-
-        # Extract settlements from Westerland (may be nested in sub-layers)
-        self._process_settlement_elements(westerland_faction, "Westerland", settlements_in_faction, self.settlements_westerland)
-
-        logger.info(f"  Found {len(self.settlements_westerland)} valid Westerland settlements")
+        self.process_settlements(["Westerland"])
 
     def load_population_data(self, faction: str, province: Optional[str] = None) -> Dict[str, int]:
         """Load population data from CSV files."""
         populations = {}
 
         if faction == "Empire" and province:
-            csv_file = INPUT_DIR / "The-Empire" / f"{province.lower()}.csv"
+            csv_file = self.input_dir / "The-Empire" / f"{province.lower()}.csv"
             if csv_file.exists():
                 with open(csv_file, 'r', encoding='utf-8') as f:
                     reader = csv.reader(f)
@@ -386,7 +626,7 @@ class SVGMapProcessor:
                                 pass
 
         elif faction == "Westerland":
-            csv_file = INPUT_DIR / "westerland.csv"
+            csv_file = self.input_dir / "westerland.csv"
             if csv_file.exists():
                 with open(csv_file, 'r', encoding='utf-8') as f:
                     reader = csv.reader(f)
@@ -402,35 +642,42 @@ class SVGMapProcessor:
 
         return populations
 
-    def load_csv_data(self, faction: str, province: Optional[str] = None) -> Dict[str, List]:
-        """Load full CSV data for a faction/province."""
-        csv_data = {}
-        csv_file = None
-
-        if faction == "Empire":
-            # Use the main empire.csv file which contains all provinces
-            csv_file = INPUT_DIR / "empire.csv"
-        elif faction == "Westerland":
-            csv_file = INPUT_DIR / "westerland.csv"
+    def _gazetteer_index(self, faction: str) -> Dict[Optional[str], Dict[str, dict]]:
+        """Rows of a faction's gazetteer by province (None: all rows) and name, read once per run."""
+        if faction in self._gazetteers:
+            return self._gazetteers[faction]
 
+        index = {None: {}}
+        config = self.factions.get(faction)
+        csv_file = self.input_dir / config.gazetteer if config else None
         if csv_file and csv_file.exists():
             try:
                 with open(csv_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
+                    for row in csv.DictReader(f):
                         settlement_name = row['Settlement'].strip()
-                        # If province specified, only include matching settlements
-                        if province and row.get('Province_2515', '').strip() == province:
-                            csv_data[settlement_name] = row
-                        elif not province:
-                            csv_data[settlement_name] = row
+                        index[None][settlement_name] = row
+                        if config.province_column:
+                            province = row.get(config.province_column, '').strip()
+                            index.setdefault(province, {})[settlement_name] = row
             except Exception as e:
                 logger.warning(f"Error loading CSV from {csv_file}: {e}")
 
-        return csv_data
+        self._gazetteers[faction] = index
+        return index
+
+    def load_csv_data(self, faction: str, province: Optional[str] = None) -> Dict[str, dict]:
+        """Load full CSV data for a faction/province."""
+        index = self._gazetteer_index(faction)
+        if province:
+            return index.get(province, {})
+        return index[None]
 
     def parse_tags(self, tags_str: str, trade_str: str) -> List[str]:
-        """Parse tags from CSV, including trade goods."""
+        """
+        Parse tags from CSV, including trade goods.
+
+        Tags are interned: a few hundred distinct strings are shared by thousands of settlements.
+        """
         tags = []
         
         # Parse tags column
@@ -441,7 +688,7 @@ class SVGMapProcessor:
                 for tag in tags_str.split(';'):
                     tag = tag.strip()
                     if tag:
-                        tags.append(tag)
+                        tags.append(sys.intern(tag))
         
         # Parse trade column and add as tags with prefix
         if trade_str and trade_str.strip():
@@ -450,14 +697,12 @@ class SVGMapProcessor:
                 for trade in trade_str.split(';'):
                     trade = trade.strip()
                     if trade:
-                        tags.append(f"trade:{trade}")
+                        tags.append(sys.intern(f"trade:{trade}"))
         
         return tags
 
     def validate_tags(self, tags: List[str], settlement_name: str) -> List[str]:
-        """Validate tags and log any issues."""
-        valid_sources = {"AndyLaw", "2eSH", "4eAotE1", "4eEiS", "4ePBtTC", "4eSCoSaS",
-                        "4eCRB", "4eDotRC", "NCC", "WFB8e", "AmbChron", "G&FT", "TOW", "1eMSDtR"}
+        """Validate tags against VALID_SOURCES and log any issues."""
         issues = []
         
         for tag in tags:
@@ -468,8 +713,8 @@ class SVGMapProcessor:
                 
                 # Validate source tags
                 if tag_type == "source":
-                    if tag_value not in valid_sources:
-                        issues.append(f"Invalid source '{tag_value}' not in {valid_sources}")
+                    if tag_value not in VALID_SOURCES:
+                        issues.append(f"Invalid source '{tag_value}' not in {sorted(VALID_SOURCES)}")
         
         if issues:
             self.invalid_tags.append({
@@ -509,122 +754,93 @@ class SVGMapProcessor:
         else:
             return 6  # Metropolis
 
+    def _wiki_image(self, image_url: Optional[str]) -> Optional[str]:
+        """Prefer a locally cached thumbnail over the full-resolution wiki image."""
+        if not image_url:
+            return None
+        return self.thumbnail_index.get(image_url, image_url)
+
     def populate_settlement_data(self):
         """Load population and additional data from CSVs and assign to settlements."""
         logger.info("Loading and processing CSV data...")
+        
+        self.thumbnail_index = load_thumbnail_index(str(self.output_dir / "images" / MANIFEST_NAME), WIKI_THUMBNAIL_WIDTH)
+        if self.thumbnail_index:
+            logger.info(f"  Using {len(self.thumbnail_index)} cached wiki thumbnails")
 
-        # Process Empire settlements
-        for settlement in self.settlements_empire:
-            csv_data = self.load_csv_data("Empire", settlement.province)
-            
-            if settlement.name in csv_data:
-                row = csv_data[settlement.name]
-                
-                # Population
-                try:
-                    settlement.population = int(row['Population'].strip())
-                except (ValueError, KeyError):
-                    settlement.population = self._assign_random_population()
-                    self.missing_population_data[settlement.province].append(settlement.name)
-                
-                # Province validation
-                if row.get('Province_2515'):
-                    csv_province = row['Province_2515'].strip()
-                    if csv_province and csv_province != settlement.province:
-                        self.province_mismatches.append({
-                            "settlement": settlement.name,
-                            "province_svg": settlement.province,
-                            "province_csv": csv_province
-                        })
-                        # Log warning but continue with SVG province
-                        logger.warning(f"Province mismatch for {settlement.name}: SVG={settlement.province}, CSV={csv_province}")
-                
-                # Tags
-                tags_str = row.get('Tags', '')
-                trade_str = row.get('Trade', '')
-                settlement.tags = self.parse_tags(tags_str, trade_str)
-                settlement.tags = self.validate_tags(settlement.tags, settlement.name)
-                
-                # Notes
-                settlement.notes = self.parse_notes(row.get('Notes', ''))
-                
-                # Wiki data
-                settlement.wiki = {
-                    "title": row.get('wiki_title') or None,
-                    "url": row.get('wiki_url') or None,
-                    "description": row.get('wiki_description') or None,
-                    "image": row.get('wiki_image') or None
-                }
-            else:
-                # Settlement in SVG but not in CSV - assign random population
-                settlement.population = self._assign_random_population()
-                self.missing_population_data[settlement.province].append(settlement.name)
-                settlement.tags = []
-                settlement.notes = []
-            
-            settlement.size_category = self.calculate_size_category(settlement.population)
+        # Only settlements assigned a population in this run are written back, so renamed
+        # or removed settlements drop out of the store
+        self.stored_populations = self._load_population_store()
+        self.assigned_populations = {}
 
-        # Process Westerland settlements
-        csv_data = self.load_csv_data("Westerland")
-        svg_settlement_names = {s.name for s in self.settlements_westerland}
-        
-        for settlement in self.settlements_westerland:
-            if settlement.name in csv_data:
-                row = csv_data[settlement.name]
-                
-                # Population
-                try:
-                    settlement.population = int(row['Population'].strip())
-                except (ValueError, KeyError):
-                    settlement.population = self._assign_random_population()
-                    self.missing_population_data["Westerland"].append(settlement.name)
-                
-                # Tags
-                tags_str = row.get('Tags', '')
-                trade_str = row.get('Trade', '')
-                settlement.tags = self.parse_tags(tags_str, trade_str)
-                settlement.tags = self.validate_tags(settlement.tags, settlement.name)
-                
-                # Notes
-                settlement.notes = self.parse_notes(row.get('Notes', ''))
-                
-                # Wiki data
-                settlement.wiki = {
-                    "title": row.get('wiki_title') or None,
-                    "url": row.get('wiki_url') or None,
-                    "description": row.get('wiki_description') or None,
-                    "image": row.get('wiki_image') or None
-                }
+        for faction in self.factions.values():
+            by_province = faction.provinces_from_layers and bool(faction.province_column)
+            settlements = self.settlements_by_faction.get(faction.layer, [])
+
+            for settlement in settlements:
+                csv_data = self.load_csv_data(faction.layer, settlement.province if by_province else None)
+
+                if settlement.name in csv_data:
+                    row = csv_data[settlement.name]
+
+                    # Population
+                    try:
+                        settlement.population = int(row['Population'].strip())
+                    except (ValueError, KeyError):
+                        settlement.population = self._assign_random_population(settlement)
+                        self.missing_population_data[settlement.province].append(settlement.name)
+
+                    # Province validation
+                    if faction.province_column and row.get(faction.province_column):
+                        csv_province = row[faction.province_column].strip()
+                        if csv_province and csv_province != settlement.province:
+                            self.province_mismatches.append({
+                                "settlement": settlement.name,
+                                "province_svg": settlement.province,
+                                "province_csv": csv_province
+                            })
+                            # Log warning but continue with SVG province
+                            logger.warning(f"Province mismatch for {settlement.name}: SVG={settlement.province}, CSV={csv_province}")
+
+                    # Tags
+                    tags_str = row.get('Tags', '')
+                    trade_str = row.get('Trade', '')
+                    settlement.tags = self.parse_tags(tags_str, trade_str)
+                    settlement.tags = self.validate_tags(settlement.tags, settlement.name)
+
+                    # Notes
+                    settlement.notes = self.parse_notes(row.get('Notes', ''))
+
+                    # Wiki data
+                    settlement.wiki = {
+                        "title": row.get('wiki_title') or None,
+                        "url": row.get('wiki_url') or None,
+                        "description": row.get('wiki_description') or None,
+                        "image": self._wiki_image(row.get('wiki_image'))
+                    }
+
+                    settlement.epochs = self._epoch_assignments(settlement, row)
+                else:
+                    # Settlement in SVG but not in CSV - assign random population
+                    settlement.population = self._assign_random_population(settlement)
+                    self.missing_population_data[settlement.province].append(settlement.name)
+                    settlement.tags = []
+                    settlement.notes = []
+                    settlement.wiki = empty_wiki()
+                    settlement.epochs = self._epoch_assignments(settlement, {})
+
+                settlement.size_category = self.calculate_size_category(settlement.population)
+
+            # Track CSV settlements not in SVG
+            svg_names = {(s.province, s.name) for s in settlements}
+            index = self._gazetteer_index(faction.layer)
+            if by_province:
+                csv_names = [(province, name) for province, rows in index.items() if province for name in rows]
             else:
-                settlement.population = self._assign_random_population()
-                self.missing_population_data["Westerland"].append(settlement.name)
-                settlement.tags = []
-                settlement.notes = []
-            
-            settlement.size_category = self.calculate_size_category(settlement.population)
-        
-        # Track CSV settlements not in SVG
-        # Load all Empire CSV data and check against SVG by province
-        empire_csv_file = INPUT_DIR / "empire.csv"
-        if empire_csv_file.exists():
-            try:
-                with open(empire_csv_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        csv_name = row['Settlement'].strip()
-                        csv_province = row.get('Province_2515', '').strip()
-                        if csv_province:
-                            svg_names = {s.name for s in self.settlements_empire if s.province == csv_province}
-                            if csv_name not in svg_names:
-                                self.csv_settlements_not_in_svg[csv_province].append(csv_name)
-            except Exception as e:
-                logger.warning(f"Error tracking CSV settlements: {e}")
-        
-        westerland_csv = self.load_csv_data("Westerland")
-        westerland_svg_names = {s.name for s in self.settlements_westerland}
-        for csv_name in westerland_csv.keys():
-            if csv_name not in westerland_svg_names:
-                self.csv_settlements_not_in_svg["Westerland"].append(csv_name)
+                csv_names = [(faction.province, name) for name in index[None]]
+            for csv_province, csv_name in csv_names:
+                if (csv_province, csv_name) not in svg_names:
+                    self.csv_settlements_not_in_svg[csv_province].append(csv_name)
 
         # Log summary
         if self.missing_population_data:
@@ -632,79 +848,112 @@ class SVGMapProcessor:
             for province, settlements in self.missing_population_data.items():
                 logger.warning(f"  {province}: {len(settlements)} settlements")
 
-    def _assign_random_population(self) -> int:
-        """Assign random population using log-normal distribution between 100 and 800."""
+        if self.assigned_populations != self.stored_populations:
+            self._save_population_store()
+
+    @staticmethod
+    def _epoch_assignments(settlement: Settlement, row: Dict[str, str]) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        Province and ruler of a settlement in every epoch, from its gazetteer row.
+
+        The base epoch province is the one on the map. A blank cell of an older
+        epoch means no change: the value of the next newer epoch is kept.
+        """
+        newer = {"province": settlement.province,
+                 "ruler": (row.get(f"{EPOCH_COLUMNS['ruler']}_{BASE_EPOCH}") or '').strip() or None}
+        epochs = {BASE_EPOCH: newer}
+        for epoch in HISTORICAL_EPOCHS:
+            newer = epochs[epoch] = {field: (row.get(f"{column}_{epoch}") or '').strip() or newer[field]
+                                     for field, column in EPOCH_COLUMNS.items()}
+        return epochs
+
+    def _load_population_store(self) -> Dict[str, Dict[str, int]]:
+        """Previously assigned populations: {province: {name: population}}."""
+        if not self.population_store.exists():
+            return {}
+        try:
+            with open(self.population_store, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {self.population_store}: {e}")
+            return {}
+
+    def _save_population_store(self):
+        """Write the assigned populations atomically, sorted so the file diffs cleanly."""
+        temp_path = self.population_store.with_name(f"{self.population_store.name}.{os.getpid()}.tmp")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.assigned_populations, f, indent=2, ensure_ascii=False, sort_keys=True)
+                f.write("\n")
+            os.replace(temp_path, self.population_store)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        logger.info(f"Assigned populations saved to {self.population_store}")
+
+    def _assign_random_population(self, settlement: Optional[Settlement] = None) -> int:
+        """
+        Assign random population using log-normal distribution between 100 and 800.
+
+        A settlement keeps the population stored for it in the population store
+        by the previous run. New settlements draw from a generator seeded with their province and
+        name, so the same settlement gets the same value on every run. Without
+        a settlement, an unseeded value is returned.
+        """
+        if settlement is None:
+            generator = random
+        else:
+            assigned = self.assigned_populations.setdefault(settlement.province, {})
+            previous = self.stored_populations.get(settlement.province, {})
+            if settlement.name in previous:
+                assigned[settlement.name] = previous[settlement.name]
+                return assigned[settlement.name]
+            # String seeds are hashed with SHA-512, independent of PYTHONHASHSEED
+            generator = random.Random(f"{settlement.province}|{settlement.name}")
+
         # Use log-normal distribution for realistic settlement populations
         # Shape and scale chosen to give reasonable distribution in 100-800 range
-        _random_population = int(np.random.lognormal(mean=5.0, sigma=0.8))
+        _random_population = int(generator.lognormvariate(5.0, 0.8))
         if _random_population > 800:
-            return 782
+            _random_population = 782
+
+        if settlement is not None:
+            assigned[settlement.name] = _random_population
         return _random_population
 
-    def _process_poi_elements(self, parent_elem, poi_type: str, poi_list: list):
-        """Recursively process POI elements, handling nested layers."""
-        for elem in parent_elem:
-            # Check if this is a layer/group
-            if elem.tag == f"{{{NS['svg']}}}g":
-                # Recursively process children of this layer
-                self._process_poi_elements(elem, poi_type, poi_list)
-            elif elem.tag == f"{{{NS['svg']}}}text":
-                name = self._get_text_element_label(elem)
-                if name:
-                    try:
-                        svg_x = float(elem.get("x", 0))
-                        svg_y = float(elem.get("y", 0))
-                        geo_lon, geo_lat = self.converter.svg_to_geo(svg_x, svg_y)
-                        
-                        poi = PointOfInterest(
-                            name=name,
-                            poi_type=poi_type,
-                            svg_x=svg_x,
-                            svg_y=svg_y,
-                            geo_lon=geo_lon,
-                            geo_lat=geo_lat
-                        )
-                        poi_list.append(poi)
-                    except (ValueError, TypeError):
-                        pass
+    def _add_points_of_interest(self, pending: Dict[str, list]):
+        """Place collected POI in one batch per type."""
+        for poi_type, entries in pending.items():
+            logger.info(f"  Processing POI type: {poi_type}")
+            svg_points, geo_points = self._place_points(entries)
+            for (name, _, _, _), (svg_x, svg_y), (geo_lon, geo_lat) in zip(entries, svg_points, geo_points):
+                self.points_of_interest.append(PointOfInterest(
+                    name=name,
+                    poi_type=poi_type,
+                    svg_x=float(svg_x),
+                    svg_y=float(svg_y),
+                    geo_lon=float(geo_lon),
+                    geo_lat=float(geo_lat)
+                ))
+            logger.info(f"    Found {len(entries)} POI")
+
+    def _poi_route(self) -> LayerRoute:
+        """Route for the Points of Interest layer, one sub-layer per POI type."""
+        pending = {}
+
+        def poi_type(path):
+            if not path or not path[0]:
+                return None
+            return POI_TYPES.get(path[0], path[0])
+
+        handle = self._text_label_handler(poi_type, pending)
+        return LayerRoute("Points of Interest", handlers={TAG_TEXT: handle},
+                          on_finish=lambda: self._add_points_of_interest(pending))
 
     def process_points_of_interest(self):
         """Process all points of interest."""
         logger.info("Processing Points of Interest...")
-
-        # Find Points of Interest layer
-        poi_layer = None
-        for g in self.root.findall(f".//{{{NS['svg']}}}g"):
-            if g.get(f"{{{NS['inkscape']}}}label") == "Points of Interest":
-                poi_layer = g
-                break
-
-        if poi_layer is None:
-            logger.error("Points of Interest layer not found!")
-            return
-
-        poi_types = {
-            "Other": "Other",
-            "City Districts": "City Districts",
-            "Forts and Castles": "Forts and Castles",
-            "Monastaries and Temples": "Monasteries and Temples",
-            "Taverns and Inns": "Taverns and Inns"
-        }
-
-        for poi_group in poi_layer:
-            poi_type = poi_group.get(f"{{{NS['inkscape']}}}label")
-            if not poi_type:
-                continue
-
-            poi_type = poi_types.get(poi_type, poi_type)
-            logger.info(f"  Processing POI type: {poi_type}")
-
-            # Extract POI from this group (may be nested in sub-layers)
-            initial_count = len(self.points_of_interest)
-            self._process_poi_elements(poi_group, poi_type, self.points_of_interest)
-            count = len(self.points_of_interest) - initial_count
-
-            logger.info(f"    Found {count} POI")
+        self._walk([self._poi_route()])
 
     def parse_svg_path(self, path_d: str) -> List[Tuple[float, float]]:
         """Parse SVG path data and extract coordinates, handling both absolute and relative commands."""
@@ -838,6 +1087,8 @@ class SVGMapProcessor:
                              cp2: Tuple[float, float], end: Tuple[float, float],
                              samples: int = 20) -> List[Tuple[float, float]]:
         """Sample points along a cubic Bezier curve."""
+        import numpy as np
+
         points = []
         for t in np.linspace(0, 1, samples):
             mt = 1 - t
@@ -846,351 +1097,307 @@ class SVGMapProcessor:
             points.append((x, y))
         return points
 
-    def _process_road_elements(self, parent_elem, road_type: str, road_list: list, road_id_ref: list):
-        """Recursively process road elements, handling nested layers."""
-        for elem in parent_elem:
-            # Check if this is a layer/group
-            if elem.tag == f"{{{NS['svg']}}}g":
-                # Recursively process children of this layer
-                self._process_road_elements(elem, road_type, road_list, road_id_ref)
-            elif elem.tag == f"{{{NS['svg']}}}path":
-                path_d = elem.get("d", "")
-                if path_d:
-                    try:
-                        svg_points = self.parse_svg_path(path_d)
-                        
-                        if svg_points:
-                            # Convert to geographic coordinates
-                            geo_points = [
-                                self.converter.svg_to_geo(pt[0], pt[1])
-                                for pt in svg_points
-                            ]
-
-                            road = Road(
-                                road_id=f"road_{road_id_ref[0]:03d}",
-                                road_type=road_type,
-                                svg_path=path_d,
-                                geo_coordinates=geo_points
-                            )
-                            road_list.append(road)
-                            road_id_ref[0] += 1
-                    except Exception as e:
-                        logger.warning(f"    Error processing road: {e}")
-
-    # Road processing functionality maintained for potential future implementation
-    # def process_roads(self):
-    #     """Process all roads."""
-    #     logger.info("Processing Roads...")
-    #
-    #     # Find ALL Roads layers
-    #     roads_layers = []
-    #     for g in self.root.findall(f".//{{{NS['svg']}}}g"):
-    #         if g.get(f"{{{NS['inkscape']}}}label") == "Roads":
-    #             roads_layers.append(g)
-    #
-    #     if not roads_layers:
-    #         logger.error("Roads layers not found!")
-    #         return
-    #
-    #     road_type_map = {
-    #         "Imperial Highways": "Imperial Highways",
-    #         "Roads": "Roads",
-    #         "Paths": "Paths"
-    #     }
-    #
-    #     road_id_ref = [0]  # Use list to allow modification in nested function
-    #
-    #     # Process each Roads layer
-    #     for roads_idx, roads_layer in enumerate(roads_layers):
-    #         logger.info(f"  Processing Roads layer {roads_idx + 1}...")
-    #         
-    #         # Check if this layer has direct path elements (unlabeled roads)
-    #         direct_paths = [child for child in roads_layer if child.tag == f"{{{NS['svg']}}}path"]
-    #         
-    #         if direct_paths:
-    #             # This layer contains direct paths - process them as unlabeled roads
-    #             logger.info(f"    Found {len(direct_paths)} unlabeled road paths")
-    #             successful = 0
-    #             for path_idx, path_elem in enumerate(direct_paths):
-    #                 path_d = path_elem.get("d", "")
-    #                 if path_d:
-    #                     try:
-    #                         svg_points = self.parse_svg_path(path_d)
-    #                         
-    #                         if svg_points:
-    #                             # Convert to geographic coordinates
-    #                             geo_points = [
-    #                                 self.converter.svg_to_geo(pt[0], pt[1])
-    #                                 for pt in svg_points
-    #                             ]
-    #
-    #                             road = Road(
-    #                                 road_id=f"road_{road_id_ref[0]:03d}",
-    #                                 road_type="Road",
-    #                                 svg_path=path_d,
-    #                                 geo_coordinates=geo_points
-    #                             )
-    #                             self.roads.append(road)
-    #                             road_id_ref[0] += 1
-    #                             successful += 1
-    #                     except Exception as e:
-    #                         if path_idx < 3:  # Log first 3 errors only
-    #                             logger.debug(f"    Error processing road {path_idx}: {str(e)[:100]}")
-    #         else:
-    #             # This layer contains labeled road type groups
-    #             for road_group in roads_layer:
-    #                 road_type = road_group.get(f"{{{NS['inkscape']}}}label}")
-    #                 if not road_type or road_type not in road_type_map:
-    #                     continue
-    #
-    #                 road_type = road_type_map.get(road_type, road_type)
-    #                 logger.info(f"    Processing road type: {road_type}")
-    #
-    #                 # Extract roads from this group (may be nested in sub-layers)
-    #                 initial_count = len(self.roads)
-    #                 self._process_road_elements(road_group, road_type, self.roads, road_id_ref)
-    #                 count = len(self.roads) - initial_count
-    #
-    #                 logger.info(f"      Found {count} roads")
+    def _add_road(self, elem, road_type: str, ctm: np.ndarray):
+        """Convert one road path element and add it."""
+        import numpy as np
+        from svg_transform import apply_transform, compose
 
-    def process_province_labels(self):
-        """Process all political/province labels."""
-        logger.info("Processing Province Labels...")
-
-        # Find the Region-Labels-post2512 layer
-        regions_layer = None
-        for g in self.root.findall(f".//{{{NS['svg']}}}g"):
-            if g.get(f"{{{NS['inkscape']}}}label") == "Region-Labels-post2512":
-                regions_layer = g
-                break
-
-        if regions_layer is None:
-            logger.error("Region-Labels-post2512 layer not found!")
+        path_d = elem.get("d", "")
+        if not path_d:
             return
+        try:
+            svg_points = self.parse_svg_path(path_d)
+
+            if svg_points:
+                # Transform the whole path at once, then convert to geographic coordinates
+                path_ctm = compose(ctm, elem.get("transform", ""))
+                doc_points = apply_transform(path_ctm, np.array(svg_points))
+                geo_points = [
+                    (float(lon), float(lat))
+                    for lon, lat in self.converter.svg_to_geo_array(doc_points)
+                ]
+
+                self.roads.append(Road(
+                    road_id=f"road_{len(self.roads):03d}",
+                    road_type=road_type,
+                    svg_path=path_d,
+                    geo_coordinates=geo_points
+                ))
+        except Exception as e:
+            logger.warning(f"    Error processing road: {e}")
+
+    def _road_route(self) -> LayerRoute:
+        """
+        Route for every Roads layer.
+
+        Paths directly inside a Roads layer are unlabeled roads; paths in a
+        labeled sub-layer take the road type of that sub-layer.
+        """
+        initial_count = len(self.roads)
+
+        def handle(elem, path, ctm):
+            if not path:
+                road_type = "Road"
+            else:
+                road_type = ROAD_TYPES.get(path[0])
+                if road_type is None:
+                    return
+            self._add_road(elem, road_type, ctm)
 
-        # Map layer names to province types
-        province_type_map = {
-            "Nation-States": "Nation-State",
-            "Grand-Provinces": "Grand-Province",
-            "Provinces": "Province"
-        }
+        def finish():
+            logger.info(f"  Found {len(self.roads) - initial_count} roads")
 
-        for region_group in regions_layer:
-            layer_name = region_group.get(f"{{{NS['inkscape']}}}label")
-            if not layer_name or layer_name not in province_type_map:
-                continue
+        return LayerRoute("Roads", handlers={TAG_PATH: handle}, all_matches=True, on_finish=finish)
 
-            province_type = province_type_map[layer_name]
+    def process_roads(self):
+        """Process all roads."""
+        logger.info("Processing Roads...")
+        self._walk([self._road_route()])
+
+    def _add_province_labels(self, pending: Dict[str, list]):
+        """Place collected province labels in one batch per province type."""
+        for province_type, entries in pending.items():
             logger.info(f"  Processing province type: {province_type}")
+            svg_points, geo_points = self._place_points(entries)
+            for (name, _, _, _), (svg_x, svg_y), (geo_lon, geo_lat) in zip(entries, svg_points, geo_points):
+                self.province_labels.append(ProvinceLabel(
+                    name=name,
+                    province_type=province_type,
+                    svg_x=float(svg_x),
+                    svg_y=float(svg_y),
+                    geo_lon=float(geo_lon),
+                    geo_lat=float(geo_lat),
+                    formal_title="",
+                    part_of=""
+                ))
+            logger.info(f"    Found {len(entries)} labels")
+
+    def _province_label_route(self) -> LayerRoute:
+        """Route for the Region-Labels-post2512 layer."""
+        pending = {}
+
+        def province_type(path):
+            return PROVINCE_LABEL_TYPES.get(path[0]) if path else None
+
+        handle = self._text_label_handler(province_type, pending)
+        return LayerRoute("Region-Labels-post2512", handlers={TAG_TEXT: handle},
+                          on_finish=lambda: self._add_province_labels(pending))
 
-            # Extract labels from this group
-            initial_count = len(self.province_labels)
-            self._process_province_label_elements(region_group, province_type, self.province_labels)
-            count = len(self.province_labels) - initial_count
-
-            logger.info(f"    Found {count} labels")
-
-    def _process_province_label_elements(self, parent_elem, province_type: str, label_list: list):
-        """Recursively process province label elements, handling nested layers."""
-        for elem in parent_elem:
-            # Check if this is a layer/group
-            if elem.tag == f"{{{NS['svg']}}}g":
-                # Recursively process children of this layer
-                self._process_province_label_elements(elem, province_type, label_list)
-            elif elem.tag == f"{{{NS['svg']}}}text":
-                name = self._get_text_element_label(elem)
-                if name:
-                    try:
-                        svg_x = float(elem.get("x", 0))
-                        svg_y = float(elem.get("y", 0))
-                        geo_lon, geo_lat = self.converter.svg_to_geo(svg_x, svg_y)
-                        
-                        label = ProvinceLabel(
-                            name=name,
-                            province_type=province_type,
-                            svg_x=svg_x,
-                            svg_y=svg_y,
-                            geo_lon=geo_lon,
-                            geo_lat=geo_lat,
-                            formal_title="",
-                            part_of=""
-                        )
-                        label_list.append(label)
-                    except (ValueError, TypeError):
-                        pass
+    def process_province_labels(self):
+        """Process all political/province labels."""
+        logger.info("Processing Province Labels...")
+        self._walk([self._province_label_route()])
+
+    def _add_water_labels(self, pending: Dict[str, list]):
+        """Place collected water labels in one batch per waterbody type."""
+        for waterbody_type, entries in pending.items():
+            logger.info(f"  Processing {waterbody_type}...")
+            svg_points, geo_points = self._place_points(entries)
+            for (name, _, _, _), (svg_x, svg_y), (geo_lon, geo_lat) in zip(entries, svg_points, geo_points):
+                self.water_labels.append(WaterLabel(
+                    name=name,
+                    waterbody_type=waterbody_type,
+                    svg_x=float(svg_x),
+                    svg_y=float(svg_y),
+                    geo_lon=float(geo_lon),
+                    geo_lat=float(geo_lat)
+                ))
+            logger.info(f"    Found {len(entries)} {waterbody_type} labels")
+
+    def _water_label_route(self) -> LayerRoute:
+        """Route for the Water Labels layer; marshes have one more level of sub-layers."""
+        pending = {}
+
+        def waterbody_type(path):
+            if not path or not path[0]:
+                return None
+            if path[0] == "marshes":
+                return WATERBODY_TYPES.get(path[1]) if len(path) > 1 else None
+            return WATERBODY_TYPES.get(path[0])
+
+        handle = self._text_label_handler(waterbody_type, pending)
+        return LayerRoute("Water Labels", handlers={TAG_TEXT: handle},
+                          on_finish=lambda: self._add_water_labels(pending))
 
     def process_water_labels(self):
         """Process all water body labels."""
         logger.info("Processing Water Labels...")
+        self._walk([self._water_label_route()])
 
-        # Find the Water Labels layer
-        water_layer = None
-        for g in self.root.findall(f".//{{{NS['svg']}}}g"):
-            if g.get(f"{{{NS['inkscape']}}}label") == "Water Labels":
-                water_layer = g
-                break
-
-        if water_layer is None:
-            logger.error("Water Labels layer not found!")
-            return
+    def _write_geojson(self, filename: str, features: List[dict]) -> Path:
+        """Write features as a GeoJSON FeatureCollection to the output directory."""
+        geojson = {
+            "type": "FeatureCollection",
+            "features": features
+        }
 
-        # Map layer names to waterbody types
-        waterbody_type_map = {
-            "ocean": "Ocean",
-            "major-sea": "Major Sea",
-            "large-sea": "Large Sea",
-            "medium-sea": "Medium Sea",
-            "small-sea": "Small Sea",
-            "small-marsh": "Small Marsh",
-            "large-marsh": "Large Marsh",
-            "lakes": "Lake"
+        return self.outputs.write_text(filename, json.dumps(geojson, indent=2, ensure_ascii=False))
+
+    def _settlement_feature(self, settlement: Settlement) -> dict:
+        """GeoJSON feature for a settlement."""
+        return {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [settlement.geo_lon, settlement.geo_lat]
+            },
+            "properties": {
+                "name": settlement.name,
+                "province": settlement.province,
+                "population": settlement.population,
+                "tags": settlement.tags,
+                "notes": settlement.notes,
+                "size_category": settlement.size_category,
+                "ruler": settlement.epochs.get(BASE_EPOCH, {}).get("ruler"),
+                "min_zoom": settlement.min_zoom,
+                **self._label_properties(settlement),
+                "inkscape_coordinates": [settlement.svg_x, settlement.svg_y],
+                "wiki": settlement.wiki
+            }
         }
 
-        for water_group in water_layer:
-            layer_name = water_group.get(f"{{{NS['inkscape']}}}label")
-            if not layer_name:
+    def generate_settlements_geojson(self, factions: Optional[Iterable[str]] = None):
+        """Generate one settlements GeoJSON per faction (default: all configured)."""
+        for layer in (self.factions if factions is None else factions):
+            features = [self._settlement_feature(s) for s in self.settlements_by_faction.get(layer, [])]
+            output_file = self._write_geojson(self.factions[layer].output, features)
+            logger.info(f"Generated {output_file}: {len(features)} settlements")
+
+    def generate_tag_index(self):
+        """Generate the inverted tag index (tag -> settlements) of all factions, see tag_index.py."""
+        settlements = [s for layer_settlements in self.settlements_by_faction.values() for s in layer_settlements]
+        self.tag_index = build_tag_index(settlements)
+        exported = export_tag_index(self.tag_index)
+        output_file = self.outputs.write_text(
+            TAG_INDEX_NAME, json.dumps(exported, ensure_ascii=False, separators=(",", ":")))
+        logger.info(f"Generated {output_file}: {len(exported['tags'])} tags over "
+                    f"{len(exported['settlements'])} settlements")
+
+    def epoch_deltas(self) -> Dict[str, Dict[str, Dict[str, Optional[str]]]]:
+        """
+        Settlements whose province or ruler differs from the base epoch, per other epoch.
+
+        Returns:
+            {epoch: {settlement key: {field: value in that epoch}}}, only the changed fields
+        """
+        deltas = {epoch: {} for epoch in HISTORICAL_EPOCHS}
+        for settlements in self.settlements_by_faction.values():
+            for settlement in settlements:
+                base = settlement.epochs.get(BASE_EPOCH)
+                if base is None:
+                    continue
+                for epoch, delta in deltas.items():
+                    changed = {field: value for field, value in settlement.epochs[epoch].items()
+                               if value != base[field]}
+                    if changed:
+                        delta[settlement_key(settlement)] = changed
+        return deltas
+
+    def generate_epoch_deltas(self):
+        """Generate one file per historical epoch with the settlements that differ from the base epoch."""
+        for epoch, delta in self.epoch_deltas().items():
+            data = {"epoch": epoch, "base_epoch": BASE_EPOCH,
+                    "settlements": {key: delta[key] for key in sorted(delta)}}
+            output_file = self.outputs.write_text(f"settlements_epoch_{epoch}.json",
+                                                  json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+            logger.info(f"Generated {output_file}: {len(delta)} settlements differ from {BASE_EPOCH}")
+
+    def statistics_cube(self) -> Dict:
+        """Count, total and median population by province, size category and tag type, see statistics_cube.py."""
+        from statistics_cube import build_statistics_cube
+
+        return build_statistics_cube(self.settlements_by_faction)
+
+    def generate_statistics(self):
+        """Generate the statistics cube JSON for dashboards."""
+        from statistics_cube import STATISTICS_NAME
+
+        cube = self.statistics_cube()
+        output_file = self.outputs.write_text(STATISTICS_NAME,
+                                              json.dumps(cube, ensure_ascii=False, separators=(",", ":")))
+        logger.info(f"Generated {output_file}: {len(cube['cells'])} cells over {len(cube['provinces'])} provinces")
+
+    def generate_search_index(self):
+        """Generate the typeahead search index over names, notes and wiki descriptions, see search_index.py."""
+        settlements = [s for layer_settlements in self.settlements_by_faction.values() for s in layer_settlements]
+        index = build_search_index(settlements)
+        output_file = self.outputs.write_text(
+            SEARCH_INDEX_NAME, json.dumps(index, ensure_ascii=False, separators=(",", ":")))
+        logger.info(f"Generated {output_file}: {len(index['documents'])} settlements, "
+                    f"{len(index['names'])} name trigrams, {len(index['words'])} words")
+
+    def generalize_settlements(self):
+        """Assign every settlement (of all factions together) its minimum display zoom."""
+        settlements = [s for layer_settlements in self.settlements_by_faction.values() for s in layer_settlements]
+        zooms = assign_min_zooms([(s.geo_lon, s.geo_lat, s.size_category, s.population) for s in settlements])
+        for settlement, zoom in zip(settlements, zooms):
+            settlement.min_zoom = zoom
+
+    def place_labels(self) -> Dict[str, int]:
+        """
+        Precompute label priority and visibility range of settlement, province and water labels.
+
+        Returns:
+            Counts of labels and of labels shown at some zoom
+        """
+        labels, candidates = [], []
+        for settlements in self.settlements_by_faction.values():
+            for settlement in settlements:
+                if settlement.min_zoom is None:
+                    continue
+                labels.append(settlement)
+                candidates.append(LabelCandidate(
+                    settlement.geo_lon, settlement.geo_lat, settlement.name,
+                    SETTLEMENT_TEXT_HEIGHT.get(settlement.size_category, 10), settlement.min_zoom, MAX_ZOOM,
+                    # Population (capped below the next category's 100) breaks ties within a size category
+                    100 * settlement.size_category + min(settlement.population, 10**6) / 10**4))
+        for label, classes, label_class in (
+                [(label, PROVINCE_LABEL_CLASSES, label.province_type) for label in self.province_labels] +
+                [(label, WATER_LABEL_CLASSES, label.waterbody_type) for label in self.water_labels]):
+            if label_class not in classes:
                 continue
+            height, first_zoom, last_zoom, priority = classes[label_class]
+            labels.append(label)
+            candidates.append(LabelCandidate(label.geo_lon, label.geo_lat, label.name, height,
+                                             first_zoom, last_zoom, priority))
+
+        for label, placement in zip(labels, place_labels(candidates)):
+            label.label_priority = placement.priority
+            label.label_min_zoom = placement.min_zoom
+            label.label_max_zoom = placement.max_zoom
+
+        shown = sum(1 for label in labels if label.label_min_zoom is not None)
+        logger.info(f"Placed {shown} of {len(labels)} labels")
+        return {"labels": len(labels), "labels_shown": shown}
+
+    @staticmethod
+    def _label_properties(label) -> Dict[str, Optional[int]]:
+        """GeoJSON properties written by place_labels()."""
+        return {
+            "label_priority": label.label_priority,
+            "label_min_zoom": label.label_min_zoom,
+            "label_max_zoom": label.label_max_zoom,
+        }
 
-            # Handle marshes which has sub-layers
-            if layer_name == "marshes":
-                logger.info(f"  Processing marshes...")
-                for marsh_group in water_group:
-                    marsh_layer_name = marsh_group.get(f"{{{NS['inkscape']}}}label")
-                    if marsh_layer_name and marsh_layer_name in waterbody_type_map:
-                        waterbody_type = waterbody_type_map[marsh_layer_name]
-                        initial_count = len(self.water_labels)
-                        # Get transform from marsh_group if it exists
-                        marsh_transform = marsh_group.get("transform", "")
-                        self._process_water_label_elements(marsh_group, waterbody_type, self.water_labels, marsh_transform)
-                        count = len(self.water_labels) - initial_count
-                        logger.info(f"    Found {count} {waterbody_type} labels")
-            # Handle lakes which is a new tier
-            elif layer_name == "lakes":
-                logger.info(f"  Processing lakes...")
-                waterbody_type = waterbody_type_map[layer_name]
-                initial_count = len(self.water_labels)
-                lakes_transform = water_group.get("transform", "")
-                self._process_water_label_elements(water_group, waterbody_type, self.water_labels, lakes_transform)
-                count = len(self.water_labels) - initial_count
-                logger.info(f"    Found {count} {waterbody_type} labels")
-            elif layer_name in waterbody_type_map:
-                waterbody_type = waterbody_type_map[layer_name]
-                logger.info(f"  Processing {waterbody_type}...")
-                
-                # Extract labels from this group
-                initial_count = len(self.water_labels)
-                group_transform = water_group.get("transform", "")
-                self._process_water_label_elements(water_group, waterbody_type, self.water_labels, group_transform)
-                count = len(self.water_labels) - initial_count
-
-                logger.info(f"    Found {count} labels")
-
-    def _process_water_label_elements(self, parent_elem, waterbody_type: str, label_list: list, parent_transform: str = ""):
-        """Recursively process water label elements, handling nested layers and transforms."""
-        for elem in parent_elem:
-            # Check if this is a layer/group
-            if elem.tag == f"{{{NS['svg']}}}g":
-                # Get group transform and accumulate with parent
-                group_transform = elem.get("transform", "")
-                # Combine transforms: if both exist, concatenate them
-                combined_transform = (parent_transform + " " + group_transform).strip() if group_transform else parent_transform
-                # Recursively process children with accumulated transform
-                self._process_water_label_elements(elem, waterbody_type, label_list, combined_transform)
-            elif elem.tag == f"{{{NS['svg']}}}text":
-                name = self._get_text_element_label(elem)
-                if name:
-                    try:
-                        svg_x = float(elem.get("x", 0))
-                        svg_y = float(elem.get("y", 0))
-                        
-                        # Apply element-level transform if present
-                        transform = elem.get("transform", "")
-                        svg_x, svg_y = self._apply_svg_transform(svg_x, svg_y, transform)
-                        
-                        # Apply parent/group transform
-                        svg_x, svg_y = self._apply_svg_transform(svg_x, svg_y, parent_transform)
-                        
-                        geo_lon, geo_lat = self.converter.svg_to_geo(svg_x, svg_y)
-                        
-                        label = WaterLabel(
-                            name=name,
-                            waterbody_type=waterbody_type,
-                            svg_x=svg_x,
-                            svg_y=svg_y,
-                            geo_lon=geo_lon,
-                            geo_lat=geo_lat
-                        )
-                        label_list.append(label)
-                    except (ValueError, TypeError):
-                        pass
+    def generate_zoom_band_geojson(self):
+        """Generate one settlements GeoJSON per zoom band, holding the settlements that appear in it."""
+        bands = {band: [] for band in ZOOM_BANDS}
+        for settlements in self.settlements_by_faction.values():
+            for settlement in settlements:
+                band = zoom_band(settlement.min_zoom)
+                if band:
+                    bands[band].append(self._settlement_feature(settlement))
+        for (low, high), features in bands.items():
+            output_file = self._write_geojson(zoom_band_filename(low, high), features)
+            logger.info(f"Generated {output_file}: {len(features)} settlements")
 
     def generate_empire_geojson(self):
         """Generate GeoJSON for Empire settlements."""
-        features = []
-        for settlement in self.settlements_empire:
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [settlement.geo_lon, settlement.geo_lat]
-                },
-                "properties": {
-                    "name": settlement.name,
-                    "province": settlement.province,
-                    "population": settlement.population,
-                    "tags": settlement.tags,
-                    "notes": settlement.notes,
-                    "size_category": settlement.size_category,
-                    "inkscape_coordinates": [settlement.svg_x, settlement.svg_y],
-                    "wiki": settlement.wiki
-                }
-            }
-            features.append(feature)
-
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features
-        }
-
-        output_file = OUTPUT_DIR / "empire_settlements.geojson"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(geojson, f, indent=2, ensure_ascii=False)
-
-        logger.info(f"Generated {output_file}: {len(features)} settlements")
+        self.generate_settlements_geojson(["Empire"])
 
     def generate_westerland_geojson(self):
         """Generate GeoJSON for Westerland settlements."""
-        features = []
-        for settlement in self.settlements_westerland:
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [settlement.geo_lon, settlement.geo_lat]
-                },
-                "properties": {
-                    "name": settlement.name,
-                    "province": "Westerland",
-                    "population": settlement.population,
-                    "tags": settlement.tags,
-                    "notes": settlement.notes,
-                    "size_category": settlement.size_category,
-                    "inkscape_coordinates": [settlement.svg_x, settlement.svg_y],
-                    "wiki": settlement.wiki
-                }
-            }
-            features.append(feature)
-
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features
-        }
-
-        output_file = OUTPUT_DIR / "westerland_settlements.geojson"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(geojson, f, indent=2, ensure_ascii=False)
-
-        logger.info(f"Generated {output_file}: {len(features)} settlements")
+        self.generate_settlements_geojson(["Westerland"])
 
     def generate_poi_geojson(self):
         """Generate GeoJSON for points of interest."""
@@ -1210,14 +1417,7 @@ class SVGMapProcessor:
             }
             features.append(feature)
 
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features
-        }
-
-        output_file = OUTPUT_DIR / "points_of_interest.geojson"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(geojson, f, indent=2, ensure_ascii=False)
+        output_file = self._write_geojson("points_of_interest.geojson", features)
 
         logger.info(f"Generated {output_file}: {len(features)} POI")
 
@@ -1244,8 +1444,8 @@ class SVGMapProcessor:
             "features": features
         }
 
-        output_file = OUTPUT_DIR / "empire_roads.geojson"
-        with open(output_file, 'w', encoding='utf-8') as f:
+        output_file = self.output_dir / "empire_roads.geojson"
+        with self.outputs.open(output_file.name) as f:
             # Custom JSON formatting for readability - keep coordinate arrays on single lines
             f.write('{\n  "type": "FeatureCollection",\n  "features": [\n')
             for i, feature in enumerate(features):
@@ -1287,19 +1487,13 @@ class SVGMapProcessor:
                     "province_type": label.province_type,
                     "formal_title": label.formal_title,
                     "part_of": label.part_of,
-                    "inkscape_coordinates": [label.svg_x, label.svg_y]
+                    "inkscape_coordinates": [label.svg_x, label.svg_y],
+                    **self._label_properties(label)
                 }
             }
             features.append(feature)
 
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features
-        }
-
-        output_file = OUTPUT_DIR / "province_labels.geojson"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(geojson, f, indent=2, ensure_ascii=False)
+        output_file = self._write_geojson("province_labels.geojson", features)
 
         logger.info(f"Generated {output_file}: {len(features)} province labels")
 
@@ -1316,29 +1510,39 @@ class SVGMapProcessor:
                 "properties": {
                     "name": label.name,
                     "waterbody_type": label.waterbody_type,
-                    "inkscape_coordinates": [label.svg_x, label.svg_y]
+                    "inkscape_coordinates": [label.svg_x, label.svg_y],
+                    **self._label_properties(label)
                 }
             }
             features.append(feature)
 
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features
-        }
-
-        output_file = OUTPUT_DIR / "water_labels.geojson"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(geojson, f, indent=2, ensure_ascii=False)
+        output_file = self._write_geojson("water_labels.geojson", features)
 
         logger.info(f"Generated {output_file}: {len(features)} water labels")
 
+    def generate_sqlite(self):
+        """Export every extracted layer into the SQLite database atlas.sqlite."""
+        from sqlite_export import write_atlas_database
+
+        build_file = self.output_dir / "atlas.sqlite.build"
+        try:
+            counts = write_atlas_database(build_file, self.settlements_by_faction, self.points_of_interest,
+                                          self.province_labels, self.water_labels, self.roads)
+            # Stored through the output manager like every other artifact (unchanged data, unchanged file)
+            output_file = self.outputs.write_bytes("atlas.sqlite", build_file.read_bytes())
+        finally:
+            build_file.unlink(missing_ok=True)
+        if not counts.pop("rtree"):
+            logger.warning("SQLite was built without R*Tree support, atlas.sqlite has no spatial index")
+        logger.info(f"Generated {output_file}: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
     def write_invalid_settlements_log(self):
         """Write log of invalid settlement elements."""
         if not self.invalid_settlements:
             return
 
-        output_file = LOGS_DIR / "invalid_settlement_elements.log"
-        with open(output_file, 'w', encoding='utf-8') as f:
+        output_file = self.logs_dir / "invalid_settlement_elements.log"
+        with self.log_files.open(output_file.name) as f:
             f.write("Invalid Settlement Elements Log\n")
             f.write("=" * 80 + "\n\n")
             f.write(f"Total invalid elements: {len(self.invalid_settlements)}\n\n")
@@ -1353,64 +1557,115 @@ class SVGMapProcessor:
 
         logger.info(f"Generated {output_file}")
 
+    def settlement_occurrences(self) -> List[Occurrence]:
+        """Every settlement label of all factions, including the repeats dropped as duplicates."""
+        repeats = {(province, duplicate["name"]): duplicate["coordinates"][1:]
+                   for province, duplicates in self.duplicate_settlements.items() for duplicate in duplicates}
+        occurrences = []
+        for layer, settlements in self.settlements_by_faction.items():
+            for settlement in settlements:
+                occurrences.append(Occurrence(layer, settlement.province, settlement.name,
+                                              settlement.svg_x, settlement.svg_y))
+                for svg_x, svg_y in repeats.get((settlement.province, settlement.name), ()):
+                    occurrences.append(Occurrence(layer, settlement.province, settlement.name, svg_x, svg_y))
+        return occurrences
+
+    def find_duplicates(self) -> Tuple[List[Dict], List[Tuple[Occurrence, Occurrence, float]]]:
+        """
+        Possible duplicates across provinces and factions, see duplicates.py.
+
+        Repeats within one province are left out: they are in duplicate_settlements.
+
+        Returns:
+            Folded names used in more than one province or faction, and near-coincident
+            pairs of differently named or placed settlements
+        """
+        occurrences = self.settlement_occurrences()
+        names = [group for group in duplicate_name_groups(occurrences)
+                 if len({(o.faction, o.province) for o in group["settlements"]}) > 1]
+        pairs = [(a, b, gap) for a, b, gap in near_coincident_pairs(occurrences)
+                 if (a.province, a.name) != (b.province, b.name)]
+        return names, pairs
+
     def write_duplicate_settlements_log(self):
-        """Write log of duplicate settlements."""
-        if not self.duplicate_settlements:
+        """Write log of duplicate and near-duplicate settlements."""
+        names, pairs = self.find_duplicates()
+        if not self.duplicate_settlements and not names and not pairs:
             return
 
-        output_file = LOGS_DIR / "duplicate_settlements.log"
-        with open(output_file, 'w', encoding='utf-8') as f:
+        output_file = self.logs_dir / "duplicate_settlements.log"
+        with self.log_files.open(output_file.name) as f:
             f.write("Duplicate Settlements Log\n")
             f.write("=" * 80 + "\n\n")
             total_duplicates = sum(len(v) for v in self.duplicate_settlements.values())
             f.write(f"Total provinces with duplicates: {len(self.duplicate_settlements)}\n")
-            f.write(f"Total duplicate entries: {total_duplicates}\n\n")
+            f.write(f"Total duplicate entries: {total_duplicates}\n")
+            f.write(f"Names in several provinces or factions: {len(names)}\n")
+            f.write(f"Near-coincident settlements: {len(pairs)}\n\n")
 
             for province, duplicates in self.duplicate_settlements.items():
                 f.write(f"Province: {province}\n")
                 for dup in duplicates:
                     f.write(f"  Name: {dup['name']}\n")
+                    f.write(f"  Occurrences: {dup['occurrences']}\n")
                     f.write(f"  Coordinates: {dup.get('coordinates', [])}\n")
                 f.write("-" * 80 + "\n")
 
+            if names:
+                f.write("\nSAME NAME IN SEVERAL PROVINCES OR FACTIONS\n")
+                f.write("-" * 80 + "\n")
+                for group in names:
+                    f.write(f"{group['folded']} ({group['occurrences']} occurrences)\n")
+                    for o in group["settlements"]:
+                        f.write(f"  {o.faction}/{o.province}: {o.name} at ({o.svg_x:.2f}, {o.svg_y:.2f})\n")
+
+            if pairs:
+                f.write("\nNEAR-COINCIDENT SETTLEMENTS (possible copy-paste errors)\n")
+                f.write("-" * 80 + "\n")
+                for a, b, gap in pairs:
+                    f.write(f"{a.province}/{a.name} and {b.province}/{b.name}: {gap:.3f} SVG units apart "
+                            f"at ({a.svg_x:.2f}, {a.svg_y:.2f})\n")
+
         logger.info(f"Generated {output_file}")
 
     def generate_report(self):
         """Generate the processing report."""
-        output_file = LOGS_DIR / "processing_report.txt"
+        output_file = self.logs_dir / "processing_report.txt"
 
         # Calculate statistics
-        empire_pop_by_province = defaultdict(int)
-        empire_count_by_province = defaultdict(int)
+        cube = self.statistics_cube()
+        provinces_by_faction = defaultdict(list)  # {faction: [[province, count, total, median]]}
+        for faction, *row in cube["provinces"]:
+            provinces_by_faction[faction].append(row)
+        population_by_faction = {faction: total for faction, _, total, _ in cube["factions"]}
 
-        for settlement in self.settlements_empire:
-            empire_pop_by_province[settlement.province] += settlement.population
-            empire_count_by_province[settlement.province] += 1
-
-        westerland_total_pop = sum(s.population for s in self.settlements_westerland)
-        westerland_total_count = len(self.settlements_westerland)
+        total_settlements = sum(len(settlements) for settlements in self.settlements_by_faction.values())
 
         total_road_points = sum(len(road.geo_coordinates) for road in self.roads)
 
-        with open(output_file, 'w', encoding='utf-8') as f:
+        with self.log_files.open(output_file.name) as f:
             f.write("Old World Atlas Map Processing Report\n")
             f.write("=" * 80 + "\n\n")
 
             f.write("SETTLEMENTS SUMMARY\n")
             f.write("-" * 80 + "\n")
-            f.write(f"Empire Total: {len(self.settlements_empire)} settlements\n")
-            f.write(f"Westerland Total: {westerland_total_count} settlements\n")
-            f.write(f"Grand Total: {len(self.settlements_empire) + westerland_total_count} settlements\n\n")
-
-            f.write("EMPIRE SETTLEMENTS BY PROVINCE\n")
-            f.write("-" * 80 + "\n")
-            for province in sorted(empire_count_by_province.keys()):
-                count = empire_count_by_province[province]
-                pop = empire_pop_by_province[province]
-                f.write(f"{province:20s} - {count:3d} settlements, {pop:10,d} total population\n")
+            for layer, settlements in self.settlements_by_faction.items():
+                f.write(f"{layer} Total: {len(settlements)} settlements\n")
+            f.write(f"Grand Total: {total_settlements} settlements\n\n")
+
+            for layer, faction in self.factions.items():
+                if not faction.provinces_from_layers:
+                    continue
+                f.write(f"{layer.upper()} SETTLEMENTS BY PROVINCE\n")
+                f.write("-" * 80 + "\n")
+                for province, count, pop, median in provinces_by_faction[layer]:
+                    f.write(f"{province:20s} - {count:3d} settlements, {pop:10,d} total population, "
+                            f"{median:9,.0f} median\n")
+                f.write("\n")
 
-            f.write(f"\nEmpire Total Population: {sum(empire_pop_by_province.values()):,d}\n")
-            f.write(f"Westerland Total Population: {westerland_total_pop:,d}\n\n")
+            for layer in self.settlements_by_faction:
+                f.write(f"{layer} Total Population: {population_by_faction.get(layer, 0):,d}\n")
+            f.write("\n")
 
             f.write("POINTS OF INTEREST\n")
             f.write("-" * 80 + "\n")
@@ -1453,10 +1708,75 @@ class SVGMapProcessor:
                 f.write(f"{water_type:30s} - {count:3d} labels\n")
             f.write(f"\nTotal Water Labels: {len(self.water_labels)}\n\n")
 
+            deltas = self.epoch_deltas()
+            if any(deltas.values()):
+                f.write("HISTORICAL EPOCHS\n")
+                f.write("-" * 80 + "\n")
+                for epoch, delta in deltas.items():
+                    provinces = sum(1 for changed in delta.values() if "province" in changed)
+                    rulers = sum(1 for changed in delta.values() if "ruler" in changed)
+                    f.write(f"{epoch}: {len(delta):5d} settlements differ from {BASE_EPOCH} "
+                            f"({provinces} province, {rulers} ruler)\n")
+                f.write("\n")
+
+            zoom_counts = defaultdict(int)
+            for settlements in self.settlements_by_faction.values():
+                for settlement in settlements:
+                    if settlement.min_zoom is not None:
+                        zoom_counts[settlement.min_zoom] += 1
+            if zoom_counts:
+                f.write("SETTLEMENTS BY MINIMUM ZOOM\n")
+                f.write("-" * 80 + "\n")
+                shown = 0
+                for zoom in sorted(zoom_counts):
+                    shown += zoom_counts[zoom]
+                    f.write(f"Zoom {zoom:2d}: {zoom_counts[zoom]:5d} new, {shown:5d} shown\n")
+                f.write("\n")
+
+            if self.layer_timings:
+                f.write("LAYER EXTRACTION TIME\n")
+                f.write("-" * 80 + "\n")
+                for layer, seconds in self.layer_timings.items():
+                    f.write(f"{layer:30s} - {seconds * 1000:8.1f} ms\n")
+                f.write("\n")
+
+            if self.instrumentation and self.instrumentation.stages:
+                f.write("PERFORMANCE\n")
+                f.write("-" * 80 + "\n")
+                for line in self.instrumentation.report_lines():
+                    f.write(line + "\n")
+                f.write("\n")
+
+            compressed = [(name, entry["bytes"], [self.outputs.manifest.get(f"{name}.{compression}")
+                                                  for compression in COMPRESSION_FORMATS])
+                          for name, entry in self.outputs.manifest.items() if name.endswith(COMPRESSED_SUFFIXES)]
+            compressed = [row for row in compressed if any(row[2])]
+            if compressed:
+                f.write("COMPRESSED OUTPUTS\n")
+                f.write("-" * 80 + "\n")
+                f.write(f"{'File':40s} {'Bytes':>12s} {'.gz':>18s} {'.br':>18s}\n")
+                for name, size, siblings in compressed:
+                    cells = [f"{sibling['bytes']:10,d} ({sibling['bytes'] / max(size, 1):4.0%})" if sibling
+                             else f"{'-':>18s}" for sibling in siblings]
+                    f.write(f"{name:40s} {size:12,d} {cells[0]:>18s} {cells[1]:>18s}\n")
+                f.write("\n")
+
+            if self.outputs.written or self.outputs.unchanged:
+                f.write("OUTPUT FILES\n")
+                f.write("-" * 80 + "\n")
+                f.write(f"Written: {len(self.outputs.written)}, unchanged: {len(self.outputs.unchanged)}\n")
+                for name in sorted(self.outputs.written):
+                    entry = self.outputs.manifest[name]
+                    f.write(f"  {name:40s} {entry['bytes']:12,d} bytes  {entry['sha256'][:12]}\n")
+                f.write("\n")
+
             f.write("DATA QUALITY ISSUES\n")
             f.write("-" * 80 + "\n")
             f.write(f"Invalid Settlement Elements: {len(self.invalid_settlements)}\n")
             f.write(f"Provinces with Duplicate Names: {len(self.duplicate_settlements)}\n")
+            names, pairs = self.find_duplicates()
+            f.write(f"Names in Several Provinces or Factions: {len(names)}\n")
+            f.write(f"Near-Coincident Settlements: {len(pairs)}\n")
             f.write(f"Settlements with Assigned Population Data: {sum(len(v) for v in self.missing_population_data.values())}\n")
             f.write(f"CSV Settlements Not in SVG: {sum(len(v) for v in self.csv_settlements_not_in_svg.values())}\n")
             f.write(f"Province Mismatches: {len(self.province_mismatches)}\n")
@@ -1494,38 +1814,404 @@ class SVGMapProcessor:
         logger.info(f"Generated {output_file}")
 
 
-def main():
-    """Main entry point."""
-    logger.info("Starting SVG map processing...")
+@dataclass(frozen=True)
+class Stage:
+    """A pipeline step: the steps it needs, and the layer it extracts or the work it runs."""
+    requires: Tuple[str, ...] = ()
+    layer: Optional[str] = None
+    run: Optional[Callable[[SVGMapProcessor], Optional[Dict[str, int]]]] = None  # May return counts
 
-    processor = SVGMapProcessor()
-
-    # Process all data
-    processor.process_settlements_empire()
-    processor.process_settlements_westerland()
-    processor.populate_settlement_data()
-    processor.process_points_of_interest()
-    # processor.process_roads()  # Disabled: road extraction not needed currently
-    processor.process_province_labels()
-    processor.process_water_labels()
-
-    # Generate output files
-    processor.generate_empire_geojson()
-    processor.generate_westerland_geojson()
-    processor.generate_poi_geojson()
-    # processor.generate_roads_geojson()  # Disabled: road extraction not needed currently
-    processor.generate_province_labels_geojson()
-    processor.generate_water_labels_geojson()
-
-    # Write logs
+
+def _write_logs(processor: SVGMapProcessor):
+    """Write the invalid and duplicate settlement logs."""
     processor.write_invalid_settlements_log()
     processor.write_duplicate_settlements_log()
 
-    # Generate report
-    processor.generate_report()
+
+# Declared in dependency order. Extraction stages have no work of their own:
+# all extraction stages of a run share one traversal of the SVG.
+STAGES = {
+    "extract_settlements": Stage(layer="settlements"),
+    "extract_poi": Stage(layer="points_of_interest"),
+    "extract_roads": Stage(layer="roads"),
+    "extract_province_labels": Stage(layer="province_labels"),
+    "extract_water_labels": Stage(layer="water_labels"),
+    "join_gazetteers": Stage(("extract_settlements",), run=SVGMapProcessor.populate_settlement_data),
+    "generalize": Stage(("join_gazetteers",), run=SVGMapProcessor.generalize_settlements),
+    # Labels of all classes compete for space, so every labelled layer waits for it
+    "place_labels": Stage(("generalize", "extract_province_labels", "extract_water_labels"),
+                          run=SVGMapProcessor.place_labels),
+    "settlements": Stage(("place_labels",), run=SVGMapProcessor.generate_settlements_geojson),
+    "zoom_bands": Stage(("place_labels",), run=SVGMapProcessor.generate_zoom_band_geojson),
+    "tag_index": Stage(("join_gazetteers",), run=SVGMapProcessor.generate_tag_index),
+    "search_index": Stage(("join_gazetteers",), run=SVGMapProcessor.generate_search_index),
+    "epochs": Stage(("join_gazetteers",), run=SVGMapProcessor.generate_epoch_deltas),
+    "statistics": Stage(("join_gazetteers",), run=SVGMapProcessor.generate_statistics),
+    "poi": Stage(("extract_poi",), run=SVGMapProcessor.generate_poi_geojson),
+    "roads": Stage(("extract_roads",), run=SVGMapProcessor.generate_roads_geojson),
+    "province_labels": Stage(("place_labels",), run=SVGMapProcessor.generate_province_labels_geojson),
+    "water_labels": Stage(("place_labels",), run=SVGMapProcessor.generate_water_labels_geojson),
+    "sqlite": Stage(("place_labels", "extract_poi", "extract_roads"), run=SVGMapProcessor.generate_sqlite),
+    "logs": Stage(("extract_settlements",), run=_write_logs),
+    # Summarizes whatever else was computed, so it always runs last
+    "report": Stage(("join_gazetteers",), run=SVGMapProcessor.generate_report),
+}
+
+# Stages that can be requested with --only / --skip
+OUTPUT_STAGES = ("settlements", "zoom_bands", "tag_index", "search_index", "epochs", "statistics", "poi", "roads",
+                 "province_labels", "water_labels", "sqlite", "logs", "report")
+
+# Road extraction not needed currently; the SQLite export is opt-in
+DEFAULT_OUTPUTS = tuple(stage for stage in OUTPUT_STAGES if stage not in ("roads", "sqlite"))
+
+# Processor shared with forked output workers (see _run_outputs_parallel)
+_FORK_PROCESSOR: Optional[SVGMapProcessor] = None
+
+
+def plan_stages(targets: Iterable[str]) -> List[str]:
+    """The requested stages plus everything they depend on, in execution order."""
+    needed = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage: {name}")
+        if name not in needed:
+            needed.add(name)
+            stack.extend(STAGES[name].requires)
+    return [name for name in STAGES if name in needed]
+
+
+def _run_forked_stage(name: str) -> Tuple[Dict, Dict]:
+    """Run an output stage in a forked worker on the inherited processor; returns what it wrote."""
+    _FORK_PROCESSOR.outputs.clear_results()
+    _FORK_PROCESSOR.log_files.clear_results()
+    STAGES[name].run(_FORK_PROCESSOR)
+    return _FORK_PROCESSOR.outputs.results(), _FORK_PROCESSOR.log_files.results()
+
+
+def _run_outputs_parallel(processor: SVGMapProcessor, names: List[str], jobs: int):
+    """
+    Run independent output stages concurrently.
+
+    GeoJSON encoding holds the GIL, so forked worker processes are used where
+    the platform supports fork; they inherit the processor without pickling it.
+    Elsewhere the stages run in threads.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    global _FORK_PROCESSOR
+    if "fork" in multiprocessing.get_all_start_methods():
+        _FORK_PROCESSOR = processor
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+                for outputs, log_files in executor.map(_run_forked_stage, names):
+                    processor.outputs.merge(outputs)
+                    processor.log_files.merge(log_files)
+        finally:
+            _FORK_PROCESSOR = None
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(lambda name: STAGES[name].run(processor), names))
+
+
+def dependent_stages(changed: Iterable[str], plan: List[str]) -> List[str]:
+    """Stages of a plan that are, or transitively depend on, one of the changed stages."""
+    affected = set(changed)
+    for name in plan:
+        if any(required in affected for required in STAGES[name].requires):
+            affected.add(name)
+    return [name for name in plan if name in affected]
+
+
+def parse_map(instrumentation: Instrumentation, processor_kwargs: Optional[Dict] = None) -> SVGMapProcessor:
+    """Parse the SVG into a new processor as the parse_svg stage."""
+    with instrumentation.stage("parse_svg") as stage:
+        processor = SVGMapProcessor(**(processor_kwargs or {}))
+        stage.counts["elements"] = sum(1 for _ in processor.root.iter())
+    processor.instrumentation = instrumentation
+    return processor
+
+
+def execute_stages(processor: SVGMapProcessor, stages: List[str], instrumentation: Instrumentation,
+                   jobs: int = 1):
+    """
+    Run the given stages (in plan order) on a parsed map, measuring each one.
+
+    Args:
+        processor: Processor holding the parsed SVG
+        stages: Stage names from plan_stages() or dependent_stages()
+        instrumentation: Collects the stage measurements
+        jobs: Number of output stages to run concurrently
+    """
+    processor.instrumentation = instrumentation
+    processor.outputs.clear_results()
+    processor.log_files.clear_results()
+
+    # Extract every needed layer in one pass over the SVG
+    layers = [STAGES[name].layer for name in stages if STAGES[name].layer]
+    if layers:
+        with instrumentation.stage("extract_layers") as stage:
+            processor.extract_layers(layers)
+            stage.counts["elements_walked"] = processor.elements_walked
+            stage.counts.update(processor.feature_counts())
+
+    # Processing between extraction and output (join_gazetteers, generalize, place_labels)
+    for name in stages:
+        if STAGES[name].run is not None and name not in OUTPUT_STAGES:
+            with instrumentation.stage(name) as stage:
+                counts = STAGES[name].run(processor)
+                stage.counts["settlements"] = processor.feature_counts()["settlements"]
+                stage.counts.update(counts or {})
+
+    outputs = [name for name in stages if name in OUTPUT_STAGES and name != "report"]
+    if jobs > 1 and len(outputs) > 1:
+        with instrumentation.stage("write_outputs") as stage:
+            _run_outputs_parallel(processor, outputs, jobs)
+            stage.counts["stages"] = len(outputs)
+    else:
+        for name in outputs:
+            with instrumentation.stage(name):
+                STAGES[name].run(processor)
+
+    compressible = [name for name in processor.outputs.written + processor.outputs.unchanged
+                    if name.endswith(COMPRESSED_SUFFIXES)]
+    if processor.compress_formats and compressible:
+        with instrumentation.stage("compress_outputs") as stage:
+            compressed = processor.outputs.write_compressed(compressible, processor.compress_formats,
+                                                            jobs=max(jobs, os.cpu_count() or 1))
+            stage.counts["files"] = len(compressed)
+    elif compressible:
+        # Only removes siblings left over from earlier runs that no longer match
+        processor.outputs.write_compressed(compressible, ())
+
+    if processor.outputs.written or processor.outputs.unchanged:
+        processor.outputs.save_manifest()
+        logger.info(f"Outputs: {len(processor.outputs.written)} written, "
+                    f"{len(processor.outputs.unchanged)} unchanged")
+
+    if "report" in stages:
+        with instrumentation.stage("report"):
+            processor.generate_report()
+
+
+def run_pipeline(instrumentation: Instrumentation, processor_kwargs: Optional[Dict] = None,
+                 targets: Iterable[str] = DEFAULT_OUTPUTS, jobs: int = 1) -> SVGMapProcessor:
+    """
+    Run the requested stages and the stages they depend on, measuring each one.
+
+    Args:
+        instrumentation: Collects the stage measurements
+        processor_kwargs: Paths passed to SVGMapProcessor
+        targets: Stages whose outputs are wanted (see OUTPUT_STAGES)
+        jobs: Number of output stages to run concurrently
+    """
+    plan = plan_stages(targets)
+    logger.info(f"Stages: {', '.join(plan)}")
+
+    processor = parse_map(instrumentation, processor_kwargs)
+    execute_stages(processor, plan, instrumentation, jobs)
+    return processor
+
+
+class WatchSession:
+    """Keeps the processed map in memory and rebuilds only what a file change affects."""
+
+    def __init__(self, processor_kwargs: Dict, targets: Iterable[str] = DEFAULT_OUTPUTS, jobs: int = 1):
+        """
+        Args:
+            processor_kwargs: Paths passed to SVGMapProcessor
+            targets: Stages whose outputs are kept up to date
+            jobs: Number of output stages to run concurrently
+        """
+        self.processor_kwargs = dict(processor_kwargs)
+        self.plan = plan_stages(targets)
+        self.jobs = jobs
+        self.processor: Optional[SVGMapProcessor] = None
+
+    @property
+    def svg_path(self) -> Path:
+        return Path(self.processor_kwargs.get("svg_path") or SVG_PATH)
+
+    @property
+    def input_dir(self) -> Path:
+        return Path(self.processor_kwargs.get("input_dir") or INPUT_DIR)
+
+    @property
+    def factions_config(self) -> Path:
+        return Path(self.processor_kwargs.get("factions_config") or FACTIONS_CONFIG)
+
+    def build(self, keep_gazetteers: Optional[Dict] = None) -> List[str]:
+        """
+        Parse the SVG and run the whole plan.
+
+        Args:
+            keep_gazetteers: Already loaded gazetteer indexes that are still current
+
+        Returns:
+            Stages that ran
+        """
+        instrumentation = Instrumentation()
+        processor = parse_map(instrumentation, self.processor_kwargs)
+        if keep_gazetteers:
+            processor._gazetteers.update(keep_gazetteers)
+        execute_stages(processor, self.plan, instrumentation, self.jobs)
+        self.processor = processor
+        return ["parse_svg"] + self.plan
+
+    def handle_changes(self, changed: Iterable[Path]) -> List[str]:
+        """
+        Rebuild the outputs affected by changed files.
+
+        A changed SVG or faction config needs a new parse (gazetteers that did
+        not change are reused); a changed gazetteer only re-runs the join and
+        the stages after it on the extracted features kept in memory.
+
+        Args:
+            changed: Paths reported by FileWatcher
+
+        Returns:
+            Stages that ran (empty if no watched input was affected)
+        """
+        changed = {Path(path).resolve() for path in changed}
+        if self.processor is None or self.factions_config.resolve() in changed:
+            return self.build()
+
+        changed_factions = [layer for layer, faction in self.processor.factions.items()
+                            if (self.input_dir / faction.gazetteer).resolve() in changed]
+
+        if self.svg_path.resolve() in changed:
+            kept = {layer: index for layer, index in self.processor._gazetteers.items()
+                    if layer not in changed_factions}
+            return self.build(keep_gazetteers=kept)
+
+        if not changed_factions:
+            return []
+
+        self.processor.reset_gazetteer_join(changed_factions)
+        stages = dependent_stages(["join_gazetteers"], self.plan)
+        execute_stages(self.processor, stages, Instrumentation(), self.jobs)
+        return stages
+
+    def watch(self, interval: float = 0.1, debounce: float = 0.25):
+        """Build once, then rebuild on every change until interrupted."""
+        self.build()
+        watcher = FileWatcher(files=[self.svg_path, self.factions_config],
+                              directories=[(self.input_dir, "**/*.csv")],
+                              interval=interval, debounce=debounce)
+        logger.info(f"Watching {self.svg_path} and {self.input_dir} for changes (Ctrl+C to stop)")
+
+        try:
+            while True:
+                changed = watcher.wait()
+                started = time.perf_counter()
+                try:
+                    stages = self.handle_changes(changed)
+                except (ET.ParseError, OSError, ValueError) as e:
+                    # Typically a file caught in the middle of being saved; the next save retries
+                    logger.error(f"Rebuild failed: {e}")
+                    continue
+                if stages:
+                    logger.info(f"Rebuilt {', '.join(stages)} in {time.perf_counter() - started:.2f} s")
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Extract GeoJSON layers from the Old World Atlas SVG map.")
+    parser.add_argument("--svg", type=Path, default=SVG_PATH, help=f"Map SVG (default: {SVG_PATH})")
+    parser.add_argument("--input", type=Path, default=INPUT_DIR,
+                        help=f"Gazetteer directory (default: {INPUT_DIR})")
+    parser.add_argument("--out", type=Path, default=OUTPUT_DIR, help=f"Output directory (default: {OUTPUT_DIR})")
+    parser.add_argument("--logs", type=Path, default=None, help=f"Logs directory (default: {LOGS_DIR})")
+    parser.add_argument("--only", type=_stage_list, default=None, metavar="STAGES",
+                        help=f"Comma-separated stages to produce: {','.join(OUTPUT_STAGES)} "
+                             f"(default: all but roads)")
+    parser.add_argument("--skip", type=_stage_list, default=[], metavar="STAGES",
+                        help="Comma-separated stages to leave out")
+    parser.add_argument("--jobs", type=int, default=1, help="Output stages to run concurrently (default: 1)")
+    parser.add_argument("--compress", type=_compression_list, default=(), metavar="FORMATS",
+                        help="Also write precompressed GeoJSON siblings, e.g. gz or gz,br (br needs brotli)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and rebuild affected outputs when the SVG or gazetteers change")
+    parser.add_argument("--list-stages", action="store_true", help="Print the stage graph and exit")
+    parser.add_argument("--profile", nargs="?", const=str(CPROFILE_OUTPUT), metavar="FILE",
+                        help=f"Run under cProfile and write the stats to FILE (default: {CPROFILE_OUTPUT})")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record peak Python allocations per stage with tracemalloc (slower)")
+    args = parser.parse_args(argv)
+
+    if args.list_stages:
+        for name, stage in STAGES.items():
+            requires = f" <- {', '.join(stage.requires)}" if stage.requires else ""
+            print(f"{name}{requires}")
+        return 0
+
+    targets = [name for name in (args.only or DEFAULT_OUTPUTS) if name not in args.skip]
+    if not targets:
+        parser.error("no stages left to run")
+
+    logs_dir = args.logs or LOGS_DIR
+    profile_json = logs_dir / PROFILE_JSON.name if args.logs else PROFILE_JSON
+    args.out.mkdir(parents=True, exist_ok=True)
+    logs_dir.mkdir(parents=True, exist_ok=True)
+
+    logger.info("Starting SVG map processing...")
+
+    processor_kwargs = {"svg_path": args.svg, "input_dir": args.input, "output_dir": args.out, "logs_dir": logs_dir,
+                        "compress_formats": args.compress}
+    if args.watch:
+        WatchSession(processor_kwargs, targets, jobs=max(1, args.jobs)).watch()
+        return 0
+
+    instrumentation = Instrumentation(trace_memory=args.trace_memory)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run_pipeline(instrumentation, processor_kwargs, targets=targets, jobs=max(1, args.jobs))
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            import io
+            import pstats
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(20)
+            logger.info(f"cProfile stats written to {args.profile}\n{summary.getvalue()}")
+
+    instrumentation.write_json(profile_json)
+    for line in instrumentation.report_lines():
+        logger.info(line)
+    logger.info(f"Stage timings written to {profile_json}")
 
     logger.info("Processing complete!")
+    return 0
+
+
+def _stage_list(value: str) -> List[str]:
+    """argparse type for a comma-separated list of output stages."""
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in OUTPUT_STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stage(s): {', '.join(unknown)} "
+                                         f"(choose from {', '.join(OUTPUT_STAGES)})")
+    return names
+
+
+def _compression_list(value: str) -> Tuple[str, ...]:
+    """argparse type for a comma-separated list of compression formats."""
+    formats = tuple(name.strip().lstrip(".") for name in value.split(",") if name.strip())
+    unknown = [name for name in formats if name not in COMPRESSION_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown format(s): {', '.join(unknown)} "
+                                         f"(choose from {', '.join(COMPRESSION_FORMATS)})")
+    return formats
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
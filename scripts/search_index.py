@@ -0,0 +1,141 @@
+"""
+Typeahead search index over settlement names, notes and wiki descriptions.
+
+Built offline so the frontend search box does not scan every settlement
+feature on each keystroke. All text is folded with text_normalize.fold_name
+(NFD diacritic removal, case folding, punctuation to spaces), so "bogen"
+finds "Bögenhafen". The exported index has two parts:
+
+  - names: padded trigrams of the folded settlement names (as in
+    wiki_titles.py) with the settlements containing each one. A query's
+    trigrams are intersected and the candidates confirmed against the folded
+    name, which gives substring matches; one- and two-letter queries use the
+    word-start trigrams and so match the start of a word.
+  - text: the sorted distinct words of the notes and wiki descriptions with
+    the settlements using each one. A query word matches every indexed word
+    it is a prefix of: a binary search over the sorted list.
+
+Settlements are numbered by importance (size category, then population), so
+posting lists are already in ranking order:
+
+    {"documents": [["Reikland|Altdorf", "Altdorf", "altdorf"], ...],
+     "names": {"  a": [0, 12], " al": [0], ...},
+     "words": ["abbey", "altar", ...], "word_documents": [[3, 40], [0], ...]}
+
+search() is the reference implementation of the lookup.
+"""
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set
+
+from tag_index import settlement_key
+from text_normalize import fold_name, ngrams
+
+SEARCH_INDEX_NAME = "search_index.json"
+
+NGRAM_LENGTH = 3
+
+# Shorter words of notes and descriptions are not indexed
+MIN_WORD_LENGTH = 3
+
+STOP_WORDS = frozenset({"and", "are", "but", "for", "from", "has", "its", "into", "not", "that", "the",
+                        "their", "this", "was", "which", "with"})
+
+
+def _query_grams(word: str) -> List[str]:
+    """Trigrams a name containing `word` must have: unpadded, or word-start ones for short words."""
+    if len(word) >= NGRAM_LENGTH:
+        return [word[i:i + NGRAM_LENGTH] for i in range(len(word) - NGRAM_LENGTH + 1)]
+    return [(" " * (NGRAM_LENGTH - 1) + word)[-NGRAM_LENGTH:]]
+
+
+def _text_words(settlement) -> Set[str]:
+    """Indexed words of a settlement's notes and wiki description."""
+    texts = list(settlement.notes)
+    if settlement.wiki.get("description"):
+        texts.append(settlement.wiki["description"])
+    return {word for text in texts for word in fold_name(text).split()
+            if len(word) >= MIN_WORD_LENGTH and word not in STOP_WORDS}
+
+
+def build_search_index(settlements: Iterable) -> Dict:
+    """
+    Build the search index artifact (see the module docstring).
+
+    Args:
+        settlements: Settlement objects of all factions
+
+    Returns:
+        JSON-serializable index
+    """
+    ranked = sorted(settlements, key=lambda s: (-s.size_category, -s.population, s.name, s.province))
+    documents, names, words = [], {}, {}
+    for doc_id, settlement in enumerate(ranked):
+        folded = fold_name(settlement.name)
+        documents.append([settlement_key(settlement), settlement.name, folded])
+        for gram in dict.fromkeys(ngrams(folded, NGRAM_LENGTH)):
+            names.setdefault(gram, []).append(doc_id)
+        for word in _text_words(settlement):
+            words.setdefault(word, []).append(doc_id)
+
+    sorted_words = sorted(words)
+    return {
+        "documents": documents,
+        "names": {gram: names[gram] for gram in sorted(names)},
+        "words": sorted_words,
+        "word_documents": [words[word] for word in sorted_words],
+    }
+
+
+def _name_matches(index: Dict, folded: str) -> List[int]:
+    """Documents whose folded name contains the folded query, by rank."""
+    candidates: Optional[Set[int]] = None
+    for word in folded.split():
+        for gram in _query_grams(word):
+            postings = set(index["names"].get(gram, ()))
+            candidates = postings if candidates is None else candidates & postings
+            if not candidates:
+                return []
+    documents = index["documents"]
+    return sorted(doc_id for doc_id in candidates or () if folded in documents[doc_id][2])
+
+
+def _text_matches(index: Dict, folded: str) -> List[int]:
+    """Documents with, for every query word, a note or description word starting with it, by rank."""
+    words = index["words"]
+    candidates: Optional[Set[int]] = None
+    for query_word in folded.split():
+        matches = set()
+        position = bisect_left(words, query_word)
+        while position < len(words) and words[position].startswith(query_word):
+            matches.update(index["word_documents"][position])
+            position += 1
+        candidates = matches if candidates is None else candidates & matches
+        if not candidates:
+            return []
+    return sorted(candidates or ())
+
+
+def search(index: Dict, query: str, limit: int = 10) -> List[str]:
+    """
+    Settlement keys matching a typeahead query.
+
+    Names starting with the query come first, then other name matches, then
+    matches in notes and descriptions; each group in rank order.
+
+    Args:
+        index: Result of build_search_index() (or the loaded JSON)
+        query: Text typed so far
+        limit: Maximum number of results
+
+    Returns:
+        "<province>|<name>" keys
+    """
+    folded = fold_name(query)
+    if not folded:
+        return []
+    documents = index["documents"]
+    names = _name_matches(index, folded)
+    prefix = [doc_id for doc_id in names if documents[doc_id][2].startswith(folded)]
+    ordered = dict.fromkeys(prefix + names + _text_matches(index, folded))
+    return [documents[doc_id][0] for doc_id in list(ordered)[:limit]]
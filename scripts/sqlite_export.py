@@ -0,0 +1,208 @@
+"""
+SQLite export of the extracted atlas.
+
+Writes settlements (with tags, notes and wiki fields), points of interest,
+province and water labels and roads into one database, so a backend can
+answer questions like "settlements in Reikland over 5,000 people with a wiki
+page" with indexed SQL instead of scanning GeoJSON:
+
+    SELECT name, population FROM settlements
+    WHERE province = 'Reikland' AND population > 5000 AND wiki_url IS NOT NULL;
+
+Coordinates are plain longitude/latitude columns. Where SQLite was built with
+the R*Tree module (the default in Python's sqlite3), the *_rtree tables index
+bounding boxes by row id for spatial queries:
+
+    SELECT s.name FROM settlements s JOIN settlements_rtree r ON r.id = s.id
+    WHERE r.min_lon >= 4 AND r.max_lon <= 6 AND r.min_lat >= 49 AND r.max_lat <= 51;
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+SCHEMA = """
+CREATE TABLE settlements (
+    id INTEGER PRIMARY KEY,
+    faction TEXT NOT NULL,
+    name TEXT NOT NULL,
+    province TEXT NOT NULL,
+    population INTEGER,
+    size_category INTEGER,
+    min_zoom INTEGER,
+    label_priority INTEGER,
+    label_min_zoom INTEGER,
+    label_max_zoom INTEGER,
+    lon REAL,
+    lat REAL,
+    svg_x REAL,
+    svg_y REAL,
+    wiki_title TEXT,
+    wiki_url TEXT,
+    wiki_description TEXT,
+    wiki_image TEXT
+);
+CREATE TABLE settlement_tags (
+    tag TEXT NOT NULL,
+    settlement_id INTEGER NOT NULL REFERENCES settlements(id),
+    PRIMARY KEY (tag, settlement_id)
+) WITHOUT ROWID;
+CREATE TABLE settlement_notes (
+    settlement_id INTEGER NOT NULL REFERENCES settlements(id),
+    position INTEGER NOT NULL,
+    note TEXT NOT NULL,
+    PRIMARY KEY (settlement_id, position)
+);
+CREATE TABLE points_of_interest (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    poi_type TEXT NOT NULL,
+    lon REAL,
+    lat REAL,
+    svg_x REAL,
+    svg_y REAL
+);
+CREATE TABLE province_labels (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    province_type TEXT NOT NULL,
+    formal_title TEXT,
+    part_of TEXT,
+    lon REAL,
+    lat REAL,
+    label_priority INTEGER,
+    label_min_zoom INTEGER,
+    label_max_zoom INTEGER
+);
+CREATE TABLE water_labels (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    waterbody_type TEXT NOT NULL,
+    lon REAL,
+    lat REAL,
+    label_priority INTEGER,
+    label_min_zoom INTEGER,
+    label_max_zoom INTEGER
+);
+CREATE TABLE roads (
+    id INTEGER PRIMARY KEY,
+    road_id TEXT NOT NULL,
+    road_type TEXT NOT NULL,
+    coordinates TEXT NOT NULL  -- JSON array of [lon, lat]
+);
+"""
+
+# Created after the bulk insert, which is faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX settlements_province ON settlements (province, population);
+CREATE INDEX settlements_size_category ON settlements (size_category);
+CREATE INDEX settlements_name ON settlements (name);
+CREATE INDEX settlement_tags_settlement ON settlement_tags (settlement_id);
+CREATE INDEX points_of_interest_type ON points_of_interest (poi_type);
+CREATE INDEX roads_type ON roads (road_type);
+"""
+
+RTREE_TABLES = ("settlements_rtree", "points_of_interest_rtree", "roads_rtree")
+
+
+def _create_rtrees(connection: sqlite3.Connection) -> bool:
+    """Create the R*Tree tables; False if this SQLite build lacks the module."""
+    try:
+        for table in RTREE_TABLES:
+            connection.execute(f"CREATE VIRTUAL TABLE {table} USING rtree(id, min_lon, max_lon, min_lat, max_lat)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def write_atlas_database(path: Path, settlements_by_faction: Dict[str, List], points_of_interest: Iterable,
+                         province_labels: Iterable, water_labels: Iterable, roads: Iterable) -> Dict[str, int]:
+    """
+    Write the extracted atlas into a new SQLite database.
+
+    Args:
+        path: Database file (replaced if it exists)
+        settlements_by_faction: Settlement objects per faction layer
+        points_of_interest: PointOfInterest objects
+        province_labels: ProvinceLabel objects
+        water_labels: WaterLabel objects
+        roads: Road objects
+
+    Returns:
+        Row counts per table
+    """
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+
+    connection = sqlite3.connect(str(path))
+    try:
+        # A throwaway build file needs no journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SCHEMA)
+        has_rtree = _create_rtrees(connection)
+
+        settlements = [(faction, s) for faction, faction_settlements in settlements_by_faction.items()
+                       for s in faction_settlements]
+        connection.executemany(
+            "INSERT INTO settlements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((i, faction, s.name, s.province, s.population, s.size_category, s.min_zoom,
+              s.label_priority, s.label_min_zoom, s.label_max_zoom, s.geo_lon, s.geo_lat, s.svg_x, s.svg_y,
+              s.wiki.get("title"), s.wiki.get("url"), s.wiki.get("description"), s.wiki.get("image"))
+             for i, (faction, s) in enumerate(settlements, start=1)))
+        connection.executemany(
+            "INSERT OR IGNORE INTO settlement_tags VALUES (?, ?)",
+            ((tag, i) for i, (_, s) in enumerate(settlements, start=1) for tag in s.tags))
+        connection.executemany(
+            "INSERT INTO settlement_notes VALUES (?, ?, ?)",
+            ((i, position, note) for i, (_, s) in enumerate(settlements, start=1)
+             for position, note in enumerate(s.notes)))
+
+        points_of_interest = list(points_of_interest)
+        connection.executemany(
+            "INSERT INTO points_of_interest VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((i, p.name, p.poi_type, p.geo_lon, p.geo_lat, p.svg_x, p.svg_y)
+             for i, p in enumerate(points_of_interest, start=1)))
+
+        connection.executemany(
+            "INSERT INTO province_labels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((i, l.name, l.province_type, l.formal_title, l.part_of, l.geo_lon, l.geo_lat,
+              l.label_priority, l.label_min_zoom, l.label_max_zoom)
+             for i, l in enumerate(province_labels, start=1)))
+        connection.executemany(
+            "INSERT INTO water_labels VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((i, l.name, l.waterbody_type, l.geo_lon, l.geo_lat, l.label_priority, l.label_min_zoom,
+              l.label_max_zoom)
+             for i, l in enumerate(water_labels, start=1)))
+
+        roads = [road for road in roads if road.geo_coordinates]
+        connection.executemany(
+            "INSERT INTO roads VALUES (?, ?, ?, ?)",
+            ((i, r.road_id, r.road_type, json.dumps(r.geo_coordinates)) for i, r in enumerate(roads, start=1)))
+
+        if has_rtree:
+            connection.executemany(
+                "INSERT INTO settlements_rtree VALUES (?, ?, ?, ?, ?)",
+                ((i, s.geo_lon, s.geo_lon, s.geo_lat, s.geo_lat) for i, (_, s) in enumerate(settlements, start=1)))
+            connection.executemany(
+                "INSERT INTO points_of_interest_rtree VALUES (?, ?, ?, ?, ?)",
+                ((i, p.geo_lon, p.geo_lon, p.geo_lat, p.geo_lat) for i, p in enumerate(points_of_interest, start=1)))
+            connection.executemany(
+                "INSERT INTO roads_rtree VALUES (?, ?, ?, ?, ?)",
+                ((i, min(lon for lon, _ in r.geo_coordinates), max(lon for lon, _ in r.geo_coordinates),
+                  min(lat for _, lat in r.geo_coordinates), max(lat for _, lat in r.geo_coordinates))
+                 for i, r in enumerate(roads, start=1)))
+
+        connection.executescript(INDEXES)
+        connection.execute("ANALYZE")
+        connection.commit()
+
+        tables = ["settlements", "settlement_tags", "settlement_notes", "points_of_interest",
+                  "province_labels", "water_labels", "roads"]
+        counts = {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+        counts["rtree"] = int(has_rtree)
+    finally:
+        connection.close()
+    return counts
@@ -0,0 +1,99 @@
+"""
+Aggregate settlement statistics, precomputed at build time.
+
+The cube holds the settlement count, total and median population for every
+combination of province, size category and tag type (the part of a tag
+before the colon: source, trade, ...). A settlement is counted once under
+each distinct tag type it has, "none" if it has no tags and "other" for tags
+without a type, so the cells of one province and size category may add up
+to more than its settlements. Exact totals are in the province and faction
+rollups:
+
+    {"columns": ["province", "size_category", "tag_type", "count", "total_population", "median_population"],
+     "cells": [["Reikland", 6, "source", 1, 105000, 105000.0], ...],
+     "provinces": [["Empire", "Reikland", 42, 310512, 1204.5], ...],
+     "factions": [["Empire", 1822, 4012344, 731.0], ...]}
+
+Groups are formed with NumPy (np.unique codes, one sort, reduceat), not
+per-settlement Python loops, so a dashboard-sized cube stays cheap to build.
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from tag_index import split_tag
+
+STATISTICS_NAME = "statistics.json"
+
+UNTAGGED = "none"  # Tag type of settlements without tags
+UNTYPED = "other"  # Tag type of tags without a "type:" prefix
+
+
+def group_statistics(keys: Sequence[Sequence], populations: Sequence[int]) -> List[list]:
+    """
+    Count, total and median population per distinct combination of keys.
+
+    Args:
+        keys: Key columns, each with one value per settlement
+        populations: Population per settlement
+
+    Returns:
+        [*key values, count, total, median] per group, sorted by the keys
+    """
+    populations = np.asarray(populations, dtype=np.int64)
+    if populations.size == 0:
+        return []
+
+    labels, codes = zip(*(np.unique(np.asarray(column), return_inverse=True) for column in keys))
+    group = np.ravel_multi_index([code.ravel() for code in codes], [len(label) for label in labels])
+
+    # Sort by group, then population: each group is one run with its median in the middle
+    order = np.lexsort((populations, group))
+    group, populations = group[order], populations[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    counts = np.diff(np.r_[starts, group.size])
+    totals = np.add.reduceat(populations, starts)
+    medians = (populations[starts + (counts - 1) // 2] + populations[starts + counts // 2]) / 2
+
+    key_codes = np.unravel_index(group[starts], [len(label) for label in labels])
+    key_values = [label[code].tolist() for label, code in zip(labels, key_codes)]
+    return [[*values, count, total, median]
+            for *values, count, total, median in zip(*key_values, counts.tolist(), totals.tolist(),
+                                                     medians.tolist())]
+
+
+def _tag_types(tags: Sequence[str]) -> List[str]:
+    """Distinct tag types of a settlement's tags."""
+    if not tags:
+        return [UNTAGGED]
+    return sorted({split_tag(tag)[0] or UNTYPED for tag in tags})
+
+
+def build_statistics_cube(settlements_by_faction: Dict[str, List]) -> Dict:
+    """
+    Build the statistics cube (see the module docstring).
+
+    Args:
+        settlements_by_faction: Settlement objects per faction layer
+
+    Returns:
+        JSON-serializable cube with its province and faction rollups
+    """
+    settlements = [(faction, s) for faction, faction_settlements in settlements_by_faction.items()
+                   for s in faction_settlements]
+    factions = [faction for faction, _ in settlements]
+    provinces = [s.province for _, s in settlements]
+    populations = [s.population for _, s in settlements]
+
+    # One row per settlement and tag type
+    exploded = [(s.province, s.size_category, tag_type, s.population)
+                for _, s in settlements for tag_type in _tag_types(s.tags)]
+    cell_keys = list(zip(*exploded))[:3] if exploded else []
+
+    return {
+        "columns": ["province", "size_category", "tag_type", "count", "total_population", "median_population"],
+        "cells": group_statistics(cell_keys, [row[3] for row in exploded]),
+        "provinces": group_statistics([factions, provinces], populations),
+        "factions": group_statistics([factions], populations),
+    }
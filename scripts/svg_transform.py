@@ -0,0 +1,148 @@
+"""
+SVG transform handling for the map processor.
+
+Every `transform` attribute is parsed once into a 3x3 affine matrix (parsed
+strings are cached, Inkscape reuses the same transforms a lot). Matrices are
+composed down the group stack while the SVG is traversed, so each element
+carries its current transformation matrix (CTM) and its coordinates can be
+mapped to document space in one NumPy operation per batch.
+
+Supported functions: matrix, translate, scale, rotate, skewX, skewY.
+"""
+
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_FUNCTION_PATTERN = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+_NUMBER_PATTERN = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def _frozen(matrix: np.ndarray) -> np.ndarray:
+    """Mark a matrix read-only so cached instances cannot be modified by callers."""
+    matrix.setflags(write=False)
+    return matrix
+
+
+IDENTITY = _frozen(np.eye(3))
+
+
+def _function_matrix(name: str, args: Tuple[float, ...]) -> np.ndarray:
+    """Build the matrix for a single SVG transform function."""
+    if name == 'matrix' and len(args) == 6:
+        a, b, c, d, e, f = args
+        return np.array([[a, c, e], [b, d, f], [0.0, 0.0, 1.0]])
+    if name == 'translate' and len(args) in (1, 2):
+        tx = args[0]
+        ty = args[1] if len(args) == 2 else 0.0
+        return np.array([[1.0, 0.0, tx], [0.0, 1.0, ty], [0.0, 0.0, 1.0]])
+    if name == 'scale' and len(args) in (1, 2):
+        sx = args[0]
+        sy = args[1] if len(args) == 2 else sx
+        return np.array([[sx, 0.0, 0.0], [0.0, sy, 0.0], [0.0, 0.0, 1.0]])
+    if name == 'rotate' and len(args) in (1, 3):
+        angle = math.radians(args[0])
+        cos_a, sin_a = math.cos(angle), math.sin(angle)
+        rotation = np.array([[cos_a, -sin_a, 0.0], [sin_a, cos_a, 0.0], [0.0, 0.0, 1.0]])
+        if len(args) == 3:
+            cx, cy = args[1], args[2]
+            to_origin = np.array([[1.0, 0.0, -cx], [0.0, 1.0, -cy], [0.0, 0.0, 1.0]])
+            back = np.array([[1.0, 0.0, cx], [0.0, 1.0, cy], [0.0, 0.0, 1.0]])
+            return back @ rotation @ to_origin
+        return rotation
+    if name == 'skewX' and len(args) == 1:
+        return np.array([[1.0, math.tan(math.radians(args[0])), 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    if name == 'skewY' and len(args) == 1:
+        return np.array([[1.0, 0.0, 0.0], [math.tan(math.radians(args[0])), 1.0, 0.0], [0.0, 0.0, 1.0]])
+    raise ValueError(f"Invalid arguments for {name}: {args}")
+
+
+@lru_cache(maxsize=4096)
+def parse_transform(transform: str) -> np.ndarray:
+    """
+    Parse an SVG transform attribute into a 3x3 affine matrix.
+
+    The functions in a transform list apply right to left, so
+    "translate(10,0) scale(2)" scales first and then translates.
+
+    Args:
+        transform: Value of a transform attribute (may be empty)
+
+    Returns:
+        Read-only 3x3 matrix; the identity for empty or invalid transforms
+    """
+    if not transform or not transform.strip():
+        return IDENTITY
+
+    matrix = np.eye(3)
+    try:
+        for name, arg_str in _FUNCTION_PATTERN.findall(transform):
+            args = tuple(float(n) for n in _NUMBER_PATTERN.findall(arg_str))
+            matrix = matrix @ _function_matrix(name, args)
+    except ValueError as e:
+        logger.warning(f"Ignoring invalid transform '{transform}': {e}")
+        return IDENTITY
+
+    return _frozen(matrix)
+
+
+def compose(parent: np.ndarray, transform: str) -> np.ndarray:
+    """
+    Compose a parent CTM with a child's transform attribute.
+
+    Args:
+        parent: CTM of the parent element
+        transform: Child's transform attribute (may be empty)
+
+    Returns:
+        CTM of the child (the parent object itself if the child has no transform)
+    """
+    if not transform:
+        return parent
+    child = parse_transform(transform)
+    if child is IDENTITY:
+        return parent
+    if parent is IDENTITY:
+        return child
+    return _frozen(parent @ child)
+
+
+def apply_transform(matrix: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Map an (N, 2) array of points through one affine matrix.
+
+    Args:
+        matrix: 3x3 affine matrix
+        points: Array of shape (N, 2)
+
+    Returns:
+        Transformed array of shape (N, 2)
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if matrix is IDENTITY:
+        return points
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+def apply_transforms(matrices: Iterable[np.ndarray], points: np.ndarray) -> np.ndarray:
+    """
+    Map N points through N (possibly different) affine matrices at once.
+
+    Args:
+        matrices: Sequence of N 3x3 matrices, one per point
+        points: Array of shape (N, 2)
+
+    Returns:
+        Transformed array of shape (N, 2)
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    stack = np.asarray(matrices, dtype=float).reshape(-1, 3, 3)
+    if len(points) == 0:
+        return points
+    return np.einsum('nij,nj->ni', stack[:, :2, :2], points) + stack[:, :2, 2]
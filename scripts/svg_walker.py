@@ -0,0 +1,196 @@
+"""
+Single-pass, non-recursive traversal of Inkscape SVG layers.
+
+The map processor registers one LayerRoute per top-level layer it wants
+(e.g. "Settlements", "Water Labels"). LayerWalker then visits the whole
+document once with an explicit stack, so deeply nested Inkscape layers can
+never hit Python's recursion limit. While walking it keeps track of:
+
+  - the inkscape:label path below the matched layer, e.g. ("Empire", "Reikland")
+  - the current transformation matrix (CTM) of the enclosing group
+
+Every non-group element inside a matched layer is handed to the route's
+handler for its tag, and the time spent in each route's handlers is recorded.
+
+text_label() extracts the visible text of a <text> element for the handlers.
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+NS = {
+    'svg': 'http://www.w3.org/2000/svg',
+    'inkscape': 'http://www.inkscape.org/namespaces/inkscape',
+    'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd'
+}
+
+# Precomputed qualified names
+TAG_G = f"{{{NS['svg']}}}g"
+TAG_TEXT = f"{{{NS['svg']}}}text"
+TAG_TSPAN = f"{{{NS['svg']}}}tspan"
+TAG_PATH = f"{{{NS['svg']}}}path"
+TAG_TEXTPATH = f"{{{NS['svg']}}}textPath"
+ATTR_LABEL = f"{{{NS['inkscape']}}}label"
+ATTR_ROLE = f"{{{NS['sodipodi']}}}role"
+
+# Children of <text> whose character data is rendered
+TEXT_CONTENT_TAGS = frozenset((TAG_TSPAN, TAG_TEXTPATH))
+
+
+def _starts_line(elem) -> bool:
+    """Whether a tspan starts a new line (Inkscape line tspans or absolutely positioned ones)."""
+    attrib = elem.attrib
+    return attrib.get(ATTR_ROLE) == "line" or "x" in attrib or "y" in attrib
+
+
+def text_label(elem) -> Optional[str]:
+    """
+    Extract the visible text of an SVG <text> element.
+
+    Character data is collected in document order in a single pass: the
+    element's own text, nested tspans at any depth and the tail text that
+    follows each of them. A tspan that starts a new line is separated from
+    the previous text by a space, and whitespace runs collapse to one space.
+
+    Args:
+        elem: <text> element
+
+    Returns:
+        Normalized label text, or None if the element has no text
+    """
+    parts = [elem.text] if elem.text else []
+    # Stack entries: (children iterator, tail text to emit once the children are done)
+    stack = [(iter(elem), None)]
+    while stack:
+        children, tail = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if tail:
+                parts.append(tail)
+            continue
+        if child.tag not in TEXT_CONTENT_TAGS:
+            # <title>, <desc> and the like are not rendered
+            if child.tail:
+                parts.append(child.tail)
+            continue
+        if _starts_line(child):
+            parts.append(" ")
+        if child.text:
+            parts.append(child.text)
+        stack.append((iter(child), child.tail))
+
+    text = " ".join("".join(parts).split())
+    return text or None
+
+
+# handler(element, label_path, group_ctm)
+ElementHandler = Callable[[object, Tuple[Optional[str], ...], object], None]
+
+
+class LayerRoute:
+    """Handlers for the elements of one Inkscape layer."""
+
+    def __init__(self, label: str, handlers: Optional[Dict[str, ElementHandler]] = None,
+                 default: Optional[ElementHandler] = None, all_matches: bool = False,
+                 on_finish: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            label: inkscape:label of the layer
+            handlers: Element tag -> handler
+            default: Handler for tags not in `handlers` (None to ignore them)
+            all_matches: Handle every layer with this label instead of only the first
+            on_finish: Called once after the traversal
+        """
+        self.label = label
+        self.handlers = handlers or {}
+        self.default = default
+        self.all_matches = all_matches
+        self.on_finish = on_finish
+        self.matched = 0
+        self.elements = 0
+        self.seconds = 0.0
+
+
+class LayerWalker:
+    """Walks an SVG tree once and dispatches elements of registered layers."""
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Root element of the parsed SVG
+        """
+        self.root = root
+        self.routes: Dict[str, LayerRoute] = {}
+        self.visited = 0
+        self.seconds = 0.0
+
+    def add(self, route: LayerRoute):
+        """Register a route for a layer label."""
+        self.routes[route.label] = route
+
+    def _claim(self, label: Optional[str]) -> Optional[LayerRoute]:
+        """Return the route for a group label if it should handle this group."""
+        route = self.routes.get(label) if label else None
+        if route is None or (route.matched and not route.all_matches):
+            return None
+        route.matched += 1
+        return route
+
+    def walk(self) -> List[LayerRoute]:
+        """
+        Traverse the document once, dispatching elements of registered layers.
+
+        Returns:
+            Routes whose layer was not found
+        """
+        # Imported here so text_label() users do not load NumPy
+        from svg_transform import IDENTITY, compose
+
+        started = time.perf_counter()
+        # Stack entries: (children iterator, label path inside the route, group CTM, route)
+        stack = [(iter(self.root), (), IDENTITY, None)]
+        unfinished = sum(1 for route in self.routes.values() if not route.all_matches)
+        open_ended = any(route.all_matches for route in self.routes.values())
+
+        while stack:
+            children, path, ctm, route = stack[-1]
+            elem = next(children, None)
+            if elem is None:
+                stack.pop()
+                continue
+            self.visited += 1
+
+            if elem.tag == TAG_G:
+                label = elem.get(ATTR_LABEL)
+                child_ctm = compose(ctm, elem.get("transform", ""))
+                # Groups inside a matched layer belong to it, even if another route has their label
+                claimed = self._claim(label) if route is None else None
+                if claimed is not None:
+                    if not claimed.all_matches:
+                        unfinished -= 1
+                    stack.append((iter(elem), (), child_ctm, claimed))
+                elif route is not None:
+                    stack.append((iter(elem), path + (label,), child_ctm, route))
+                elif unfinished or open_ended:
+                    # Groups outside any layer are only entered while a layer is still missing
+                    stack.append((iter(elem), (), child_ctm, None))
+                continue
+
+            if route is not None:
+                handler = route.handlers.get(elem.tag, route.default)
+                if handler is not None:
+                    route.elements += 1
+                    handler_started = time.perf_counter()
+                    handler(elem, path, ctm)
+                    route.seconds += time.perf_counter() - handler_started
+
+        for route in self.routes.values():
+            if route.on_finish is not None:
+                finish_started = time.perf_counter()
+                route.on_finish()
+                route.seconds += time.perf_counter() - finish_started
+
+        self.seconds = time.perf_counter() - started
+
+        return [route for route in self.routes.values() if not route.matched]
@@ -0,0 +1,71 @@
+"""
+Inverted index of settlement tags.
+
+Settlement tags are "type:value" strings (source:2eSH, trade:timber) parsed
+from the Tags and Trade gazetteer columns. The index maps every tag to the
+settlements carrying it, so the frontend can answer "all settlements with
+trade:timber" with one lookup instead of scanning every settlement file.
+
+Settlements are identified by "<province>|<name>" keys: they are stable
+between runs and can be formed from the GeoJSON properties of a feature. The
+exported index lists each key once and refers to settlements by position:
+
+    {"settlements": ["Reikland|Altdorf", ...],
+     "tags": {"trade:timber": [0, 17], ...},
+     "types": {"trade": ["timber", ...], ...}}
+"""
+
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+TAG_INDEX_NAME = "tag_index.json"
+
+
+def settlement_key(settlement) -> str:
+    """Index key of a settlement: "<province>|<name>"."""
+    return sys.intern(f"{settlement.province}|{settlement.name}")
+
+
+def split_tag(tag: str) -> Tuple[str, str]:
+    """(type, value) of a tag; the type is empty for tags without one."""
+    tag_type, separator, tag_value = tag.partition(":")
+    return (tag_type, tag_value) if separator else ("", tag)
+
+
+def build_tag_index(settlements: Iterable) -> Dict[str, List[str]]:
+    """
+    Map every tag to the settlements carrying it.
+
+    Args:
+        settlements: Settlement objects of all factions
+
+    Returns:
+        {tag: sorted settlement keys}, sorted by tag
+    """
+    index: Dict[str, set] = {}
+    for settlement in settlements:
+        key = settlement_key(settlement)
+        for tag in settlement.tags:
+            index.setdefault(tag, set()).add(key)
+    return {tag: sorted(index[tag]) for tag in sorted(index)}
+
+
+def export_tag_index(index: Dict[str, List[str]]) -> Dict:
+    """
+    Compact form of a tag index for the frontend (see the module docstring).
+
+    Args:
+        index: Result of build_tag_index()
+    """
+    keys = sorted({key for keys in index.values() for key in keys})
+    positions = {key: i for i, key in enumerate(keys)}
+    types: Dict[str, List[str]] = {}
+    for tag in index:
+        tag_type, tag_value = split_tag(tag)
+        if tag_type:
+            types.setdefault(tag_type, []).append(tag_value)
+    return {
+        "settlements": keys,
+        "tags": {tag: [positions[key] for key in tag_keys] for tag, tag_keys in index.items()},
+        "types": {tag_type: sorted(values) for tag_type, values in sorted(types.items())},
+    }
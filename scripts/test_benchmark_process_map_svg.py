@@ -0,0 +1,58 @@
+"""
+Tests for the synthetic-map benchmark of process_map_svg.py.
+Runs a tiny benchmark offline to keep the harness working.
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmark_process_map_svg import compare, generate_dataset, run_benchmark
+
+
+class TestSyntheticDataset(unittest.TestCase):
+    """Test the synthetic map and gazetteer generator."""
+
+    def test_same_seed_gives_same_files(self):
+        """Test that datasets are reproducible."""
+        with tempfile.TemporaryDirectory() as tmp:
+            first = generate_dataset(Path(tmp) / "a", 100, roads=2, road_points=8, seed=3)
+            second = generate_dataset(Path(tmp) / "b", 100, roads=2, road_points=8, seed=3)
+            self.assertEqual(first["svg_path"].read_bytes(), second["svg_path"].read_bytes())
+            self.assertEqual((first["input_dir"] / "empire.csv").read_bytes(),
+                             (second["input_dir"] / "empire.csv").read_bytes())
+
+
+class TestBenchmarkRun(unittest.TestCase):
+    """Test a complete benchmark run on a small map."""
+
+    def setUp(self):
+        """Run the benchmark on 300 settlements."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.result = run_benchmark(300, Path(self.tmp.name), depth=5, roads=3, road_points=12)
+
+    def tearDown(self):
+        """Remove the generated files."""
+        self.tmp.cleanup()
+
+    def test_every_stage_is_measured(self):
+        """Test stage names and extracted feature counts."""
+        stages = {stage["name"]: stage for stage in self.result["stages"]}
+        self.assertEqual(list(stages), ["parse_svg", "extract_layers", "join_gazetteers", "generalize",
+                                        "place_labels", "settlements", "zoom_bands", "tag_index", "search_index",
+                                        "epochs", "statistics", "poi", "roads", "province_labels", "water_labels",
+                                        "sqlite", "logs", "report"])
+        counts = stages["extract_layers"]["counts"]
+        self.assertEqual(counts["settlements"], 300)
+        self.assertEqual(counts["roads"], 3)
+        self.assertGreater(self.result["svg_bytes"], 0)
+
+    def test_compare(self):
+        """Test the comparison table against the same results."""
+        results = {"runs": [self.result]}
+        lines = compare(results, results)
+        self.assertEqual(len(lines), 1 + sum(1 for stage in self.result["stages"] if stage["wall_seconds"] > 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,544 @@
+"""
+Test suite for download_wiki_metadata.py
+Network access is mocked; no requests reach the wiki.
+"""
+
+import csv
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+import requests
+
+from download_wiki_metadata import (
+    plan_refresh, fetch_page_info, fetch_page_revisions, has_wiki_metadata, update_original_csv,
+    process_gazetteers, process_settlements, fetch_wiki_metadata, load_refresh_state, save_refresh_state,
+    WikiFetcher
+)
+import gazetteer_io
+from gazetteer_io import merge_metadata_csv, rewrite_csv
+from wiki_images import ThumbnailStore, load_thumbnail_index, thumbnail_variants
+from wiki_titles import TitleIndex, download_all_titles
+
+
+def make_row(name: str, url: str = "", title: str = "", description: str = "", image: str = ""):
+    """Build a gazetteer row with the wiki columns filled in."""
+    return {
+        "Settlement": name,
+        "wiki_url": url,
+        "wiki_title": title,
+        "wiki_description": description,
+        "wiki_image": image
+    }
+
+
+class TestRefreshPlanner(unittest.TestCase):
+    """Test selection of rows for a delta refresh."""
+
+    def setUp(self):
+        """Set up a fixed clock."""
+        self.now = datetime(2026, 1, 31, tzinfo=timezone.utc)
+        self.recent = (self.now - timedelta(days=1)).isoformat()
+        self.old = (self.now - timedelta(days=90)).isoformat()
+
+    def test_has_wiki_metadata_ignores_missing_image(self):
+        """Test that an empty image does not make a row incomplete."""
+        row = make_row("Altdorf", "http://wiki/Altdorf", "Altdorf", "The capital.")
+        self.assertTrue(has_wiki_metadata(row))
+        self.assertFalse(has_wiki_metadata(make_row("Altdorf", "http://wiki/Altdorf", "Altdorf")))
+
+    def test_new_rows_are_fetched(self):
+        """Test that rows never checked before are fetched."""
+        plan = plan_refresh([make_row("Ubersreik")], {}, now=self.now)
+        self.assertEqual(plan["fetch"], ["Ubersreik"])
+
+    def test_recent_rows_are_current(self):
+        """Test that filled rows checked recently are skipped."""
+        rows = [make_row("Altdorf", "http://wiki/Altdorf", "Altdorf", "The capital.")]
+        state = {"Altdorf": {"checked": self.recent, "revid": 10, "found": True}}
+        plan = plan_refresh(rows, state, now=self.now)
+        self.assertEqual(plan["current"], ["Altdorf"])
+        self.assertEqual(plan["fetch"], [])
+
+    def test_stale_filled_rows_are_verified(self):
+        """Test that stale rows with metadata only get a revision check."""
+        rows = [make_row("Altdorf", "http://wiki/Altdorf", "Altdorf", "The capital.")]
+        state = {"Altdorf": {"checked": self.old, "revid": 10, "found": True}}
+        plan = plan_refresh(rows, state, now=self.now)
+        self.assertEqual(plan["verify"], ["Altdorf"])
+
+    def test_recent_not_found_rows_are_current(self):
+        """Test that a recent 'not found' result is not queried again."""
+        state = {"Kleindorf": {"checked": self.recent, "revid": None, "found": False}}
+        plan = plan_refresh([make_row("Kleindorf")], state, now=self.now)
+        self.assertEqual(plan["current"], ["Kleindorf"])
+
+    def test_stale_not_found_rows_are_fetched(self):
+        """Test that an old 'not found' result is retried."""
+        state = {"Kleindorf": {"checked": self.old, "revid": None, "found": False}}
+        plan = plan_refresh([make_row("Kleindorf")], state, now=self.now)
+        self.assertEqual(plan["fetch"], ["Kleindorf"])
+
+    def test_missing_description_is_fetched(self):
+        """Test that a known page without a description is fetched again."""
+        rows = [make_row("Altdorf", "http://wiki/Altdorf", "Altdorf")]
+        state = {"Altdorf": {"checked": self.recent, "revid": 10, "found": True}}
+        plan = plan_refresh(rows, state, now=self.now)
+        self.assertEqual(plan["fetch"], ["Altdorf"])
+
+
+class TestRevisionLookup(unittest.TestCase):
+    """Test batched revision-ID queries."""
+
+    @patch('download_wiki_metadata.time.sleep')
+    @patch('download_wiki_metadata.requests.get')
+    def test_revisions_are_batched(self, mock_get, mock_sleep):
+        """Test that titles are sent 50 at a time and mapped back."""
+        def respond(url, params, timeout):
+            titles = params["titles"].split("|")
+            pages = {str(i): {"title": t, "lastrevid": i} for i, t in enumerate(titles, 1)}
+            response = Mock()
+            response.json.return_value = {"query": {"pages": pages}}
+            return response
+        mock_get.side_effect = respond
+
+        titles = [f"Town {i}" for i in range(120)]
+        revisions = fetch_page_revisions(titles)
+
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(len(revisions), 120)
+        self.assertEqual(revisions["Town 0"], 1)
+
+    @patch('download_wiki_metadata.time.sleep')
+    def test_paced_session_is_not_slowed_twice(self, mock_sleep):
+        """Test that batches sent through a fetcher's paced session skip the extra sleep."""
+        response = Mock()
+        response.json.return_value = {"query": {"pages": {}}}
+        fetcher = WikiFetcher(delay=0)
+        with patch('requests.Session.request', return_value=response) as mock_request:
+            fetch_page_info([f"Town {i}" for i in range(120)], fetcher.session)
+
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(fetcher.request_count, 3)
+        mock_sleep.assert_not_called()
+
+    @patch('download_wiki_metadata.requests.get')
+    def test_missing_and_normalized_titles(self, mock_get):
+        """Test that missing pages map to None and normalized titles map back."""
+        response = Mock()
+        response.json.return_value = {"query": {
+            "normalized": [{"from": "Grey_Lady", "to": "Grey Lady"}],
+            "pages": {
+                "-1": {"title": "Gone", "missing": ""},
+                "7": {"title": "Grey Lady", "lastrevid": 99}
+            }
+        }}
+        mock_get.return_value = response
+
+        revisions = fetch_page_revisions(["Gone", "Grey_Lady"])
+
+        self.assertIsNone(revisions["Gone"])
+        self.assertEqual(revisions["Grey_Lady"], 99)
+
+
+class TestGazetteerRewrite(unittest.TestCase):
+    """Test streaming, atomic updates of gazetteer CSV files."""
+
+    def setUp(self):
+        """Write a small gazetteer and matching metadata CSV."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.gazetteer = os.path.join(self.tmpdir.name, "empire.csv")
+        self.metadata = os.path.join(self.tmpdir.name, "empire_wiki_metadata.csv")
+
+        with open(self.gazetteer, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Settlement", "Population", "wiki_url", "wiki_title", "wiki_description", "wiki_image"])
+            writer.writerow(["Altdorf", "105000", "", "", "", ""])
+            writer.writerow(["Flensburg", "984", "", "", "", ""])
+            writer.writerow(["Bögenhafen", "4900", "", "", "", ""])
+            writer.writerow(["Flensburg", "2537", "", "", "", ""])
+
+        with open(self.metadata, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["settlement", "url", "title", "description", "image"])
+            writer.writerow(["Altdorf", "http://wiki/Altdorf", "Altdorf", "The capital.", ""])
+            writer.writerow(["Flensburg", "http://wiki/Flensburg", "Flensburg", "A town.", ""])
+            writer.writerow(["Flensburg", "http://wiki/Flensburg", "Flensburg", "A town.", ""])
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmpdir.cleanup()
+
+    def read_rows(self):
+        """Read the gazetteer back."""
+        with open(self.gazetteer, "r", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    def test_update_original_csv_joins_rows(self):
+        """Test that metadata is joined onto every matching gazetteer row."""
+        update_original_csv(self.gazetteer, self.metadata)
+
+        rows = self.read_rows()
+        self.assertEqual([r["Settlement"] for r in rows], ["Altdorf", "Flensburg", "Bögenhafen", "Flensburg"])
+        self.assertEqual(rows[0]["wiki_description"], "The capital.")
+        self.assertEqual(rows[1]["wiki_url"], "http://wiki/Flensburg")
+        self.assertEqual(rows[2]["wiki_url"], "")
+        self.assertEqual(rows[3]["wiki_url"], "http://wiki/Flensburg")
+        self.assertEqual(rows[3]["Population"], "2537")
+
+    def write_csv(self, path, header, rows):
+        """Write a CSV file."""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def test_missing_metadata_row_reads_one_row_ahead(self):
+        """Test that a metadata row missing in the middle does not buffer the rest of the file."""
+        names = ["Altdorf", "Bögenhafen", "Carroburg", "Delberz", "Eilhart", "Flensburg"]
+        self.write_csv(self.gazetteer, ["Settlement", "wiki_url"], [[name, ""] for name in names])
+        self.write_csv(self.metadata, ["settlement", "url"],
+                       [[name, f"http://wiki/{name}"] for name in names if name != "Bögenhafen"])
+
+        reads = {"empire.csv": 0, "empire_wiki_metadata.csv": 0}
+        lookahead = []
+
+        class CountingReader(csv.DictReader):
+            def __init__(self, f, *args, **kwargs):
+                super().__init__(f, *args, **kwargs)
+                self.file_name = os.path.basename(f.name)
+
+            def __next__(self):
+                row = super().__next__()
+                reads[self.file_name] += 1
+                lookahead.append(reads["empire_wiki_metadata.csv"] - reads["empire.csv"])
+                return row
+
+        with patch.object(gazetteer_io.csv, "DictReader", CountingReader):
+            updated = merge_metadata_csv(self.gazetteer, self.metadata, {"url": "wiki_url"})
+
+        self.assertEqual(updated, 5)
+        self.assertLessEqual(max(lookahead), 1)
+        rows = self.read_rows()
+        self.assertEqual(rows[1]["wiki_url"], "")
+        self.assertEqual(rows[5]["wiki_url"], "http://wiki/Flensburg")
+
+    def test_out_of_order_metadata_falls_back_to_index(self):
+        """Test that metadata in another order is still joined, with a warning."""
+        self.write_csv(self.metadata, ["settlement", "url", "title", "description", "image"],
+                       [["Flensburg", "http://wiki/Flensburg", "Flensburg", "A town.", ""],
+                        ["Altdorf", "http://wiki/Altdorf", "Altdorf", "The capital.", ""]])
+        with self.assertLogs("gazetteer_io", level="WARNING"):
+            updated = merge_metadata_csv(self.gazetteer, self.metadata, {"url": "wiki_url"})
+        self.assertEqual(updated, 2)
+        self.assertEqual([row["wiki_url"] for row in self.read_rows()],
+                         ["http://wiki/Altdorf", "http://wiki/Flensburg", "", ""])
+
+    def test_failed_rewrite_keeps_original(self):
+        """Test that an error mid-write leaves the original file and no temp files."""
+        with open(self.gazetteer, "rb") as f:
+            original = f.read()
+
+        def fail_on_third_row(index, row):
+            if index == 2:
+                raise RuntimeError("simulated crash")
+            return row
+
+        with self.assertRaises(RuntimeError):
+            rewrite_csv(self.gazetteer, fail_on_third_row)
+
+        with open(self.gazetteer, "rb") as f:
+            self.assertEqual(f.read(), original)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["empire.csv", "empire_wiki_metadata.csv"])
+
+
+class TestBatchMode(unittest.TestCase):
+    """Test non-interactive processing of several gazetteers."""
+
+    def setUp(self):
+        """Create a working directory with two gazetteers sharing a settlement."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        for directory in ("input/gazetteers", "output", "logs"):
+            os.makedirs(directory)
+
+        header = ["Settlement", "Population", "wiki_url", "wiki_title", "wiki_description", "wiki_image"]
+        for name, settlements in (("empire.csv", ["Altdorf", "Marienburg"]),
+                                  ("westerland.csv", ["Marienburg", "Klessen"])):
+            with open(f"input/gazetteers/{name}", "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                for settlement in settlements:
+                    writer.writerow([settlement, "1000", "", "", "", ""])
+
+    def tearDown(self):
+        """Restore the working directory."""
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    @patch('download_wiki_metadata.input', create=True)
+    @patch('download_wiki_metadata.fetch_wiki_metadata')
+    def test_shared_fetcher_deduplicates_and_updates(self, mock_fetch, mock_input):
+        """Test that a shared settlement is fetched once and both CSVs are updated without prompting."""
+        def fake_fetch(name, session=None, thumbnail_widths=None):
+            if name == "Klessen":
+                return None
+            return {"url": f"http://wiki/{name}", "title": name, "description": f"About {name}.",
+                    "image": "", "revid": 1}
+        mock_fetch.side_effect = fake_fetch
+
+        with patch('sys.stdout'):
+            success = process_gazetteers(["empire.csv", "westerland.csv"], update="yes",
+                                         resolve_titles=False)
+
+        self.assertTrue(success)
+        mock_input.assert_not_called()
+        fetched = [call.args[0] for call in mock_fetch.call_args_list]
+        self.assertEqual(sorted(fetched), ["Altdorf", "Klessen", "Marienburg"])
+
+        with open("input/gazetteers/westerland.csv", encoding="utf-8") as f:
+            rows = {row["Settlement"]: row for row in csv.DictReader(f)}
+        self.assertEqual(rows["Marienburg"]["wiki_url"], "http://wiki/Marienburg")
+        self.assertEqual(rows["Klessen"]["wiki_url"], "")
+        self.assertTrue(os.path.exists("output/westerland_wiki_state.json"))
+
+    def test_fetcher_paces_lookups(self):
+        """Test that lookups start no faster than the configured delay."""
+        fetcher = WikiFetcher(workers=2, delay=0.05)
+        with patch('download_wiki_metadata.fetch_wiki_metadata', return_value=None):
+            results = list(fetcher.fetch_many(["A", "B", "C"]))
+            results += list(fetcher.fetch_many(["A"]))
+        self.assertEqual(len(results), 4)
+        self.assertEqual(fetcher.lookups, 3)
+
+    @patch('download_wiki_metadata.time.monotonic', return_value=100.0)
+    @patch('download_wiki_metadata.time.sleep')
+    def test_fetcher_paces_every_request(self, mock_sleep, mock_monotonic):
+        """Test that each HTTP request of a lookup (here one per spelling) is paced."""
+        response = Mock()
+        response.json.return_value = {"query": {"pages": {"-1": {"missing": ""}}}}
+
+        fetcher = WikiFetcher(delay=0.05)
+        with patch('requests.Session.request', return_value=response) as mock_request:
+            list(fetcher.fetch_many(["Bögenhafen"]))
+
+        self.assertEqual(fetcher.lookups, 1)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(fetcher.request_count, 2)
+        # The clock stands still, so the second request waits one full delay
+        self.assertEqual([round(call.args[0], 6) for call in mock_sleep.call_args_list], [0.05])
+
+    @patch('download_wiki_metadata.fetch_page_info')
+    def test_current_rows_backfill_missing_thumbnails(self, mock_page_info):
+        """Test that images of rows skipped as up to date are registered once."""
+        image = TestThumbnails.ORIGINAL["source"]
+        with open("input/gazetteers/empire.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Settlement", "Population", "wiki_url", "wiki_title", "wiki_description", "wiki_image"])
+            writer.writerow(["Marienburg", "1000", "http://wiki/Marienburg", "Marienburg", "A port city.", image])
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        save_refresh_state("output/empire_wiki_state.json",
+                           {"Marienburg": {"checked": now, "revid": 7, "found": True}})
+        mock_page_info.return_value = {"Marienburg": {"revid": 7, "original": TestThumbnails.ORIGINAL,
+                                                      "thumbnail": TestThumbnails.THUMBNAIL}}
+
+        for _ in range(2):
+            with patch('sys.stdout'):
+                self.assertTrue(process_gazetteers(["empire.csv"], update="no", resolve_titles=False))
+
+        mock_page_info.assert_called_once()
+        self.assertEqual(mock_page_info.call_args.args[0], ["Marienburg"])
+        manifest = ThumbnailStore().manifest
+        self.assertEqual(sorted(manifest[image]["thumbnails"]), ["160", "320"])
+
+
+class TestNetworkErrors(unittest.TestCase):
+    """Test that failed requests never erase existing wiki metadata."""
+
+    def setUp(self):
+        """Write a gazetteer with filled rows and a refresh state that makes them due."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.tmpdir.name, name)
+        with open(self.path("empire.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Settlement", "Population", "wiki_url", "wiki_title", "wiki_description", "wiki_image"])
+            writer.writerow(["Altdorf", "105000", "http://wiki/Altdorf", "Altdorf", "The capital.", "http://img/a"])
+            writer.writerow(["Nuln", "80000", "http://wiki/Nuln", "Nuln", "", ""])
+        old = (datetime.now(timezone.utc) - timedelta(days=90)).isoformat(timespec="seconds")
+        self.state = {"Altdorf": {"checked": old, "revid": 1, "found": True},
+                      "Nuln": {"checked": old, "revid": 5, "found": True}}
+        save_refresh_state(self.path("state.json"), self.state)
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmpdir.cleanup()
+
+    def test_request_error_is_raised_not_reported_missing(self):
+        """Test that fetch_wiki_metadata raises instead of returning None when a request fails."""
+        session = Mock()
+        session.get.side_effect = requests.ConnectionError("offline")
+        with self.assertRaises(requests.RequestException):
+            fetch_wiki_metadata("Bögenhafen", session)
+        self.assertEqual(session.get.call_count, 2)
+
+    def test_failed_lookups_keep_existing_data_and_state(self):
+        """Test that rows whose lookup failed keep their metadata and refresh state."""
+        fetcher = WikiFetcher(delay=0)
+        fetcher.revision_cache["Altdorf"] = 2  # Edited since the last check: fetched again
+        fetcher.session = Mock()
+        fetcher.session.get.side_effect = requests.ConnectionError("offline")
+
+        with patch('sys.stdout'):
+            counts = process_settlements(self.path("empire.csv"), self.path("metadata.csv"), self.path("log.txt"),
+                                         state_file=self.path("state.json"), fetcher=fetcher)
+        update_original_csv(self.path("empire.csv"), self.path("metadata.csv"))
+
+        self.assertEqual(counts["errors"], 2)
+        self.assertEqual(load_refresh_state(self.path("state.json")), self.state)
+        with open(self.path("empire.csv"), encoding="utf-8") as f:
+            rows = {row["Settlement"]: row for row in csv.DictReader(f)}
+        self.assertEqual(rows["Altdorf"]["wiki_description"], "The capital.")
+        self.assertEqual(rows["Altdorf"]["wiki_image"], "http://img/a")
+        self.assertEqual(rows["Nuln"]["wiki_url"], "http://wiki/Nuln")
+
+
+class TestThumbnails(unittest.TestCase):
+    """Test thumbnail derivation and the content-addressed image store."""
+
+    ORIGINAL = {
+        "source": "https://static.wikia.nocookie.net/warhammerfb/images/2/2d/Marienburg.png/revision/latest?cb=1",
+        "width": 1000,
+        "height": 500
+    }
+    THUMBNAIL = {
+        "source": "https://static.wikia.nocookie.net/warhammerfb/images/2/2d/Marienburg.png/revision/latest/scale-to-width-down/320?cb=1",
+        "width": 320,
+        "height": 160
+    }
+
+    def test_variants_are_derived_from_one_thumbnail(self):
+        """Test that every configured width is derived from the single API thumbnail."""
+        variants = thumbnail_variants(self.ORIGINAL, self.THUMBNAIL, (160, 320, 2000))
+
+        self.assertIn("/scale-to-width-down/160?", variants["160"]["url"])
+        self.assertEqual(variants["160"]["height"], 80)
+        self.assertEqual(variants["320"]["url"], self.THUMBNAIL["source"])
+        # No upscaling beyond the original
+        self.assertEqual(variants["2000"]["url"], self.ORIGINAL["source"])
+        self.assertEqual(variants["2000"]["width"], 1000)
+
+    def test_no_image_gives_no_variants(self):
+        """Test pages without an image."""
+        self.assertEqual(thumbnail_variants(None, None), {})
+
+    def test_download_is_content_addressed(self):
+        """Test that thumbnails are stored by hash and indexed by original URL."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = ThumbnailStore(os.path.join(tmpdir, "images"))
+            store.register(self.ORIGINAL["source"], 1000, 500,
+                           thumbnail_variants(self.ORIGINAL, self.THUMBNAIL, (160, 320)))
+
+            response = Mock()
+            response.content = b"same bytes"
+            response.headers = {"Content-Type": "image/png"}
+            session = Mock()
+            session.get.return_value = response
+            session.__enter__ = Mock(return_value=session)
+            session.__exit__ = Mock(return_value=False)
+
+            with patch('requests.Session', return_value=session):
+                counts = store.download(workers=2)
+            store.save()
+
+            self.assertEqual(counts, {"downloaded": 2, "failed": 0})
+            # Identical bytes from two URLs are stored once
+            stored_files = [name for _, _, files in os.walk(tmpdir) for name in files if name.endswith(".png")]
+            self.assertEqual(len(stored_files), 1)
+            self.assertEqual([name for _, _, files in os.walk(tmpdir) for name in files if name.endswith(".tmp")], [])
+
+            index = load_thumbnail_index(store.manifest_path, 320)
+            self.assertTrue(index[self.ORIGINAL["source"]].startswith("images/"))
+            self.assertTrue(index[self.ORIGINAL["source"]].endswith(".png"))
+
+
+class TestTitleIndex(unittest.TestCase):
+    """Test local resolution of settlement names to wiki titles."""
+
+    def setUp(self):
+        """Build an index over a handful of titles."""
+        self.index = TitleIndex([
+            "Altdorf", "Bögenhafen", "Waldenhof", "Middenheim", "Talabheim",
+            "Grünburg", "Grunburg (Reikland)", "Kemperbad", "Nuln"
+        ])
+
+    def test_exact_and_folded_matches(self):
+        """Test exact titles and diacritic/case-insensitive matches."""
+        self.assertEqual(self.index.resolve("Altdorf"), ("Altdorf", 1.0))
+        self.assertEqual(self.index.resolve("bogenhafen"), ("Bögenhafen", 1.0))
+
+    def test_qualifier_is_stripped(self):
+        """Test that a trailing province qualifier still resolves."""
+        self.assertEqual(self.index.resolve("Waldenhof (Stirland)")[0], "Waldenhof")
+
+    def test_spelling_variant(self):
+        """Test that a close spelling variant matches by trigram similarity."""
+        title, score = self.index.resolve("Kemperbadt")
+        self.assertEqual(title, "Kemperbad")
+        self.assertLess(score, 1.0)
+
+    def test_unrelated_name_is_not_matched(self):
+        """Test that dissimilar names return None instead of guessing."""
+        self.assertIsNone(self.index.resolve("Ubersreik"))
+        self.assertIsNone(self.index.resolve("Nulm"))
+
+    def test_allpages_download_follows_continuation(self):
+        """Test that the title list is paged with the continue token."""
+        pages = [
+            {"query": {"allpages": [{"title": "Altdorf"}]}, "continue": {"apcontinue": "B", "continue": "-||"}},
+            {"query": {"allpages": [{"title": "Bögenhafen"}]}}
+        ]
+        session = Mock()
+        session.get.side_effect = [Mock(json=Mock(return_value=page)) for page in pages]
+
+        self.assertEqual(download_all_titles(session), ["Altdorf", "Bögenhafen"])
+        self.assertEqual(session.get.call_args_list[1].kwargs["params"]["apcontinue"], "B")
+
+    def test_unmatched_names_cost_no_requests(self):
+        """Test that the fetcher skips names the index cannot match."""
+        fetcher = WikiFetcher(delay=0)
+        fetcher.resolver = self.index
+        with patch('download_wiki_metadata.fetch_wiki_metadata', return_value=None) as mock_fetch:
+            list(fetcher.fetch_many(["Ubersreik", "Waldenhof (Stirland)"]))
+        mock_fetch.assert_called_once()
+        self.assertEqual(mock_fetch.call_args.args[0], "Waldenhof")
+        self.assertEqual(fetcher.lookups, 1)
+
+    def test_linked_page_is_queried_without_index_match(self):
+        """Test that a row with a wiki URL but no description keeps its page when the index has no match."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = lambda name: os.path.join(tmpdir, name)
+            with open(path("empire.csv"), "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Settlement", "Population", "wiki_url", "wiki_title", "wiki_description", "wiki_image"])
+                writer.writerow(["Ubersreik", "6000", "http://wiki/wiki/Ubersreik_(town)", "", "", ""])
+            fetcher = WikiFetcher(delay=0)
+            fetcher.resolver = self.index
+            metadata = {"url": "http://wiki/wiki/Ubersreik_(town)", "title": "Ubersreik (town)",
+                        "description": "A town.", "image": ""}
+            with patch('download_wiki_metadata.fetch_wiki_metadata', return_value=metadata) as mock_fetch, \
+                    patch('sys.stdout'):
+                process_settlements(path("empire.csv"), path("out.csv"), path("log.txt"),
+                                    state_file=path("state.json"), fetcher=fetcher)
+
+            self.assertEqual(mock_fetch.call_args.args[0], "Ubersreik (town)")
+            with open(path("out.csv"), encoding="utf-8") as f:
+                row = next(csv.DictReader(f))
+            self.assertEqual((row["url"], row["description"]), ("http://wiki/wiki/Ubersreik_(town)", "A town."))
+            self.assertTrue(load_refresh_state(path("state.json"))["Ubersreik"]["found"])
+
+
+if __name__ == "__main__":
+    unittest.main()
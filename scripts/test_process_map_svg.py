@@ -3,19 +3,102 @@ Test suite for process_map_svg.py
 Tests new features and validates that existing functionality continues to work.
 """
 
+import math
+import os
+import random
+import sqlite3
+import subprocess
 import unittest
 import tempfile
+import gzip
 import json
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
 from io import StringIO
 import sys
 
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
 # Import the module under test
 from process_map_svg import (
     Settlement, SVGMapProcessor, CoordinateConverter, 
-    CALIBRATION_POINTS
+    CALIBRATION_POINTS, load_faction_config
 )
+from svg_transform import apply_transform, compose, parse_transform, IDENTITY
+from svg_walker import NS, LayerRoute, LayerWalker, text_label
+from generalize import assign_min_zooms
+from instrumentation import Instrumentation
+from label_placement import LabelCandidate, LabelGrid, label_size, place_labels
+from output_manager import brotli_available
+from search_index import build_search_index
+from tag_index import build_tag_index, export_tag_index
+import duplicates
+import generalize
+import process_map_svg
+import search_index
+import statistics_cube
+
+
+# A small Inkscape map with one element per layer type and nested group transforms
+TEST_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd">
+  <g inkscape:label="Settlements" transform="translate(100,0)">
+    <g inkscape:label="Empire">
+      <g inkscape:label="Reikland" transform="translate(0,50)">
+        <text x="10" y="20"><tspan>Altdorf</tspan></text>
+        <g inkscape:label="Estates" transform="scale(2)">
+          <text x="5" y="5"><tspan>Kleindorf</tspan></text>
+        </g>
+        <text x="10" y="20"><tspan>Altdorf</tspan></text>
+        <rect x="0" y="0" width="1" height="1"/>
+      </g>
+      <g inkscape:label="Stirland">
+        <text x="1" y="1"><tspan>Wurtbad</tspan></text>
+      </g>
+    </g>
+    <g inkscape:label="Westerland">
+      <text x="0" y="0"><tspan>Marienburg</tspan></text>
+    </g>
+  </g>
+  <g inkscape:label="Points of Interest">
+    <g inkscape:label="Taverns and Inns" transform="matrix(1,0,0,1,5,5)">
+      <text x="1" y="2"><tspan>Grey Lady Inn</tspan></text>
+    </g>
+  </g>
+  <g inkscape:label="Region-Labels-post2512">
+    <g inkscape:label="Provinces">
+      <text x="300" y="300" transform="rotate(90)"><tspan>Reikland</tspan></text>
+    </g>
+  </g>
+  <g inkscape:label="Water Labels">
+    <g inkscape:label="lakes" transform="translate(1,1)">
+      <g transform="translate(2,2)">
+        <text x="10" y="10"><tspan>Lake Doom</tspan></text>
+      </g>
+    </g>
+    <g inkscape:label="marshes" transform="translate(100,0)">
+      <g inkscape:label="small-marsh">
+        <text x="0" y="0"><tspan>Grey Marsh</tspan></text>
+      </g>
+    </g>
+  </g>
+</svg>
+"""
+
+
+def make_processor(svg_text: str = TEST_SVG) -> SVGMapProcessor:
+    """Build a processor over an SVG string written to a temporary file."""
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".svg", delete=False, encoding="utf-8")
+    with tmp:
+        tmp.write(svg_text)
+    with patch('process_map_svg.SVG_PATH', Path(tmp.name)):
+        processor = SVGMapProcessor()
+    Path(tmp.name).unlink()
+    return processor
 
 
 class TestSettlementDataclass(unittest.TestCase):
@@ -136,6 +219,12 @@ class TestSVGMapProcessorHelperMethods(unittest.TestCase):
         
         self.assertEqual(len(self.processor.invalid_tags), 1)
         self.assertIn("missing format", self.processor.invalid_tags[0]["issues"][0])
+
+    def test_parse_tags_interns_strings(self):
+        """Test that equal tags of different settlements are the same string object."""
+        first = self.processor.parse_tags("", "".join(["tim", "ber"]))
+        second = self.processor.parse_tags("", "timber")
+        self.assertIs(first[0], second[0])
     
     def test_parse_notes(self):
         """Test parsing notes from CSV."""
@@ -282,6 +371,16 @@ class TestRandomPopulationAssignment(unittest.TestCase):
         in_range = sum(1 for p in populations if 50 < p < 5000)
         self.assertGreater(in_range, 50)  # At least 50% should be in reasonable range
 
+    def test_population_is_seeded_per_settlement(self):
+        """Test that a settlement gets the same population from every processor."""
+        with patch('process_map_svg.ET.parse'):
+            other = SVGMapProcessor()
+        populations = [processor._assign_random_population(Settlement("Kleindorf", "Reikland", 0, 0))
+                       for processor in (self.processor, other)]
+        self.assertEqual(populations[0], populations[1])
+        self.assertLessEqual(populations[0], 800)
+        self.assertEqual(self.processor.assigned_populations, {"Reikland": {"Kleindorf": populations[0]}})
+
 
 class TestDataValidationTracking(unittest.TestCase):
     """Test tracking of data validation issues."""
@@ -345,6 +444,836 @@ class TestBackwardCompatibility(unittest.TestCase):
         self.assertEqual(s.geo_lat, 48.0)
 
 
+class TestSVGTransforms(unittest.TestCase):
+    """Test parsing and composition of SVG transforms."""
+
+    def test_parse_functions(self):
+        """Test each supported transform function."""
+        point = np.array([[1.0, 0.0]])
+        np.testing.assert_allclose(apply_transform(parse_transform("translate(3)"), point), [[4, 0]])
+        np.testing.assert_allclose(apply_transform(parse_transform("scale(2,3)"), [[1, 1]]), [[2, 3]])
+        np.testing.assert_allclose(apply_transform(parse_transform("rotate(90)"), point), [[0, 1]], atol=1e-12)
+        np.testing.assert_allclose(apply_transform(parse_transform("rotate(180, 1, 1)"), [[0, 0]]), [[2, 2]], atol=1e-12)
+        np.testing.assert_allclose(apply_transform(parse_transform("matrix(1 0 0 1 -5 2.5e1)"), point), [[-4, 25]])
+
+    def test_transform_list_applies_right_to_left(self):
+        """Test that 'translate(10,0) scale(2)' scales before translating."""
+        matrix = parse_transform("translate(10,0) scale(2)")
+        np.testing.assert_allclose(apply_transform(matrix, [[1, 1]]), [[12, 2]])
+
+    def test_empty_and_invalid_transforms_are_identity(self):
+        """Test fallback to the identity matrix."""
+        self.assertIs(parse_transform(""), IDENTITY)
+        self.assertIs(parse_transform("translate(1,2,3)"), IDENTITY)
+        self.assertIs(compose(IDENTITY, ""), IDENTITY)
+
+    def test_parsed_transforms_are_cached_and_read_only(self):
+        """Test that repeated strings share one read-only matrix."""
+        matrix = parse_transform("translate(7,7)")
+        self.assertIs(parse_transform("translate(7,7)"), matrix)
+        with self.assertRaises(ValueError):
+            matrix[0, 0] = 5
+
+
+class TestLayerExtraction(unittest.TestCase):
+    """Test extraction from a small synthetic Inkscape SVG."""
+
+    def setUp(self):
+        """Extract every layer from the test SVG."""
+        self.processor = make_processor()
+        self.processor.process_settlements_empire()
+        self.processor.process_settlements_westerland()
+        self.processor.process_points_of_interest()
+        self.processor.process_province_labels()
+        self.processor.process_water_labels()
+
+    def test_settlements_use_group_transforms(self):
+        """Test that settlement coordinates include every ancestor transform and the fudge factor."""
+        settlements = {s.name: s for s in self.processor.settlements_empire}
+        self.assertEqual((settlements["Altdorf"].svg_x, settlements["Altdorf"].svg_y), (113.0, 74.0))
+        self.assertEqual((settlements["Kleindorf"].svg_x, settlements["Kleindorf"].svg_y), (116.0, 68.0))
+        self.assertEqual(settlements["Kleindorf"].province, "Reikland")
+        self.assertEqual(settlements["Wurtbad"].province, "Stirland")
+
+    def test_geo_coordinates_match_converter(self):
+        """Test that batched geographic conversion matches the scalar conversion."""
+        settlement = self.processor.settlements_empire[0]
+        lon, lat = self.processor.converter.svg_to_geo(settlement.svg_x, settlement.svg_y)
+        self.assertAlmostEqual(settlement.geo_lon, lon)
+        self.assertAlmostEqual(settlement.geo_lat, lat)
+
+    def test_duplicates_and_invalid_elements(self):
+        """Test duplicate and invalid element tracking."""
+        self.assertEqual([d["name"] for d in self.processor.duplicate_settlements["Reikland"]], ["Altdorf"])
+        self.assertEqual(len(self.processor.invalid_settlements), 1)
+        self.assertEqual(self.processor.invalid_settlements[0]["reason"], "Not a text element")
+
+    def test_westerland_settlements(self):
+        """Test the Westerland faction including the Settlements layer transform."""
+        marienburg = self.processor.settlements_westerland[0]
+        self.assertEqual((marienburg.name, marienburg.province), ("Marienburg", "Westerland"))
+        self.assertEqual((marienburg.svg_x, marienburg.svg_y), (103.0, 4.0))
+
+    def test_labels_and_poi_use_transforms(self):
+        """Test matrix, rotate and nested translate transforms on labels and POI."""
+        poi = self.processor.points_of_interest[0]
+        self.assertEqual((poi.name, poi.poi_type, poi.svg_x, poi.svg_y), ("Grey Lady Inn", "Taverns and Inns", 6.0, 7.0))
+
+        label = self.processor.province_labels[0]
+        self.assertAlmostEqual(label.svg_x, -300.0)
+        self.assertAlmostEqual(label.svg_y, 300.0)
+
+        water = {w.name: w for w in self.processor.water_labels}
+        self.assertEqual((water["Lake Doom"].svg_x, water["Lake Doom"].svg_y), (13.0, 13.0))
+        self.assertEqual((water["Grey Marsh"].svg_x, water["Grey Marsh"].waterbody_type), (100.0, "Small Marsh"))
+
+
+class TestLayerWalker(unittest.TestCase):
+    """Test the single-pass layer walker."""
+
+    def test_single_pass_matches_per_layer_extraction(self):
+        """Test that extract_layers() gives the same features as the per-layer methods."""
+        separate = make_processor()
+        separate.process_settlements_empire()
+        separate.process_settlements_westerland()
+        separate.process_points_of_interest()
+        separate.process_province_labels()
+        separate.process_water_labels()
+
+        combined = make_processor()
+        combined.extract_layers()
+
+        for attr in ("settlements_empire", "settlements_westerland", "points_of_interest",
+                     "province_labels", "water_labels"):
+            self.assertEqual(getattr(combined, attr), getattr(separate, attr), attr)
+
+    def test_deeply_nested_layers(self):
+        """Test nesting far beyond the recursion limit."""
+        depth = sys.getrecursionlimit() + 100
+        nested = '<g transform="translate(1,0)">' * depth + '<text x="0" y="0">Deep Lake</text>' + '</g>' * depth
+        lakes = '<g inkscape:label="lakes" transform="translate(1,1)">'
+        svg = TEST_SVG.replace(lakes, lakes + nested)
+        processor = make_processor(svg)
+        processor.process_water_labels()
+
+        water = {w.name: w for w in processor.water_labels}
+        self.assertEqual((water["Deep Lake"].svg_x, water["Deep Lake"].waterbody_type), (depth + 1.0, "Lake"))
+
+    def test_nested_group_stays_with_enclosing_layer(self):
+        """Test that a group inside a matched layer is not claimed by the route of its label."""
+        root = ET.fromstring(
+            f'<svg xmlns="{NS["svg"]}" xmlns:inkscape="{NS["inkscape"]}">'
+            '<g inkscape:label="Settlements"><g inkscape:label="Reikland">'
+            '<g inkscape:label="Roads"><text>Altdorf</text></g></g></g>'
+            '<g inkscape:label="Roads"><path d="M 0,0 L 1,1"/></g></svg>')
+        seen = []
+        walker = LayerWalker(root)
+        walker.add(LayerRoute("Settlements", default=lambda elem, path, ctm: seen.append(("Settlements", path))))
+        walker.add(LayerRoute("Roads", default=lambda elem, path, ctm: seen.append(("Roads", path)),
+                              all_matches=True))
+
+        self.assertEqual(walker.walk(), [])
+        self.assertEqual(seen, [("Settlements", ("Reikland", "Roads")), ("Roads", ())])
+        self.assertEqual(walker.routes["Roads"].matched, 1)
+
+    def test_roads(self):
+        """Test unlabeled and typed roads across several Roads layers."""
+        roads = (
+            '<g inkscape:label="Roads"><path d="M 0,0 L 10,0"/></g>'
+            '<g inkscape:label="Roads" transform="translate(5,5)">'
+            '<g inkscape:label="Paths"><path d="M 0,0 L 0,10"/></g>'
+            '<g inkscape:label="Rivers"><path d="M 0,0 L 1,1"/></g></g>'
+        )
+        processor = make_processor(TEST_SVG.replace('</svg>', roads + '</svg>'))
+        processor.process_roads()
+
+        self.assertEqual([(r.road_id, r.road_type) for r in processor.roads],
+                         [("road_000", "Road"), ("road_001", "Paths")])
+        lon, lat = processor.converter.svg_to_geo(5, 5)
+        self.assertAlmostEqual(processor.roads[1].geo_coordinates[0][0], lon)
+        self.assertAlmostEqual(processor.roads[1].geo_coordinates[0][1], lat)
+
+
+class TestFactionConfig(unittest.TestCase):
+    """Test config-driven multi-faction settlement extraction."""
+
+    CONFIG = """
+[[faction]]
+layer = "Empire"
+gazetteer = "empire.csv"
+output = "empire_settlements.geojson"
+provinces_from_layers = true
+province_column = "Province_2515"
+
+[[faction]]
+layer = "Bretonnia"
+gazetteer = "bretonnia.csv"
+output = "bretonnia_settlements.geojson"
+"""
+
+    def setUp(self):
+        """Write a config with a new faction, its gazetteer and a matching SVG layer."""
+        self.tmp = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp.name)
+        (tmp_path / "factions.toml").write_text(self.CONFIG, encoding="utf-8")
+        (tmp_path / "empire.csv").write_text(
+            "Settlement,Population,Province_2515\nAltdorf,105000,Reikland\nNuln,63000,Wissenland\n",
+            encoding="utf-8")
+        (tmp_path / "bretonnia.csv").write_text(
+            "Settlement,Population\nCouronne,41000\n", encoding="utf-8")
+
+        bretonnia = '<g inkscape:label="Bretonnia"><text x="2" y="2"><tspan>Couronne</tspan></text></g>'
+        svg = TEST_SVG.replace('<g inkscape:label="Westerland">', bretonnia + '<g inkscape:label="Westerland">')
+        with patch('process_map_svg.FACTIONS_CONFIG', tmp_path / "factions.toml"), \
+                patch('process_map_svg.INPUT_DIR', tmp_path):
+            self.processor = make_processor(svg)
+            self.processor.process_settlements()
+            self.processor.populate_settlement_data()
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp.cleanup()
+
+    def test_config_loading(self):
+        """Test that factions are read from the TOML file in order."""
+        factions = load_faction_config(Path(self.tmp.name) / "factions.toml")
+        self.assertEqual(list(factions), ["Empire", "Bretonnia"])
+        self.assertEqual(factions["Bretonnia"].province, "Bretonnia")
+        self.assertTrue(factions["Empire"].provinces_from_layers)
+
+    def test_new_faction_needs_only_configuration(self):
+        """Test that a configured faction is extracted and joined with its gazetteer."""
+        couronne = self.processor.settlements_by_faction["Bretonnia"][0]
+        self.assertEqual((couronne.name, couronne.province, couronne.population), ("Couronne", "Bretonnia", 41000))
+        self.assertEqual(self.processor.settlements_empire[0].population, 105000)
+        # Westerland is not configured, so its layer is ignored
+        self.assertNotIn("Westerland", self.processor.settlements_by_faction)
+
+    def test_csv_settlements_not_in_svg(self):
+        """Test tracking of gazetteer rows that are missing from the map."""
+        self.assertEqual(dict(self.processor.csv_settlements_not_in_svg), {"Wissenland": ["Nuln"]})
+
+
+class TestTextLabel(unittest.TestCase):
+    """Test label text extraction from SVG text elements."""
+
+    SVG_NS = 'xmlns="http://www.w3.org/2000/svg" xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"'
+
+    def label(self, inner: str):
+        """Extract the label of a <text> element with the given content."""
+        return text_label(ET.fromstring(f'<text {self.SVG_NS}>{inner}</text>'))
+
+    def test_plain_and_single_tspan(self):
+        """Test direct text and a single tspan."""
+        self.assertEqual(self.label("Altdorf"), "Altdorf")
+        self.assertEqual(self.label("<tspan>  Altdorf </tspan>"), "Altdorf")
+        self.assertIsNone(self.label("<tspan> </tspan>"))
+
+    def test_nested_tspans_and_tail(self):
+        """Test styled runs inside a word and text after a tspan."""
+        self.assertEqual(self.label("<tspan>Bad <tspan>Kreuz</tspan>nach</tspan>"), "Bad Kreuznach")
+        self.assertEqual(self.label("<tspan>Castle</tspan> Reikguard"), "Castle Reikguard")
+
+    def test_line_tspans_are_separated(self):
+        """Test that multi-line labels keep a space between lines."""
+        lines = '<tspan sodipodi:role="line">Grey</tspan><tspan sodipodi:role="line">Mountains</tspan>'
+        self.assertEqual(self.label(lines), "Grey Mountains")
+        self.assertEqual(self.label('<tspan x="0">Sea of</tspan><tspan x="0" y="5">Claws</tspan>'), "Sea of Claws")
+
+    def test_unrendered_children_are_skipped(self):
+        """Test that <title> content is ignored."""
+        self.assertEqual(self.label("<title>tooltip</title><tspan>Nuln</tspan>"), "Nuln")
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test per-stage instrumentation and the profiled command-line run."""
+
+    def test_stage_records(self):
+        """Test that a stage records times, memory and counts."""
+        instrumentation = Instrumentation(trace_memory=True)
+        with instrumentation.stage("build") as stage:
+            data = [str(i) for i in range(10000)]
+            stage.counts["items"] = len(data)
+
+        record = instrumentation.stages[0]
+        self.assertEqual((record.name, record.counts), ("build", {"items": 10000}))
+        self.assertGreater(record.wall_seconds, 0)
+        self.assertGreater(record.peak_traced_bytes, 0)
+        self.assertIn("items=10,000", instrumentation.report_lines()[1])
+
+    def test_main_writes_profile_outputs(self):
+        """Test the JSON timings, the report section and the cProfile dump of a full run."""
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+            svg_file = tmp_path / "map.svg"
+            svg_file.write_text(TEST_SVG, encoding="utf-8")
+            prof_file = tmp_path / "run.prof"
+            argv = ["--svg", str(svg_file), "--input", tmp, "--out", tmp, "--logs", tmp, "--profile", str(prof_file)]
+            self.assertEqual(process_map_svg.main(argv), 0)
+
+            profile = json.loads((tmp_path / "processing_profile.json").read_text(encoding="utf-8"))
+            stages = {stage["name"]: stage for stage in profile["stages"]}
+            self.assertEqual(stages["extract_layers"]["counts"]["settlements"], 4)
+            self.assertIn("settlements", stages)
+            self.assertIn("PERFORMANCE", (tmp_path / "processing_report.txt").read_text(encoding="utf-8"))
+            self.assertTrue(prof_file.exists())
+            self.assertTrue((tmp_path / "empire_settlements.geojson").exists())
+
+
+class TestCommandLine(unittest.TestCase):
+    """Test selective stage execution from the command line."""
+
+    def setUp(self):
+        """Write the test SVG to a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp.name)
+        self.svg_file = self.tmp_path / "map.svg"
+        self.svg_file.write_text(TEST_SVG, encoding="utf-8")
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp.cleanup()
+
+    def run_main(self, out: str, *args: str) -> Path:
+        """Run main() into a fresh output directory and return it."""
+        out_dir = self.tmp_path / out
+        argv = ["--svg", str(self.svg_file), "--input", str(self.tmp_path), "--out", str(out_dir),
+                "--logs", str(self.tmp_path / "logs"), *args]
+        self.assertEqual(process_map_svg.main(argv), 0)
+        return out_dir
+
+    def test_plan_includes_dependencies_in_order(self):
+        """Test that a target pulls in exactly the stages it needs."""
+        self.assertEqual(process_map_svg.plan_stages(["settlements"]),
+                         ["extract_settlements", "extract_province_labels", "extract_water_labels",
+                          "join_gazetteers", "generalize", "place_labels", "settlements"])
+        self.assertEqual(process_map_svg.plan_stages(["poi"]), ["extract_poi", "poi"])
+
+    def test_only_runs_requested_outputs(self):
+        """Test that --only poi writes only the POI GeoJSON."""
+        out_dir = self.run_main("only", "--only", "poi")
+        self.assertEqual(sorted(p.name for p in out_dir.iterdir()), ["manifest.json", "points_of_interest.geojson"])
+
+    def test_skip_and_parallel_outputs_match_sequential(self):
+        """Test that --jobs gives the same files as a sequential run."""
+        sequential = self.run_main("sequential", "--skip", "report")
+        parallel = self.run_main("parallel", "--skip", "report", "--jobs", "3")
+        names = sorted(p.name for p in sequential.iterdir())
+        self.assertIn("water_labels.geojson", names)
+        self.assertNotIn("empire_roads.geojson", names)
+        self.assertEqual(names, sorted(p.name for p in parallel.iterdir()))
+        for name in names:
+            self.assertEqual((sequential / name).read_bytes(), (parallel / name).read_bytes(), name)
+
+    def test_startup_does_not_import_numpy(self):
+        """Test that importing the module and --list-stages leave NumPy unloaded."""
+        code = ("import sys, process_map_svg; process_map_svg.main(['--list-stages']); "
+                "print(sorted(m for m in ('numpy', 'scipy') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.splitlines()[-1], "[]")
+
+    def test_assigned_populations_are_stored_and_reused(self):
+        """Test that assigned populations persist between runs and stale entries are pruned."""
+        self.run_main("first", "--only", "settlements")
+        store = self.tmp_path / process_map_svg.POPULATION_STORE_NAME
+        assigned = json.loads(store.read_text(encoding="utf-8"))
+        self.assertEqual(sorted(assigned["Reikland"]), ["Altdorf", "Kleindorf"])
+
+        assigned["Reikland"]["Altdorf"] = 555
+        # A settlement renamed or removed from the map since the last run
+        assigned["Reikland"]["Altdorf Alt"] = 321
+        store.write_text(json.dumps(assigned), encoding="utf-8")
+        out_dir = self.run_main("second", "--only", "settlements")
+        with open(out_dir / "empire_settlements.geojson", encoding="utf-8") as f:
+            populations = {feature["properties"]["name"]: feature["properties"]["population"]
+                           for feature in json.load(f)["features"]}
+        self.assertEqual(populations["Altdorf"], 555)
+        self.assertEqual(populations["Kleindorf"], assigned["Reikland"]["Kleindorf"])
+        pruned = json.loads(store.read_text(encoding="utf-8"))
+        self.assertEqual(sorted(pruned["Reikland"]), ["Altdorf", "Kleindorf"])
+
+    def test_failed_population_store_write_keeps_old_store(self):
+        """Test that an interrupted write leaves the previous population store in place."""
+        self.run_main("first", "--only", "settlements")
+        store = self.tmp_path / process_map_svg.POPULATION_STORE_NAME
+        assigned = json.loads(store.read_text(encoding="utf-8"))
+        del assigned["Reikland"]["Kleindorf"]
+        store.write_text(json.dumps(assigned), encoding="utf-8")
+        before = store.read_bytes()
+
+        with patch('process_map_svg.json.dump', side_effect=KeyboardInterrupt), \
+                self.assertRaises(KeyboardInterrupt):
+            self.run_main("second", "--only", "settlements")
+        self.assertEqual(store.read_bytes(), before)
+        self.assertEqual(sorted(p.name for p in self.tmp_path.glob("*.tmp")), [])
+
+    def test_unchanged_outputs_are_not_rewritten(self):
+        """Test that a second identical run leaves every output file untouched."""
+        out_dir = self.run_main("outputs", "--skip", "report")
+        before = {p.name: p.stat().st_mtime_ns for p in out_dir.iterdir()}
+        manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))["files"]
+        self.assertEqual(sorted(manifest), sorted(name for name in before if name != "manifest.json"))
+        self.assertEqual(manifest["water_labels.geojson"]["bytes"], (out_dir / "water_labels.geojson").stat().st_size)
+
+        for path in out_dir.iterdir():
+            os.utime(path, ns=(0, 0))
+        self.run_main("outputs", "--skip", "report", "--jobs", "2")
+        self.assertTrue(all(p.stat().st_mtime_ns == 0 for p in out_dir.iterdir()))
+
+    def test_precompressed_siblings(self):
+        """Test deterministic .gz siblings, their manifest entries and the report table."""
+        out_dir = self.run_main("compressed", "--only", "poi,report", "--compress", "gz,br")
+        geojson = out_dir / "points_of_interest.geojson"
+        gz_file = out_dir / "points_of_interest.geojson.gz"
+        self.assertEqual(gzip.decompress(gz_file.read_bytes()), geojson.read_bytes())
+        self.assertEqual((out_dir / "points_of_interest.geojson.br").exists(), brotli_available())
+        manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))["files"]
+        self.assertEqual(manifest["points_of_interest.geojson.gz"]["bytes"], gz_file.stat().st_size)
+        report = (self.tmp_path / "logs" / "processing_report.txt").read_text(encoding="utf-8")
+        self.assertIn("COMPRESSED OUTPUTS", report)
+
+        first = gz_file.read_bytes()
+        self.run_main("compressed", "--only", "poi", "--compress", "gz")
+        self.assertEqual(gz_file.read_bytes(), first)
+
+    def test_stale_siblings_are_removed(self):
+        """Test that a rewritten file without --compress loses its old .gz."""
+        out_dir = self.run_main("stale", "--only", "poi", "--compress", "gz")
+        self.svg_file.write_text(TEST_SVG.replace("Grey Lady Inn", "Blue Lady Inn"), encoding="utf-8")
+        self.run_main("stale", "--only", "poi")
+        self.assertFalse((out_dir / "points_of_interest.geojson.gz").exists())
+
+    def test_unknown_stage_is_rejected(self):
+        """Test argument validation of stage names."""
+        with patch('sys.stderr', new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                process_map_svg.main(["--only", "bridges"])
+
+
+class TestWatchMode(unittest.TestCase):
+    """Test change detection and incremental rebuilds of --watch."""
+
+    CONFIG = """
+[[faction]]
+layer = "Empire"
+gazetteer = "empire.csv"
+output = "empire_settlements.geojson"
+provinces_from_layers = true
+province_column = "Province_2515"
+"""
+
+    def setUp(self):
+        """Write a map, a faction config and its gazetteer, then build once."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp.name)
+        (self.tmp_path / "map.svg").write_text(TEST_SVG, encoding="utf-8")
+        (self.tmp_path / "factions.toml").write_text(self.CONFIG, encoding="utf-8")
+        self.gazetteer = self.tmp_path / "empire.csv"
+        self.write_gazetteer(105000)
+        for directory in ("out", "logs"):
+            (self.tmp_path / directory).mkdir()
+        self.session = process_map_svg.WatchSession({
+            "svg_path": self.tmp_path / "map.svg", "input_dir": self.tmp_path,
+            "output_dir": self.tmp_path / "out", "logs_dir": self.tmp_path / "logs",
+            "factions_config": self.tmp_path / "factions.toml",
+        })
+        self.session.build()
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp.cleanup()
+
+    def write_gazetteer(self, population: int):
+        """Write the Empire gazetteer with the given Altdorf population."""
+        self.gazetteer.write_text(f"Settlement,Population,Province_2515\nAltdorf,{population},Reikland\n",
+                                  encoding="utf-8")
+
+    def altdorf_population(self) -> int:
+        """Population of Altdorf in the written GeoJSON."""
+        with open(self.tmp_path / "out" / "empire_settlements.geojson", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        return next(f["properties"]["population"] for f in features if f["properties"]["name"] == "Altdorf")
+
+    def test_watcher_reports_changed_gazetteer(self):
+        """Test that a modified CSV is reported once the debounce period has passed."""
+        watcher = process_map_svg.FileWatcher(directories=[(self.tmp_path, "*.csv")], interval=0.01, debounce=0.02)
+        self.assertEqual(watcher.wait(timeout=0.05), set())
+        self.write_gazetteer(1)
+        stat = self.gazetteer.stat()
+        os.utime(self.gazetteer, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(watcher.wait(timeout=1), {self.gazetteer})
+
+    def test_gazetteer_change_reuses_extracted_layers(self):
+        """Test that a CSV change only re-runs the join and its outputs."""
+        self.assertEqual(self.altdorf_population(), 105000)
+        self.write_gazetteer(120000)
+        processor = self.session.processor
+        with patch.object(processor, 'extract_layers') as extract:
+            stages = self.session.handle_changes([self.gazetteer])
+        extract.assert_not_called()
+        self.assertIs(self.session.processor, processor)
+        self.assertEqual(stages, ["join_gazetteers", "generalize", "place_labels", "settlements", "zoom_bands",
+                                  "tag_index", "search_index", "epochs", "statistics", "province_labels",
+                                  "water_labels", "report"])
+        self.assertEqual(self.altdorf_population(), 120000)
+
+    def test_svg_change_reparses_map(self):
+        """Test that an SVG change rebuilds everything with the cached gazetteer."""
+        svg = TEST_SVG.replace("Wurtbad", "Talabheim")
+        (self.tmp_path / "map.svg").write_text(svg, encoding="utf-8")
+        stages = self.session.handle_changes([self.tmp_path / "map.svg"])
+        self.assertEqual(stages[0], "parse_svg")
+        names = [s.name for s in self.session.processor.settlements_empire]
+        self.assertIn("Talabheim", names)
+        self.assertEqual(self.altdorf_population(), 105000)
+
+    def test_unrelated_change_is_ignored(self):
+        """Test that files not used by any stage trigger nothing."""
+        self.assertEqual(self.session.handle_changes([self.tmp_path / "notes.csv"]), [])
+
+
+class TestGeneralization(unittest.TestCase):
+    """Test minimum zoom assignment and the zoom band files."""
+
+    def test_size_category_sets_earliest_zoom(self):
+        """Test that isolated settlements appear at their size category's zoom."""
+        zooms = assign_min_zooms([(0.0, 50.0, 6, 100000), (10.0, 45.0, 1, 120)])
+        self.assertEqual(zooms, [generalize.SIZE_CATEGORY_MIN_ZOOM[6], generalize.SIZE_CATEGORY_MIN_ZOOM[1]])
+
+    def test_declutter_prefers_larger_population(self):
+        """Test that of two cities at the same spot the more populous one is shown first."""
+        zooms = assign_min_zooms([(5.0, 50.0, 5, 20000), (5.0, 50.0, 5, 40000)])
+        self.assertEqual(zooms[1], generalize.SIZE_CATEGORY_MIN_ZOOM[5])
+        self.assertGreater(zooms[0], zooms[1])
+        self.assertLessEqual(zooms[0], generalize.MAX_ZOOM)
+
+    def test_visible_settlements_never_share_a_cell(self):
+        """Test the declutter invariant on a dense random cluster."""
+        rng = random.Random(1)
+        points = [(rng.uniform(0, 2), rng.uniform(49, 51), rng.randint(1, 6), rng.randint(50, 90000))
+                  for _ in range(500)]
+        zooms = assign_min_zooms(points)
+        for zoom in range(generalize.MIN_ZOOM, generalize.MAX_ZOOM):
+            cell = generalize.DECLUTTER_CELL_PIXELS / (256 * 2 ** zoom)
+            cells = [tuple(int(c // cell) for c in generalize.world_xy(lon, lat))
+                     for (lon, lat, _, _), z in zip(points, zooms) if z <= zoom]
+            self.assertEqual(len(cells), len(set(cells)), f"zoom {zoom}")
+        self.assertEqual(max(zooms), generalize.MAX_ZOOM)
+
+    def test_zoom_band_files_partition_settlements(self):
+        """Test that every settlement is in exactly one zoom band file."""
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = Path(tmp) / "out"
+            svg_file = Path(tmp) / "map.svg"
+            svg_file.write_text(TEST_SVG, encoding="utf-8")
+            argv = ["--svg", str(svg_file), "--input", tmp, "--out", str(out_dir), "--logs", tmp,
+                    "--only", "settlements,zoom_bands"]
+            self.assertEqual(process_map_svg.main(argv), 0)
+
+            names = []
+            for low, high in generalize.ZOOM_BANDS:
+                with open(out_dir / generalize.zoom_band_filename(low, high), encoding="utf-8") as f:
+                    for feature in json.load(f)["features"]:
+                        self.assertTrue(low <= feature["properties"]["min_zoom"] <= high)
+                        names.append(feature["properties"]["name"])
+            self.assertEqual(sorted(names), ["Altdorf", "Kleindorf", "Marienburg", "Wurtbad"])
+
+
+class TestLabelPlacement(unittest.TestCase):
+    """Test label collision detection and visibility ranges."""
+
+    def test_higher_priority_wins_overlap(self):
+        """Test that of two labels at the same spot only the more important one is shown."""
+        placements = place_labels([
+            LabelCandidate(5.0, 50.0, "Talabheim", 12, 6, 10, priority=300),
+            LabelCandidate(5.0, 50.0, "Talabecland", 16, 5, 8, priority=800),
+        ])
+        self.assertEqual([p.priority for p in placements], [2, 1])
+        self.assertEqual((placements[1].min_zoom, placements[1].max_zoom), (5, 8))
+        # Hidden while the province label is shown, then visible once it is out of range
+        self.assertEqual((placements[0].min_zoom, placements[0].max_zoom), (9, 10))
+
+    def test_visible_labels_never_overlap(self):
+        """Test the invariant on a dense random cluster, and that visibility ranges are contiguous."""
+        rng = random.Random(2)
+        candidates = [LabelCandidate(rng.uniform(0, 1), rng.uniform(49.5, 50.5), "x" * rng.randint(3, 15),
+                                     rng.choice((10, 12, 16)), rng.randint(4, 9), 10, rng.random())
+                      for _ in range(300)]
+        placements = place_labels(candidates)
+        for zoom in range(4, 11):
+            boxes = []
+            for candidate, placement in zip(candidates, placements):
+                if placement.min_zoom is not None and placement.min_zoom <= zoom <= placement.max_zoom:
+                    x, y = (c * 256 * 2 ** zoom for c in generalize.world_xy(candidate.lon, candidate.lat))
+                    width, height = label_size(candidate.text, candidate.height)
+                    boxes.append((x - width / 2, y - height / 2, x + width / 2, y + height / 2))
+            grid = LabelGrid()
+            for box in boxes:
+                self.assertFalse(grid.collides(box), f"zoom {zoom}")
+                grid.insert(box)
+        self.assertTrue(all(p.max_zoom == 10 for p in placements if p.min_zoom is not None))
+
+    def test_label_properties_in_geojson(self):
+        """Test that label outputs carry priority and visibility range."""
+        with tempfile.TemporaryDirectory() as tmp:
+            svg_file = Path(tmp) / "map.svg"
+            svg_file.write_text(TEST_SVG, encoding="utf-8")
+            argv = ["--svg", str(svg_file), "--input", tmp, "--out", tmp, "--logs", tmp,
+                    "--only", "province_labels,water_labels"]
+            self.assertEqual(process_map_svg.main(argv), 0)
+            with open(Path(tmp) / "water_labels.geojson", encoding="utf-8") as f:
+                properties = [feature["properties"] for feature in json.load(f)["features"]]
+        lake = next(p for p in properties if p["name"] == "Lake Doom")
+        self.assertEqual((lake["label_min_zoom"], lake["label_max_zoom"]), (8, 10))
+        self.assertIsInstance(lake["label_priority"], int)
+
+
+class TestSQLiteExport(unittest.TestCase):
+    """Test the SQLite export stage."""
+
+    def setUp(self):
+        """Export the test map with a small gazetteer."""
+        self.tmp = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp.name)
+        (tmp_path / "map.svg").write_text(TEST_SVG, encoding="utf-8")
+        (tmp_path / "empire.csv").write_text(
+            "Settlement,Population,Province_2515,Tags,Trade,Notes,wiki_url\n"
+            "Altdorf,105000,Reikland,capital,wine,Seat of the Emperor,https://example.org/Altdorf\n",
+            encoding="utf-8")
+        self.argv = ["--svg", str(tmp_path / "map.svg"), "--input", str(tmp_path), "--out", str(tmp_path / "out"),
+                     "--logs", str(tmp_path), "--only", "sqlite"]
+        self.assertEqual(process_map_svg.main(self.argv), 0)
+        self.out_dir = tmp_path / "out"
+        self.connection = sqlite3.connect(str(self.out_dir / "atlas.sqlite"))
+
+    def tearDown(self):
+        """Close the database and remove temporary files."""
+        self.connection.close()
+        self.tmp.cleanup()
+
+    def test_failed_build_leaves_no_build_file(self):
+        """Test that a failing export removes its partial build file and keeps the previous database."""
+        before = (self.out_dir / "atlas.sqlite").read_bytes()
+
+        def fail(path, *layers):
+            Path(path).write_bytes(b"partial")
+            raise sqlite3.OperationalError("disk full")
+
+        with patch('sqlite_export.write_atlas_database', side_effect=fail), \
+                self.assertRaises(sqlite3.OperationalError):
+            process_map_svg.main(self.argv)
+        self.assertFalse((self.out_dir / "atlas.sqlite.build").exists())
+        self.assertEqual((self.out_dir / "atlas.sqlite").read_bytes(), before)
+
+    def test_tables_and_indexed_query(self):
+        """Test settlement rows with wiki fields, tags and notes, and that the province query uses an index."""
+        query = "SELECT name FROM settlements WHERE province = 'Reikland' AND population > 5000 AND wiki_url IS NOT NULL"
+        self.assertEqual(self.connection.execute(query).fetchall(), [("Altdorf",)])
+        plan = " ".join(row[-1] for row in self.connection.execute("EXPLAIN QUERY PLAN " + query))
+        self.assertIn("settlements_province", plan)
+
+        tags = self.connection.execute(
+            "SELECT t.tag FROM settlement_tags t JOIN settlements s ON s.id = t.settlement_id "
+            "WHERE s.name = 'Altdorf' ORDER BY t.tag").fetchall()
+        self.assertIn(("capital",), tags)
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM settlement_notes").fetchone()[0], 1)
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM water_labels").fetchone()[0], 2)
+
+    def test_rtree_query(self):
+        """Test a bounding box query through the R*Tree."""
+        lon, lat = self.connection.execute("SELECT lon, lat FROM settlements WHERE name = 'Marienburg'").fetchone()
+        rows = self.connection.execute(
+            "SELECT s.name FROM settlements s JOIN settlements_rtree r ON r.id = s.id "
+            "WHERE r.min_lon >= ? AND r.max_lon <= ? AND r.min_lat >= ? AND r.max_lat <= ?",
+            (lon - 1e-3, lon + 1e-3, lat - 1e-3, lat + 1e-3)).fetchall()
+        self.assertIn(("Marienburg",), rows)
+
+
+class TestTagIndex(unittest.TestCase):
+    """Test the inverted tag index."""
+
+    def test_build_and_export(self):
+        """Test postings per tag, the compact export and the tag types."""
+        settlements = [
+            Settlement(name="Altdorf", province="Reikland", svg_x=0, svg_y=0, tags=["trade:wine", "source:2eSH"]),
+            Settlement(name="Wurtbad", province="Stirland", svg_x=0, svg_y=0, tags=["trade:wine", "trade:wine"]),
+            Settlement(name="Kleindorf", province="Reikland", svg_x=0, svg_y=0, tags=["capital"]),
+        ]
+        index = build_tag_index(settlements)
+        self.assertEqual(index["trade:wine"], ["Reikland|Altdorf", "Stirland|Wurtbad"])
+
+        exported = export_tag_index(index)
+        keys = exported["settlements"]
+        self.assertEqual([keys[i] for i in exported["tags"]["trade:wine"]], index["trade:wine"])
+        self.assertEqual(exported["types"], {"source": ["2eSH"], "trade": ["wine"]})
+        self.assertEqual([keys[i] for i in exported["tags"]["capital"]], ["Reikland|Kleindorf"])
+
+    def test_tag_index_stage(self):
+        """Test that the tag_index stage writes tag_index.json from the gazetteer tags."""
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+            (tmp_path / "map.svg").write_text(TEST_SVG, encoding="utf-8")
+            (tmp_path / "empire.csv").write_text(
+                "Settlement,Population,Province_2515,Tags,Trade\n"
+                "Altdorf,105000,Reikland,source:2eSH,wine;timber\n"
+                "Wurtbad,9000,Stirland,,wine\n", encoding="utf-8")
+            argv = ["--svg", str(tmp_path / "map.svg"), "--input", str(tmp_path), "--out", str(tmp_path / "out"),
+                    "--logs", str(tmp_path), "--only", "tag_index"]
+            self.assertEqual(process_map_svg.main(argv), 0)
+            with open(tmp_path / "out" / "tag_index.json", encoding="utf-8") as f:
+                exported = json.load(f)
+        keys = exported["settlements"]
+        self.assertEqual([keys[i] for i in exported["tags"]["trade:wine"]], ["Reikland|Altdorf", "Stirland|Wurtbad"])
+        self.assertEqual([keys[i] for i in exported["tags"]["trade:timber"]], ["Reikland|Altdorf"])
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test the typeahead search index."""
+
+    def setUp(self):
+        """Index a few settlements with notes and wiki descriptions."""
+        settlements = [
+            Settlement(name="Bögenhafen", province="Reikland", svg_x=0, svg_y=0, population=5000, size_category=4,
+                       notes=["Site of the Schaffenfest"]),
+            Settlement(name="Altdorf", province="Reikland", svg_x=0, svg_y=0, population=105000, size_category=6,
+                       wiki={"description": "Capital of the Empire on the river Reik."}),
+            Settlement(name="Kleinbogen", province="Stirland", svg_x=0, svg_y=0, population=200, size_category=1),
+        ]
+        self.index = build_search_index(settlements)
+
+    def test_documents_are_ranked(self):
+        """Test that documents are numbered by size category."""
+        self.assertEqual([doc[0] for doc in self.index["documents"]],
+                         ["Reikland|Altdorf", "Reikland|Bögenhafen", "Stirland|Kleinbogen"])
+        self.assertEqual(self.index["documents"][1][2], "bogenhafen")
+
+    def test_name_search_is_folded_and_matches_substrings(self):
+        """Test diacritic folding, prefix matches first and substring matches."""
+        self.assertEqual(search_index.search(self.index, "BOGEN"), ["Reikland|Bögenhafen", "Stirland|Kleinbogen"])
+        self.assertEqual(search_index.search(self.index, "genha"), ["Reikland|Bögenhafen"])
+        self.assertEqual(search_index.search(self.index, "k"), ["Stirland|Kleinbogen"])
+        self.assertEqual(search_index.search(self.index, "xyz"), [])
+
+    def test_notes_and_descriptions_match_word_prefixes(self):
+        """Test that note and wiki description words are found by prefix."""
+        self.assertEqual(search_index.search(self.index, "schaff"), ["Reikland|Bögenhafen"])
+        self.assertEqual(search_index.search(self.index, "capital rei"), ["Reikland|Altdorf"])
+        self.assertNotIn("the", self.index["words"])
+
+    def test_round_trip_through_json(self):
+        """Test that the exported JSON answers queries like the built index."""
+        loaded = json.loads(json.dumps(self.index))
+        self.assertEqual(search_index.search(loaded, "bog"), search_index.search(self.index, "bog"))
+
+
+class TestHistoricalEpochs(unittest.TestCase):
+    """Test the multi-epoch province and ruler join."""
+
+    def setUp(self):
+        """Run the epochs and settlements stages with a gazetteer that has historical columns."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp.name)
+        (self.tmp_path / "map.svg").write_text(TEST_SVG, encoding="utf-8")
+        (self.tmp_path / "empire.csv").write_text(
+            "Settlement,Population,Province_2515,Province_2512,Province_2276,Ruler_2515,Ruler_2512,Ruler_2276\n"
+            "Altdorf,105000,Reikland,,,Karl Franz,Luitpold,\n"
+            "Wurtbad,9000,Stirland,,Talabecland,,,\n", encoding="utf-8")
+        argv = ["--svg", str(self.tmp_path / "map.svg"), "--input", str(self.tmp_path),
+                "--out", str(self.tmp_path / "out"), "--logs", str(self.tmp_path), "--only", "settlements,epochs"]
+        self.assertEqual(process_map_svg.main(argv), 0)
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp.cleanup()
+
+    def read_output(self, name: str) -> dict:
+        """Load a JSON file from the output directory."""
+        with open(self.tmp_path / "out" / name, encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_deltas_hold_only_changed_settlements(self):
+        """Test per-epoch files with changed fields only, and blank cells keeping the newer value."""
+        self.assertEqual(self.read_output("settlements_epoch_2512.json"),
+                         {"epoch": "2512", "base_epoch": "2515",
+                          "settlements": {"Reikland|Altdorf": {"ruler": "Luitpold"}}})
+        self.assertEqual(self.read_output("settlements_epoch_2276.json")["settlements"],
+                         {"Reikland|Altdorf": {"ruler": "Luitpold"}, "Stirland|Wurtbad": {"province": "Talabecland"}})
+
+    def test_base_ruler_in_settlement_features(self):
+        """Test that settlement features carry the base epoch ruler."""
+        features = self.read_output("empire_settlements.geojson")["features"]
+        rulers = {feature["properties"]["name"]: feature["properties"]["ruler"] for feature in features}
+        self.assertEqual(rulers, {"Altdorf": "Karl Franz", "Kleindorf": None, "Wurtbad": None})
+
+
+class TestStatisticsCube(unittest.TestCase):
+    """Test the aggregate statistics cube."""
+
+    def test_group_statistics(self):
+        """Test counts, totals and medians (even and odd group sizes) per key combination."""
+        rows = statistics_cube.group_statistics([["Reikland", "Stirland", "Reikland", "Reikland"], [1, 1, 1, 2]],
+                                                [100, 200, 300, 5000])
+        self.assertEqual(rows, [["Reikland", 1, 2, 400, 200.0], ["Reikland", 2, 1, 5000, 5000.0],
+                                ["Stirland", 1, 1, 200, 200.0]])
+        self.assertEqual(statistics_cube.group_statistics([[]], []), [])
+
+    def test_cube_and_rollups(self):
+        """Test tag type cells and the exact province and faction rollups."""
+        settlements = {
+            "Empire": [
+                Settlement("Altdorf", "Reikland", 0, 0, population=105000, size_category=6,
+                           tags=["source:2eSH", "trade:wine", "trade:timber", "capital"]),
+                Settlement("Kleindorf", "Reikland", 0, 0, population=150, size_category=1),
+                Settlement("Wurtbad", "Stirland", 0, 0, population=9000, size_category=4, tags=["trade:wine"]),
+            ],
+            "Westerland": [Settlement("Marienburg", "Westerland", 0, 0, population=352550, size_category=6)],
+        }
+        cube = statistics_cube.build_statistics_cube(settlements)
+        cells = {tuple(cell[:3]): cell[3:] for cell in cube["cells"]}
+        self.assertEqual(cells[("Reikland", 6, "trade")], [1, 105000, 105000.0])
+        self.assertEqual(cells[("Reikland", 6, "other")], [1, 105000, 105000.0])
+        self.assertEqual(cells[("Reikland", 1, "none")], [1, 150, 150.0])
+        self.assertEqual(cube["provinces"][0], ["Empire", "Reikland", 2, 105150, 52575.0])
+        self.assertEqual(cube["factions"], [["Empire", 3, 114150, 9000.0], ["Westerland", 1, 352550, 352550.0]])
+        json.dumps(cube)
+
+
+class TestDuplicateDetection(unittest.TestCase):
+    """Test duplicate and near-duplicate settlement detection."""
+
+    def test_spatial_hash_matches_brute_force(self):
+        """Test that the spatial hash finds exactly the pairs a full comparison finds."""
+        generator = random.Random(7)
+        occurrences = [duplicates.Occurrence("Empire", "Reikland", f"S{i}", generator.uniform(0, 20),
+                                             generator.uniform(0, 20)) for i in range(300)]
+        expected = {(a.name, b.name) for i, a in enumerate(occurrences) for b in occurrences[i + 1:]
+                    if math.hypot(a.svg_x - b.svg_x, a.svg_y - b.svg_y) <= 0.5}
+        found = {(a.name, b.name) for a, b, _ in duplicates.near_coincident_pairs(occurrences, 0.5)}
+        self.assertEqual(found, expected)
+        self.assertTrue(expected)
+
+    def test_occurrences_across_factions(self):
+        """Test correct repeat counts, folded names across factions and near-coincident labels."""
+        svg = TEST_SVG.replace(
+            '<text x="1" y="1"><tspan>Wurtbad</tspan></text>',
+            '<text x="1" y="1"><tspan>Wurtbad</tspan></text>'
+            '<text x="9" y="9"><tspan>Wurtbad</tspan></text><text x="30" y="9"><tspan>Wurtbad</tspan></text>'
+            '<text x="1.2" y="1"><tspan>Wurtbad Mill</tspan></text>').replace(
+            '<text x="0" y="0"><tspan>Marienburg</tspan></text>',
+            '<text x="0" y="0"><tspan>Marienburg</tspan></text><text x="50" y="50"><tspan>Würtbad</tspan></text>')
+        processor = make_processor(svg)
+        processor.process_settlements()
+        self.assertEqual(processor.duplicate_settlements["Reikland"][0]["occurrences"], 2)
+        stirland = processor.duplicate_settlements["Stirland"]
+        self.assertEqual([(d["name"], d["occurrences"], len(d["coordinates"])) for d in stirland],
+                         [("Wurtbad", 3, 3)])
+
+        names, pairs = processor.find_duplicates()
+        self.assertEqual([(group["folded"], group["occurrences"]) for group in names], [("wurtbad", 4)])
+        self.assertEqual({(a.name, b.name) for a, b, _ in pairs}, {("Wurtbad", "Wurtbad Mill")})
+
+
 def run_tests():
     """Run all tests."""
     # Create test suite
@@ -359,6 +1288,22 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestRandomPopulationAssignment))
     suite.addTests(loader.loadTestsFromTestCase(TestDataValidationTracking))
     suite.addTests(loader.loadTestsFromTestCase(TestBackwardCompatibility))
+    suite.addTests(loader.loadTestsFromTestCase(TestSVGTransforms))
+    suite.addTests(loader.loadTestsFromTestCase(TestLayerExtraction))
+    suite.addTests(loader.loadTestsFromTestCase(TestLayerWalker))
+    suite.addTests(loader.loadTestsFromTestCase(TestTextLabel))
+    suite.addTests(loader.loadTestsFromTestCase(TestInstrumentation))
+    suite.addTests(loader.loadTestsFromTestCase(TestCommandLine))
+    suite.addTests(loader.loadTestsFromTestCase(TestWatchMode))
+    suite.addTests(loader.loadTestsFromTestCase(TestGeneralization))
+    suite.addTests(loader.loadTestsFromTestCase(TestLabelPlacement))
+    suite.addTests(loader.loadTestsFromTestCase(TestSQLiteExport))
+    suite.addTests(loader.loadTestsFromTestCase(TestTagIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestSearchIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestHistoricalEpochs))
+    suite.addTests(loader.loadTestsFromTestCase(TestStatisticsCube))
+    suite.addTests(loader.loadTestsFromTestCase(TestDuplicateDetection))
+    suite.addTests(loader.loadTestsFromTestCase(TestFactionConfig))
     
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)
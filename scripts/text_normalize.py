@@ -0,0 +1,84 @@
+"""
+Name normalization shared by the wiki scripts and the map processor.
+
+Everything here is pure standard library so it can be imported by any
+script without pulling in network or scientific packages.
+"""
+
+import re
+import unicodedata
+from typing import List
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_QUALIFIER = re.compile(r'\s*\([^)]*\)\s*$')
+
+
+def normalize_name_to_latin(name: str) -> str:
+    """
+    Convert non-latin characters to their closest latin equivalents.
+
+    Args:
+        name: Settlement name that may contain non-latin characters
+
+    Returns:
+        Name with non-latin characters replaced by latin equivalents
+    """
+    # Normalize to NFD (decomposed form) and filter out combining characters
+    normalized = unicodedata.normalize('NFD', name)
+    latin_name = ''.join(
+        char for char in normalized
+        if unicodedata.category(char) != 'Mn'  # Mn = Nonspacing_Mark
+    )
+    return latin_name
+
+
+def fold_name(name: str) -> str:
+    """
+    Fold a name for comparison: latin letters, lower case, single spaces.
+
+    Punctuation (hyphens, apostrophes, underscores) becomes a space, so
+    "Bögenhafen", "bogenhafen" and "Bogen-hafen" fold to similar keys.
+
+    Args:
+        name: Name to fold
+
+    Returns:
+        Folded name
+    """
+    folded = normalize_name_to_latin(name).casefold()
+    return _NON_ALNUM.sub(' ', folded).strip()
+
+
+def strip_qualifier(name: str) -> str:
+    """
+    Remove a trailing parenthetical qualifier, e.g. "Waldenhof (Stirland)" -> "Waldenhof".
+
+    Args:
+        name: Name that may end in a qualifier
+
+    Returns:
+        Name without the qualifier
+    """
+    return _QUALIFIER.sub('', name)
+
+
+def ngrams(folded: str, n: int = 3) -> List[str]:
+    """
+    Split a folded name into padded character n-grams.
+
+    Each word is padded with spaces so prefixes and suffixes get their own
+    n-grams, e.g. "ulm" -> ["  u", " ul", "ulm", "lm "].
+
+    Args:
+        folded: Name already passed through fold_name()
+        n: N-gram length
+
+    Returns:
+        List of n-grams (may contain repeats)
+    """
+    grams = []
+    padding = ' ' * (n - 1)
+    for word in folded.split():
+        padded = f"{padding}{word} "
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
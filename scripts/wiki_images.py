@@ -0,0 +1,247 @@
+"""
+Thumbnail metadata and local caching for wiki images.
+
+The wiki query in download_wiki_metadata asks for the original image and a
+thumbnail in the same request. Fandom serves any width of an image by
+rewriting the `scale-to-width-down/<width>` part of the thumbnail URL, so all
+configured widths can be derived from that one answer without extra requests.
+
+Thumbnails can then be downloaded concurrently into a content-addressed store
+under output/images/, where each file is named after the SHA-256 of its bytes.
+A manifest maps every original image URL to its thumbnails, which lets
+process_map_svg point `wiki.image` at a small local file instead of the
+full-resolution image on static.wikia.nocookie.net.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+# Widths (in pixels) requested for every wiki image
+THUMBNAIL_WIDTHS = (160, 320)
+
+IMAGES_DIR = "output/images"
+MANIFEST_NAME = "manifest.json"
+
+_SCALE_PATTERN = re.compile(r'/scale-to-width-down/\d+')
+_EXTENSION_PATTERN = re.compile(r'\.(png|jpe?g|gif|webp|svg)(?=/|\?|$)', re.IGNORECASE)
+
+
+def thumbnail_variants(original: Optional[Dict], thumbnail: Optional[Dict],
+                       widths: Iterable[int] = THUMBNAIL_WIDTHS) -> Dict[str, Dict]:
+    """
+    Derive thumbnail URLs and dimensions for every configured width.
+
+    Args:
+        original: MediaWiki pageimages 'original' entry {source, width, height}
+        thumbnail: MediaWiki pageimages 'thumbnail' entry {source, width, height}
+        widths: Thumbnail widths to derive
+
+    Returns:
+        Dictionary mapping width (as a string, for JSON) to {url, width, height}.
+        Widths at or above the original width point at the original image.
+    """
+    if not original or not original.get('source'):
+        return {}
+
+    source = original['source']
+    original_width = original.get('width') or 0
+    original_height = original.get('height') or 0
+    template = thumbnail.get('source', '') if thumbnail else ''
+
+    variants = {}
+    for width in sorted(set(widths)):
+        if not original_width or width >= original_width:
+            variants[str(width)] = {'url': source, 'width': original_width, 'height': original_height}
+            continue
+
+        if _SCALE_PATTERN.search(template):
+            url = _SCALE_PATTERN.sub(f'/scale-to-width-down/{width}', template)
+        elif thumbnail and thumbnail.get('width') == width:
+            url = template
+        else:
+            # Not a Fandom image and no thumbnail at this width
+            continue
+
+        height = round(original_height * width / original_width) if original_height else 0
+        variants[str(width)] = {'url': url, 'width': width, 'height': height}
+
+    return variants
+
+
+def _extension_for(url: str, content_type: str) -> str:
+    """Pick a file extension from the response content type or the URL."""
+    extension = mimetypes.guess_extension(content_type.split(';')[0].strip()) if content_type else None
+    if extension:
+        return '.jpg' if extension == '.jpe' else extension
+    match = _EXTENSION_PATTERN.search(url)
+    if match:
+        return '.' + match.group(1).lower().replace('jpeg', 'jpg')
+    return '.img'
+
+
+class ThumbnailStore:
+    """
+    Content-addressed store of downloaded wiki thumbnails.
+
+    The manifest has one entry per original image URL:
+        {original_url: {"width", "height", "thumbnails": {width: {"url", "width",
+         "height", "path", "sha256", "bytes"}}}}
+    `path` is relative to the output directory and only set once downloaded.
+    """
+
+    def __init__(self, images_dir: str = IMAGES_DIR):
+        """
+        Args:
+            images_dir: Directory holding the thumbnails and the manifest
+        """
+        self.images_dir = images_dir
+        self.manifest_path = os.path.join(images_dir, MANIFEST_NAME)
+        self.manifest: Dict[str, Dict] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def register(self, original_url: str, width: int, height: int, variants: Dict[str, Dict]):
+        """
+        Record the thumbnails available for an original image.
+
+        Download results from earlier runs are kept when the URL is unchanged.
+
+        Args:
+            original_url: Full-resolution image URL stored in the gazetteer
+            width: Original image width
+            height: Original image height
+            variants: Output of thumbnail_variants()
+        """
+        entry = self.manifest.setdefault(original_url, {'thumbnails': {}})
+        entry['width'] = width
+        entry['height'] = height
+        for size, variant in variants.items():
+            known = entry['thumbnails'].get(size, {})
+            if known.get('url') != variant['url']:
+                known = {}
+            known.update(variant)
+            entry['thumbnails'][size] = known
+
+    def _missing_downloads(self) -> Dict[str, None]:
+        """Thumbnail URLs that have no file in the store yet."""
+        missing = {}
+        output_dir = os.path.dirname(self.images_dir.rstrip('/\\'))
+        for entry in self.manifest.values():
+            for variant in entry['thumbnails'].values():
+                path = variant.get('path')
+                if not path or not os.path.exists(os.path.join(output_dir, path)):
+                    missing[variant['url']] = None
+        return missing
+
+    def _download_one(self, session, url: str) -> Tuple[str, Optional[Dict], Optional[str]]:
+        """Download a single thumbnail into the store."""
+        try:
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            return url, None, str(e)
+
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        extension = _extension_for(url, response.headers.get('Content-Type', ''))
+        relative_path = f"{os.path.basename(self.images_dir.rstrip('/'))}/{digest[:2]}/{digest}{extension}"
+        absolute_path = os.path.join(self.images_dir, digest[:2], digest + extension)
+
+        # Identical bytes are stored once, whichever URL they came from
+        if not os.path.exists(absolute_path):
+            os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+            # Per-thread temporary name: another worker may be storing the same bytes
+            temp_path = f"{absolute_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, absolute_path)
+
+        return url, {'path': relative_path, 'sha256': digest, 'bytes': len(content)}, None
+
+    def download(self, workers: int = 4) -> Dict[str, int]:
+        """
+        Download every thumbnail that is not in the store yet.
+
+        Args:
+            workers: Number of concurrent downloads
+
+        Returns:
+            Dictionary with 'downloaded' and 'failed' counts
+        """
+        # requests is only needed when thumbnails are actually downloaded
+        import requests
+
+        missing = self._missing_downloads()
+        if not missing:
+            return {'downloaded': 0, 'failed': 0}
+
+        results = {}
+        failed = 0
+        with requests.Session() as session:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for url, stored, error in executor.map(lambda u: self._download_one(session, u), missing):
+                    if stored is None:
+                        failed += 1
+                        print(f"  ✗ Thumbnail download failed: {url} ({error})")
+                    else:
+                        results[url] = stored
+
+        for entry in self.manifest.values():
+            for variant in entry['thumbnails'].values():
+                if variant['url'] in results:
+                    variant.update(results[variant['url']])
+
+        return {'downloaded': len(results), 'failed': failed}
+
+    def save(self):
+        """Write the manifest next to the stored thumbnails."""
+        os.makedirs(self.images_dir, exist_ok=True)
+        # Unique temporary name: concurrent runs may save the same manifest
+        fd, temp_path = tempfile.mkstemp(prefix=f".{MANIFEST_NAME}.", suffix='.tmp', dir=self.images_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+            # Keep the permissions of the previous manifest
+            if os.path.exists(self.manifest_path):
+                shutil.copymode(self.manifest_path, temp_path)
+            os.replace(temp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+
+def load_thumbnail_index(manifest_path: str, width: int) -> Dict[str, str]:
+    """
+    Map original image URLs to the locally stored thumbnail closest to `width`.
+
+    Args:
+        manifest_path: Path to the ThumbnailStore manifest
+        width: Preferred thumbnail width
+
+    Returns:
+        Dictionary mapping original URL to a path relative to the output directory.
+        Images without a downloaded thumbnail are left out.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    index = {}
+    for original_url, entry in manifest.items():
+        stored = [(int(size), variant['path'])
+                  for size, variant in entry.get('thumbnails', {}).items() if variant.get('path')]
+        if stored:
+            # Closest width, preferring the larger one on ties
+            index[original_url] = min(stored, key=lambda item: (abs(item[0] - width), -item[0]))[1]
+    return index
@@ -0,0 +1,191 @@
+"""
+Local resolution of settlement names to wiki page titles.
+
+Instead of probing the wiki once per spelling guess, the full list of page
+titles in a namespace is downloaded once (500 titles per request) and cached.
+Settlement names are then matched against it locally:
+
+  1. exact title
+  2. folded title (diacritics, case and punctuation ignored)
+  3. the same with a trailing qualifier removed, e.g. "Waldenhof (Stirland)"
+  4. trigram similarity (Dice coefficient) for spelling variants
+
+Names that match nothing cost no requests at all.
+"""
+
+import json
+import math
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from text_normalize import fold_name, ngrams, strip_qualifier
+
+API_URL = "https://warhammerfantasy.fandom.com/api.php"
+
+TITLE_CACHE = "output/wiki_allpages.json"
+
+# Downloaded title lists are reused for this long
+TITLE_CACHE_MAX_AGE_DAYS = 7
+
+# Minimum trigram Dice similarity for a fuzzy match
+DEFAULT_THRESHOLD = 0.75
+
+
+def download_all_titles(session, namespace: int = 0) -> List[str]:
+    """
+    Download every page title in a wiki namespace with list=allpages.
+
+    Redirect pages are included, so common spelling variants kept as
+    redirects on the wiki also match.
+
+    Args:
+        session: requests.Session (or the requests module)
+        namespace: MediaWiki namespace number (0 = articles)
+
+    Returns:
+        List of page titles
+    """
+    titles = []
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'list': 'allpages',
+        'apnamespace': namespace,
+        'aplimit': 'max'
+    }
+
+    while True:
+        response = session.get(API_URL, params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        titles.extend(page['title'] for page in data.get('query', {}).get('allpages', []))
+
+        if 'continue' not in data:
+            break
+        params.update(data['continue'])
+
+    return titles
+
+
+class TitleIndex:
+    """Trigram index over wiki page titles for local name matching."""
+
+    def __init__(self, titles: Iterable[str], threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            titles: Wiki page titles
+            threshold: Minimum Dice similarity for fuzzy matches
+        """
+        self.threshold = threshold
+        self.titles: List[str] = list(dict.fromkeys(titles))
+        self.exact = set(self.titles)
+        self.folded: Dict[str, str] = {}
+        self.gram_sets: List[frozenset] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+
+        for title_id, title in enumerate(self.titles):
+            folded = fold_name(title)
+            self.folded.setdefault(folded, title)
+            grams = frozenset(ngrams(folded))
+            self.gram_sets.append(grams)
+            for gram in grams:
+                self.postings[gram].append(title_id)
+
+    def _fuzzy(self, folded: str) -> Optional[Tuple[str, float]]:
+        """Best trigram match for a folded name, or None if below threshold or ambiguous."""
+        grams = set(ngrams(folded))
+        if not grams:
+            return None
+
+        # Prefix filter: a title with Dice >= t shares at least t*|A|/(2-t)
+        # trigrams with the query, so it must contain one of the rarest
+        # |A| - that + 1 trigrams. Only those posting lists are scanned.
+        ordered = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))
+        min_overlap = math.ceil(self.threshold * len(grams) / (2 - self.threshold))
+        candidates = set()
+        for gram in ordered[:len(grams) - min_overlap + 1]:
+            candidates.update(self.postings.get(gram, ()))
+
+        scored = []
+        for title_id in candidates:
+            title_grams = self.gram_sets[title_id]
+            score = 2 * len(grams & title_grams) / (len(grams) + len(title_grams))
+            if score >= self.threshold:
+                scored.append((score, title_id))
+
+        if not scored:
+            return None
+        scored.sort(reverse=True)
+        best_score, best_id = scored[0]
+        if len(scored) > 1 and scored[1][0] == best_score:
+            # Two titles are equally close: do not guess
+            return None
+        return self.titles[best_id], best_score
+
+    def resolve(self, name: str) -> Optional[Tuple[str, float]]:
+        """
+        Find the wiki page title for a settlement name.
+
+        Args:
+            name: Settlement name as written in the gazetteer
+
+        Returns:
+            (title, score) with score 1.0 for exact and folded matches,
+            or None if no title is close enough
+        """
+        if name in self.exact:
+            return name, 1.0
+
+        variants = [name]
+        stripped = strip_qualifier(name)
+        if stripped and stripped != name:
+            variants.append(stripped)
+
+        for variant in variants:
+            folded = fold_name(variant)
+            if folded in self.folded:
+                return self.folded[folded], 1.0
+
+        for variant in variants:
+            match = self._fuzzy(fold_name(variant))
+            if match:
+                return match
+
+        return None
+
+    @classmethod
+    def load_or_download(cls, session, cache_file: str = TITLE_CACHE, namespace: int = 0,
+                         max_age_days: float = TITLE_CACHE_MAX_AGE_DAYS,
+                         threshold: float = DEFAULT_THRESHOLD) -> 'TitleIndex':
+        """
+        Build an index from the cached title list, downloading it if missing or old.
+
+        Args:
+            session: requests.Session used for the download
+            cache_file: JSON file holding the downloaded titles
+            namespace: MediaWiki namespace number
+            max_age_days: Age after which the title list is downloaded again
+            threshold: Minimum Dice similarity for fuzzy matches
+
+        Returns:
+            TitleIndex over every page title in the namespace
+        """
+        now = datetime.now(timezone.utc)
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                downloaded = datetime.fromisoformat(cached['downloaded'])
+                if cached.get('namespace') == namespace and now - downloaded <= timedelta(days=max_age_days):
+                    return cls(cached['titles'], threshold)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        titles = download_all_titles(session, namespace)
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump({'namespace': namespace, 'downloaded': now.isoformat(timespec='seconds'),
+                       'titles': titles}, f, ensure_ascii=False)
+        return cls(titles, threshold)